@@ -1,5 +1,6 @@
 from fastapi import APIRouter
-from .endpoints import receipt
+from .endpoints import analytics, receipt
 
 router = APIRouter()
 router.include_router(receipt.router, prefix="/receipt", tags=["Receipt OCR"])
+router.include_router(analytics.router, prefix="/analytics", tags=["Analytics"])
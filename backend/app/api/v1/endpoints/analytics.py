@@ -0,0 +1,67 @@
+from fastapi import APIRouter, Query, HTTPException, status
+import asyncio
+import logging
+from typing import Dict, Any, Optional
+from backend.app.services.store import ReceiptStore, get_receipt_writer
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+def get_store() -> ReceiptStore:
+    """Get the receipt store backing the aggregates"""
+    writer = get_receipt_writer()
+    if writer is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Receipt storage is disabled"
+        )
+    return writer.store
+
+@router.get("/spend/summary")
+async def spend_summary(
+    date_from: Optional[str] = Query(default=None, description="First day included (YYYY-MM-DD)"),
+    date_to: Optional[str] = Query(default=None, description="Last day included (YYYY-MM-DD)")
+) -> Dict[str, Any]:
+    """Total spend, tax and tax share over a date range"""
+    store = get_store()
+    summary = await asyncio.to_thread(store.spend_summary, date_from, date_to)
+    return {"success": True, "data": summary}
+
+@router.get("/spend")
+async def spend_by_period(
+    granularity: str = Query(default="day", description="Bucket size: day or month"),
+    date_from: Optional[str] = Query(default=None, description="First day included (YYYY-MM-DD)"),
+    date_to: Optional[str] = Query(default=None, description="Last day included (YYYY-MM-DD)")
+) -> Dict[str, Any]:
+    """
+    Spend per day or month, oldest first
+
+    Receipts are bucketed by their printed date, or by the day they were
+    stored when the date could not be read.
+    """
+    store = get_store()
+    try:
+        periods = await asyncio.to_thread(store.spend_by_period, granularity, date_from, date_to)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    return {"success": True, "granularity": granularity, "data": periods}
+
+@router.get("/merchants")
+async def spend_by_merchant(
+    date_from: Optional[str] = Query(default=None, description="First month included (YYYY-MM or YYYY-MM-DD)"),
+    date_to: Optional[str] = Query(default=None, description="Last month included (YYYY-MM or YYYY-MM-DD)"),
+    limit: int = Query(default=20, ge=1, le=500)
+) -> Dict[str, Any]:
+    """
+    Merchants ranked by spend
+
+    Merchant totals are kept per month, so the range covers whole months.
+    """
+    store = get_store()
+    merchants = await asyncio.to_thread(store.spend_by_merchant, date_from, date_to, limit)
+    return {"success": True, "data": merchants}
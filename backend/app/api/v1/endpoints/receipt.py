@@ -1,12 +1,42 @@
-from fastapi import APIRouter, File, UploadFile, HTTPException, status
-from fastapi.responses import JSONResponse
-import shutil
-import os
-import uuid
+from fastapi import APIRouter, File, Header, Query, Request, Response, UploadFile, HTTPException, status
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.requests import ClientDisconnect
+import asyncio
+import json
 import logging
-from typing import Dict, Any
-from backend.app.services.ocr import run_mistral_ocr
-from backend.app.services.parser import parse_receipt
+import time
+from email.utils import formatdate
+from typing import AsyncIterator, Dict, Any, List, Optional, Tuple
+from backend.app.services.cache import get_result_cache
+from backend.app.services.governor import get_governor
+from backend.app.services.jobs import JobQueueFullError, get_job_manager
+from backend.app.services.metrics import STAGE_SECONDS, UPLOAD_BYTES
+from backend.app.services.pdf import PDF_MIME_TYPE
+from backend.app.services.pipeline import (
+    REQUIRED_FIELDS,
+    ReceiptProcessingError,
+    admitted,
+    check_admission,
+    process_receipt,
+    request_deadline,
+    run_ocr_stage,
+    run_parse_stage,
+    within_deadline,
+)
+from backend.app.services.resumable import (
+    ChecksumMismatchError,
+    ResumableUpload,
+    UploadBusyError,
+    UploadNotFoundError,
+    UploadOffsetMismatchError,
+    get_resumable_store,
+    parse_checksum,
+    parse_upload_metadata,
+)
+from backend.app.services.singleflight import get_single_flight
+from backend.app.services.store import get_receipt_writer, get_stored_receipt, persist_receipt
+from backend.app.services.upload import ImageUpload, UnsupportedFileTypeError, UploadTooLargeError, read_upload
+from backend.app.services.admission import BATCH, INTERACTIVE, client_id, get_admission_controller
 from backend.app.core.settings import get_settings
 
 # Configure logging
@@ -14,17 +44,19 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
-settings = get_settings()
 
 def validate_file(file: UploadFile) -> None:
     """Validate uploaded file"""
+    settings = get_settings()
     if not file.filename:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="No filename provided"
         )
     
-    if not file.content_type or file.content_type not in settings.allowed_file_types_list:
+    # The actual type is sniffed from magic bytes in read_upload; the declared
+    # content type is only used to reject obvious non-images early
+    if file.content_type and not (file.content_type.startswith("image/") or file.content_type == PDF_MIME_TYPE):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"File type {file.content_type} not allowed. Allowed types: {settings.allowed_file_types}"
@@ -37,16 +69,62 @@ def validate_file(file: UploadFile) -> None:
             detail=f"File too large. Maximum size: {settings.max_file_size} bytes"
         )
 
-def create_safe_filename(original_filename: str) -> str:
-    """Create a safe filename with UUID"""
-    file_extension = os.path.splitext(original_filename)[1].lower()
-    safe_filename = f"{uuid.uuid4()}{file_extension}"
-    return safe_filename
+async def read_validated_upload(file: UploadFile) -> ImageUpload:
+    """Validate an uploaded file and read it into memory"""
+    validate_file(file)
+    settings = get_settings()
+    
+    # Read the upload into memory, enforcing the size limit per chunk
+    try:
+        with STAGE_SECONDS.time(stage="upload_read"):
+            upload = await read_upload(file, settings.max_file_size, settings.allowed_file_types_list)
+        UPLOAD_BYTES.observe(upload.size)
+        return upload
+    except UploadTooLargeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=str(e)
+        )
+    except UnsupportedFileTypeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+def request_client(request: Request) -> str:
+    """Client id the request is queued under for admission control"""
+    return client_id(request.headers, request.client.host if request.client else None)
+
+def build_receipt_response(upload: ImageUpload, structured_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Store the parsed receipt and wrap it in the standard response envelope"""
+    receipt_id = persist_receipt(upload.sha256, upload.filename, structured_data)
+    if structured_data.get("partial"):
+        message = "Receipt partially processed: the parser is unavailable, so fields may be missing"
+    else:
+        message = "Receipt processed successfully"
+    return {
+        "success": True,
+        "message": message,
+        "data": structured_data,
+        "metadata": {
+            "receipt_id": receipt_id,
+            "original_filename": upload.filename,
+            "content_type": upload.mime_type,
+            "size_bytes": upload.size,
+            "ocr_payload_bytes": upload.ocr_payload_size,
+            # Closest earlier upload of what looks like the same receipt
+            "probable_duplicate": (
+                {"content_hash": upload.duplicate_of.content_hash, "distance": upload.duplicate_of.distance}
+                if upload.duplicate_of else None
+            ),
+            "processed_at": "2024-01-01T00:00:00Z"  # You might want to add actual timestamp
+        }
+    }
 
 @router.post("/upload-receipt/")
-async def upload_receipt(file: UploadFile = File(...)) -> Dict[str, Any]:
+async def upload_receipt(request: Request, file: UploadFile = File(...)) -> Dict[str, Any]:
     """
-    Upload and process a receipt image using Mistral AI OCR
+    Upload and process a receipt image or PDF using Mistral AI OCR
     
     Returns:
         - merchant: str
@@ -55,110 +133,21 @@ async def upload_receipt(file: UploadFile = File(...)) -> Dict[str, Any]:
         - subtotal: float (optional)
         - tax: float (optional)
         - items: List[dict] with name and price
+    
+    Returns 503 (or 429 when this client already has too many receipts
+    waiting) with Retry-After if the server is too busy to finish in time.
     """
+    deadline = request_deadline()
     try:
-        # Validate the uploaded file
-        validate_file(file)
-        
-        # Ensure upload directory exists
-        os.makedirs(settings.upload_dir, exist_ok=True)
-        
-        # Create safe filename
-        safe_filename = create_safe_filename(file.filename)
-        file_path = os.path.join(settings.upload_dir, safe_filename)
-        
-        # Save uploaded file
-        try:
-            with open(file_path, "wb") as buffer:
-                content = await file.read()
-                
-                # Check actual file size
-                if len(content) > settings.max_file_size:
-                    raise HTTPException(
-                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
-                        detail=f"File too large. Maximum size: {settings.max_file_size} bytes"
-                    )
-                
-                buffer.write(content)
-                
-            logger.info(f"File saved: {file_path}")
-            
-        except Exception as e:
-            logger.error(f"Error saving file: {str(e)}")
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Failed to save uploaded file"
-            )
-        
-        # Process OCR
-        try:
-            logger.info("Starting OCR processing")
-            markdown_text = run_mistral_ocr(file_path)
-            
-            if not markdown_text or not markdown_text.strip():
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="Could not extract text from image. Please ensure the image is clear and contains a receipt."
-                )
-                
-        except Exception as e:
-            logger.error(f"OCR processing failed: {str(e)}")
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Failed to process image with OCR"
-            )
-        
-        # Parse receipt data
-        try:
-            logger.info("Starting receipt parsing")
-            structured_json_str = parse_receipt(markdown_text)
-            
-            # Try to parse the JSON response
-            import json
-            try:
-                structured_data = json.loads(structured_json_str)
-            except json.JSONDecodeError:
-                # If parsing fails, try to extract JSON from the response
-                import re
-                json_match = re.search(r'\{.*\}', structured_json_str, re.DOTALL)
-                if json_match:
-                    structured_data = json.loads(json_match.group())
-                else:
-                    raise ValueError("No valid JSON found in response")
-                    
-        except Exception as e:
-            logger.error(f"Receipt parsing failed: {str(e)}")
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Failed to parse receipt data"
-            )
-        
-        # Clean up temporary file
-        try:
-            os.remove(file_path)
-            logger.info(f"Cleaned up temporary file: {file_path}")
-        except Exception as e:
-            logger.warning(f"Failed to clean up temporary file: {str(e)}")
-        
-        # Validate required fields in response
-        required_fields = ["merchant", "date", "total"]
-        missing_fields = [field for field in required_fields if field not in structured_data]
-        
-        if missing_fields:
-            logger.warning(f"Missing required fields: {missing_fields}")
-            # Don't fail, but log the issue
+        upload = await read_validated_upload(file)
+        async with admitted(request_client(request), INTERACTIVE, deadline):
+            structured_data = await within_deadline(process_receipt(upload), deadline)
         
         # Return structured response
-        return {
-            "success": True,
-            "message": "Receipt processed successfully",
-            "data": structured_data,
-            "metadata": {
-                "original_filename": file.filename,
-                "processed_at": "2024-01-01T00:00:00Z"  # You might want to add actual timestamp
-            }
-        }
+        return build_receipt_response(upload, structured_data)
         
+    except ReceiptProcessingError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail, headers=e.headers)
     except HTTPException:
         # Re-raise HTTP exceptions
         raise
@@ -169,7 +158,473 @@ async def upload_receipt(file: UploadFile = File(...)) -> Dict[str, Any]:
             detail="An unexpected error occurred while processing the receipt"
         )
 
+def sse_event(event: str, data: Dict[str, Any]) -> bytes:
+    """Encode one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n".encode("utf-8")
+
+@router.post("/upload-receipt/stream/")
+async def upload_receipt_stream(request: Request, file: UploadFile = File(...)) -> StreamingResponse:
+    """
+    Upload and process a receipt, streaming progress as server-sent events
+    
+    Events, each with ``elapsed_ms`` since the upload was read:
+        - received: the upload was accepted (filename, content type, size)
+        - ocr_done: OCR finished; carries the markdown and ``ocr_ms``
+        - item: one line item, sent as soon as the LLM has written it
+          (not sent when the receipt is parsed locally or served from cache)
+        - parsed: the same payload as ``/upload-receipt/`` plus ``parse_ms``
+        - error: a stage failed (``status_code``, ``message``); the stream ends,
+          with a 504 if ``request_deadline_seconds`` ran out
+    
+    Validation errors, and 503/429 when the server is too busy, are returned
+    as normal HTTP errors before the stream starts.
+    """
+    deadline = request_deadline()
+    client = request_client(request)
+    try:
+        check_admission(client, INTERACTIVE, deadline)
+    except ReceiptProcessingError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail, headers=e.headers)
+    upload = await read_validated_upload(file)
+    started = time.perf_counter()
+    
+    def elapsed_ms(since: float) -> int:
+        return int((time.perf_counter() - since) * 1000)
+    
+    async def events() -> AsyncIterator[bytes]:
+        yield sse_event("received", {
+            "original_filename": upload.filename,
+            "content_type": upload.mime_type,
+            "size_bytes": upload.size,
+            "elapsed_ms": 0
+        })
+        try:
+            async with admitted(client, INTERACTIVE, deadline):
+                stage_started = time.perf_counter()
+                markdown_text = await within_deadline(run_ocr_stage(upload), deadline)
+                yield sse_event("ocr_done", {
+                    "markdown": markdown_text,
+                    "ocr_ms": elapsed_ms(stage_started),
+                    "elapsed_ms": elapsed_ms(started)
+                })
+                
+                # Relay line items while the LLM is still writing the rest of the reply
+                stage_started = time.perf_counter()
+                items: asyncio.Queue = asyncio.Queue()
+                parse_task = asyncio.ensure_future(
+                    within_deadline(run_parse_stage(markdown_text, on_item=items.put_nowait), deadline)
+                )
+                try:
+                    while not parse_task.done() or not items.empty():
+                        next_item = asyncio.ensure_future(items.get())
+                        done, _ = await asyncio.wait({next_item, parse_task}, return_when=asyncio.FIRST_COMPLETED)
+                        if next_item in done:
+                            yield sse_event("item", {"item": next_item.result(), "elapsed_ms": elapsed_ms(started)})
+                        else:
+                            next_item.cancel()
+                finally:
+                    parse_task.cancel()
+                structured_data = parse_task.result()
+            missing_fields = [field for field in REQUIRED_FIELDS if field not in structured_data]
+            if missing_fields:
+                logger.warning(f"Missing required fields: {missing_fields}")
+            yield sse_event("parsed", {
+                **build_receipt_response(upload, structured_data),
+                "parse_ms": elapsed_ms(stage_started),
+                "elapsed_ms": elapsed_ms(started)
+            })
+        except ReceiptProcessingError as e:
+            yield sse_event("error", {"status_code": e.status_code, "message": e.detail})
+        except Exception as e:
+            logger.error(f"Unexpected error in upload_receipt_stream: {str(e)}")
+            yield sse_event("error", {
+                "status_code": status.HTTP_500_INTERNAL_SERVER_ERROR,
+                "message": "An unexpected error occurred while processing the receipt"
+            })
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # Keep proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def _process_batch_item(
+    index: int, upload: ImageUpload, semaphore: asyncio.Semaphore, client: str
+) -> Dict[str, Any]:
+    """Process one batch entry, turning failures into an error line"""
+    async with semaphore:
+        try:
+            deadline = request_deadline()
+            async with admitted(client, BATCH, deadline):
+                structured_data = await within_deadline(process_receipt(upload), deadline)
+            return {"index": index, **build_receipt_response(upload, structured_data)}
+        except ReceiptProcessingError as e:
+            return _batch_error_line(index, upload.filename, e.status_code, e.detail)
+        except Exception as e:
+            logger.error(f"Unexpected error in batch item {index}: {str(e)}")
+            return _batch_error_line(
+                index, upload.filename, status.HTTP_500_INTERNAL_SERVER_ERROR,
+                "An unexpected error occurred while processing the receipt"
+            )
+
+def _batch_error_line(index: int, filename: Optional[str], status_code: int, detail: str) -> Dict[str, Any]:
+    return {
+        "index": index,
+        "success": False,
+        "status_code": status_code,
+        "message": detail,
+        "metadata": {"original_filename": filename}
+    }
+
+@router.post("/batch-upload/")
+async def batch_upload_receipts(request: Request, files: List[UploadFile] = File(...)) -> StreamingResponse:
+    """
+    Upload and process many receipt images in one request
+    
+    Receipts are processed concurrently (at most ``batch_concurrency`` at a
+    time) and each result is streamed back as one NDJSON line as soon as it
+    finishes, so lines arrive out of order; use ``index`` to match them to
+    the uploaded files. A failing receipt yields an error line instead of
+    failing the batch. Batch receipts yield to interactive uploads, and one
+    the server is too busy to finish in time gets a 503 error line.
+    """
+    settings = get_settings()
+    if len(files) > settings.batch_max_files:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Too many files. Maximum per batch: {settings.batch_max_files}"
+        )
+    
+    # Uploads are closed once this handler returns, so read them all up front
+    uploads: List[Tuple[int, ImageUpload]] = []
+    rejected: List[Dict[str, Any]] = []
+    for index, file in enumerate(files):
+        try:
+            uploads.append((index, await read_validated_upload(file)))
+        except HTTPException as e:
+            rejected.append(_batch_error_line(index, file.filename, e.status_code, e.detail))
+    
+    semaphore = asyncio.Semaphore(settings.batch_concurrency)
+    client = request_client(request)
+    
+    async def results() -> AsyncIterator[bytes]:
+        for line in rejected:
+            yield (json.dumps(line) + "\n").encode("utf-8")
+        
+        tasks = [
+            asyncio.create_task(_process_batch_item(index, upload, semaphore, client))
+            for index, upload in uploads
+        ]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield (json.dumps(await next_done) + "\n").encode("utf-8")
+        finally:
+            # Stop outstanding work if the client goes away mid-stream
+            for task in tasks:
+                task.cancel()
+    
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
 @router.get("/health")
 async def receipt_health_check():
     """Health check for receipt processing service"""
-    return {"status": "healthy", "service": "receipt_processing"}
+    cache = get_result_cache()
+    admission = get_admission_controller()
+    return {
+        "status": "healthy",
+        "service": "receipt_processing",
+        "cache": cache.stats() if cache else None,
+        "admission": admission.stats() if admission else None,
+        "upstream": get_governor().stats(),
+        "single_flight": get_single_flight().stats()
+    }
+
+
+@router.post("/jobs/", status_code=status.HTTP_202_ACCEPTED)
+async def submit_receipt_job(request: Request, file: UploadFile = File(...)) -> Dict[str, Any]:
+    """
+    Queue a receipt for background processing
+    
+    Returns immediately with a job ID; poll ``GET /receipt/{job_id}`` for
+    the result instead of holding the connection open during OCR.
+    """
+    upload = await read_validated_upload(file)
+    try:
+        job_id = await get_job_manager().submit(upload, request_client(request))
+    except JobQueueFullError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={"Retry-After": "30"}
+        )
+    
+    logger.info(f"Queued receipt job {job_id}")
+    return {
+        "success": True,
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": str(request.url_for("get_receipt_job", job_id=job_id))
+    }
+
+# tus protocol version the resumable upload endpoints follow
+TUS_VERSION = "1.0.0"
+# tus checksum extension status for a chunk that fails its Upload-Checksum
+HTTP_460_CHECKSUM_MISMATCH = 460
+
+def _resumable_headers(upload: ResumableUpload) -> Dict[str, str]:
+    headers = {
+        "Tus-Resumable": TUS_VERSION,
+        "Upload-Offset": str(upload.offset),
+        "Upload-Length": str(upload.length),
+        "Upload-Expires": formatdate(upload.expires_at, usegmt=True),
+        "Cache-Control": "no-store"
+    }
+    if upload.job_id:
+        headers["Receipt-Job-Id"] = upload.job_id
+    return headers
+
+@router.post("/uploads/", status_code=status.HTTP_201_CREATED)
+async def create_resumable_upload(
+    request: Request,
+    upload_length: Optional[str] = Header(default=None),
+    upload_metadata: Optional[str] = Header(default=None)
+) -> Response:
+    """
+    Start a resumable upload for slow or unreliable connections
+    
+    Send the file size in ``Upload-Length`` and optionally ``Upload-Metadata``
+    (tus format, base64 values): ``filename`` and ``sha256`` (hex digest of
+    the whole file, checked once it is complete). Then PATCH the bytes to
+    the returned ``Location``.
+    """
+    try:
+        length = int(upload_length or "")
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Upload-Length header must be the file size in bytes"
+        )
+    
+    try:
+        metadata = parse_upload_metadata(upload_metadata)
+        upload = await asyncio.to_thread(
+            get_resumable_store().create, length, metadata.get("filename", ""), metadata.get("sha256")
+        )
+    except UploadTooLargeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=str(e)
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    
+    location = str(request.url_for("append_resumable_upload", upload_id=upload.id))
+    return Response(
+        status_code=status.HTTP_201_CREATED,
+        headers={**_resumable_headers(upload), "Location": location}
+    )
+
+@router.head("/uploads/{upload_id}")
+async def get_resumable_upload(upload_id: str) -> Response:
+    """Current ``Upload-Offset`` of a resumable upload, to resume after a dropped connection"""
+    try:
+        upload = await asyncio.to_thread(get_resumable_store().status, upload_id)
+    except UploadNotFoundError as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=str(e)
+        )
+    return Response(status_code=status.HTTP_200_OK, headers=_resumable_headers(upload))
+
+async def _submit_resumable_upload(upload_id: str, client: str) -> ResumableUpload:
+    """Queue a finished resumable upload for processing on behalf of ``client``"""
+    store = get_resumable_store()
+    upload = await store.assemble(upload_id)
+    UPLOAD_BYTES.observe(upload.size)
+    try:
+        job_id = await get_job_manager().submit(upload, client)
+    except JobQueueFullError as e:
+        # The upload stays complete; repeating the last PATCH retries the submission
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={"Retry-After": "30"}
+        )
+    logger.info(f"Resumable upload {upload_id} complete, queued receipt job {job_id}")
+    return await store.mark_processing(upload_id, job_id)
+
+@router.patch("/uploads/{upload_id}")
+async def append_resumable_upload(
+    request: Request,
+    upload_id: str,
+    upload_offset: Optional[str] = Header(default=None),
+    upload_checksum: Optional[str] = Header(default=None),
+    content_type: Optional[str] = Header(default=None)
+) -> Response:
+    """
+    Append a chunk to a resumable upload
+    
+    The body (``Content-Type: application/offset+octet-stream``) is written
+    at ``Upload-Offset``, which must be the upload's current offset (409
+    otherwise; HEAD the upload to find it). Bytes received before a dropped
+    connection are kept unless the chunk carries an ``Upload-Checksum``
+    (``sha256 <base64 digest>``), in which case it is accepted whole or not
+    at all (460 on mismatch).
+    
+    Once the last byte lands the receipt is queued for processing straight
+    away and the response carries ``Receipt-Job-Id``; poll
+    ``GET /receipt/{job_id}`` for the result.
+    """
+    if content_type != "application/offset+octet-stream":
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Content-Type must be application/offset+octet-stream"
+        )
+    try:
+        offset = int(upload_offset or "")
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Upload-Offset header must be the current offset in bytes"
+        )
+    try:
+        checksum = parse_checksum(upload_checksum)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    
+    try:
+        upload = await get_resumable_store().append(upload_id, offset, request.stream(), checksum)
+        if upload.complete and upload.job_id is None:
+            upload = await _submit_resumable_upload(upload_id, request_client(request))
+    except UploadNotFoundError as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=str(e)
+        )
+    except UploadOffsetMismatchError as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(e),
+            headers={"Tus-Resumable": TUS_VERSION, "Upload-Offset": str(e.offset)}
+        )
+    except UploadBusyError as e:
+        raise HTTPException(
+            status_code=status.HTTP_423_LOCKED,
+            detail=str(e)
+        )
+    except UploadTooLargeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=str(e)
+        )
+    except UnsupportedFileTypeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except ChecksumMismatchError as e:
+        raise HTTPException(
+            status_code=HTTP_460_CHECKSUM_MISMATCH,
+            detail=str(e)
+        )
+    except ClientDisconnect:
+        # What arrived is kept; the client resumes from HEAD
+        logger.info(f"Client disconnected during resumable upload {upload_id}")
+        return Response(status_code=status.HTTP_400_BAD_REQUEST)
+    
+    return Response(status_code=status.HTTP_204_NO_CONTENT, headers=_resumable_headers(upload))
+
+@router.get("/receipts/")
+async def list_receipts(
+    cursor: Optional[str] = Query(default=None, description="Cursor from the previous page's next_cursor"),
+    limit: int = Query(default=50, ge=1, le=500),
+    merchant: Optional[str] = Query(default=None, description="Exact merchant name (case-insensitive)"),
+    date_from: Optional[str] = Query(default=None, description="Earliest receipt date (YYYY-MM-DD)"),
+    date_to: Optional[str] = Query(default=None, description="Latest receipt date (YYYY-MM-DD)"),
+    min_total: Optional[float] = Query(default=None),
+    max_total: Optional[float] = Query(default=None),
+    content_hash: Optional[str] = Query(default=None, description="SHA-256 of the uploaded image")
+) -> Dict[str, Any]:
+    """
+    List stored receipts, newest first
+    
+    Pages are cursor-based: pass ``next_cursor`` back as ``cursor`` to get
+    the next page. Receipts appear here once their batched write lands
+    (within ``store_flush_interval``).
+    """
+    writer = get_receipt_writer()
+    if writer is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Receipt storage is disabled"
+        )
+    
+    try:
+        receipts, next_cursor = await asyncio.to_thread(
+            writer.store.list, limit, cursor, merchant, date_from, date_to, min_total, max_total, content_hash
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    
+    return {
+        "success": True,
+        "data": receipts,
+        "next_cursor": next_cursor
+    }
+
+@router.get("/receipts/{receipt_id}")
+async def get_receipt(receipt_id: str) -> Dict[str, Any]:
+    """Get one stored receipt with its full parsed data"""
+    receipt = await get_stored_receipt(receipt_id)
+    if receipt is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Receipt not found"
+        )
+    
+    return {
+        "success": True,
+        "data": receipt
+    }
+
+# Keep this route last: its path parameter would otherwise shadow the GET routes above
+@router.get("/{job_id}")
+async def get_receipt_job(
+    job_id: str,
+    wait: float = Query(default=0.0, ge=0.0, description="Seconds to long-poll for completion")
+) -> Dict[str, Any]:
+    """
+    Get the status of a receipt job, and its result once finished
+    
+    With ``wait`` > 0 the request is held until the job finishes or the wait
+    (capped by ``job_max_wait_seconds``) elapses.
+    """
+    job = await get_job_manager().get(job_id, wait=min(wait, get_settings().job_max_wait_seconds))
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Receipt job not found"
+        )
+    
+    return {
+        "success": job["status"] != "failed",
+        "job_id": job["id"],
+        "status": job["status"],
+        "data": job["result"],
+        "error": job["error"],
+        "metadata": {
+            "original_filename": job["filename"],
+            "created_at": job["created_at"],
+            "updated_at": job["updated_at"]
+        }
+    }
@@ -13,11 +13,120 @@ class Settings(BaseSettings):
     
     # File Upload Configuration
     max_file_size: int = Field(default=10 * 1024 * 1024, description="Max file size in bytes (10MB)")
-    allowed_file_types: str = Field(default="image/jpeg,image/png,image/webp", description="Allowed MIME types")
+    allowed_file_types: str = Field(default="image/jpeg,image/png,image/webp,application/pdf", description="Allowed MIME types")
     upload_dir: str = Field(default="receipts/temp", description="Upload directory")
     
+    # Batch Upload Configuration
+    batch_max_files: int = Field(default=20, description="Max files accepted by one batch upload")
+    batch_concurrency: int = Field(default=4, description="Receipts processed concurrently per batch")
+    
+    # Resumable Upload Configuration
+    resumable_upload_dir: str = Field(default="receipts/uploads", description="Spool directory for resumable uploads in progress")
+    resumable_upload_ttl_seconds: float = Field(default=24 * 3600, description="Seconds a resumable upload is kept before it expires")
+    
+    # Admission Control Configuration
+    admission_enabled: bool = Field(default=True, description="Queue receipts per client and shed load that cannot finish in time")
+    admission_max_concurrency: int = Field(default=16, description="Receipts processed at once per worker; more wait in per-client queues")
+    admission_client_queue_size: int = Field(default=10, description="Receipts one client may have waiting before it gets 429s")
+    admission_interactive_weight: float = Field(default=8.0, description="Fair-queuing weight of interactive uploads")
+    admission_batch_weight: float = Field(default=1.0, description="Fair-queuing weight of batch uploads and background jobs")
+    
+    # Background Job Configuration
+    jobs_db_path: str = Field(default="database/jobs.db", description="SQLite database for receipt jobs")
+    job_workers: int = Field(default=4, description="Background workers processing receipt jobs")
+    job_max_pending: int = Field(default=1000, description="Max queued or running jobs before submissions are refused")
+    job_max_wait_seconds: float = Field(default=30.0, description="Longest allowed long-poll wait on a job")
+    job_stale_seconds: float = Field(default=300.0, description="Running jobs idle this long are re-queued on startup")
+    
     # API Rate Limiting
     rate_limit_requests: int = Field(default=100, description="Requests per minute")
+    rate_limit_burst: int = Field(default=10, description="Upstream requests allowed in a burst above the steady rate")
+    
+    # Upstream Governor Configuration
+    upstream_initial_concurrency: int = Field(default=8, description="Starting in-flight limit for upstream calls")
+    upstream_min_concurrency: int = Field(default=1, description="Floor for the adaptive in-flight limit")
+    upstream_max_concurrency: int = Field(default=64, description="Ceiling for the adaptive in-flight limit")
+    upstream_max_retries: int = Field(default=4, description="Retries on 429/5xx before giving up")
+    upstream_backoff_base: float = Field(default=0.5, description="Base delay in seconds for jittered backoff")
+    upstream_backoff_max: float = Field(default=8.0, description="Max backoff delay in seconds")
+    upstream_latency_spike_factor: float = Field(default=2.5, description="Latency above this multiple of the average shrinks the limit")
+    upstream_deadline_seconds: float = Field(default=60.0, description="Deadline for one upstream call including retries")
+    
+    # Deadline and Hedging Configuration
+    request_deadline_seconds: float = Field(default=90.0, description="End-to-end deadline for processing one receipt")
+    upstream_hedge_enabled: bool = Field(default=False, description="Send a duplicate upstream call when the first one runs slow")
+    upstream_hedge_percentile: float = Field(default=95.0, description="Latency percentile after which a call is hedged")
+    upstream_hedge_budget: float = Field(default=0.05, description="Max share of upstream calls that may be hedged")
+    upstream_hedge_min_samples: int = Field(default=20, description="Latency samples needed before hedging an operation")
+    
+    # Circuit Breaker Configuration
+    breaker_enabled: bool = Field(default=True, description="Stop calling OCR or parse while they keep failing")
+    breaker_window_seconds: float = Field(default=30.0, description="Rolling window of call outcomes the failure rate is taken over")
+    breaker_min_calls: int = Field(default=10, description="Calls needed in the window before the breaker can open")
+    breaker_failure_rate: float = Field(default=0.5, description="Share of failed or slow calls that opens the breaker")
+    breaker_slow_call_seconds: float = Field(default=20.0, description="Calls slower than this count as failures")
+    breaker_open_seconds: float = Field(default=15.0, description="Seconds the breaker stays open before probing")
+    breaker_half_open_calls: int = Field(default=2, description="Successful probe calls needed to close the breaker")
+    breaker_degraded_results: bool = Field(default=True, description="Return a partial result instead of failing while the parse breaker is open")
+    
+    # Upstream HTTP Client Configuration
+    mistral_api_base: str = Field(default="https://api.mistral.ai", description="Mistral API base URL")
+    http_max_connections: int = Field(default=100, description="Max pooled connections to the Mistral API")
+    http_max_keepalive_connections: int = Field(default=20, description="Max idle keep-alive connections kept in the pool")
+    http_keepalive_expiry: float = Field(default=30.0, description="Seconds an idle pooled connection is kept open")
+    http_connect_timeout: float = Field(default=10.0, description="Upstream connect timeout in seconds")
+    http_read_timeout: float = Field(default=30.0, description="Upstream read timeout in seconds")
+    http_enable_http2: bool = Field(default=False, description="Use HTTP/2 for upstream calls (requires the h2 package)")
+    
+    # Image Preprocessing Configuration
+    preprocess_enabled: bool = Field(default=True, description="Shrink images before OCR (requires Pillow)")
+    preprocess_max_dimension: int = Field(default=2000, description="Longest image side in pixels after downscaling")
+    preprocess_jpeg_quality: int = Field(default=80, description="JPEG quality used when re-encoding")
+    preprocess_grayscale: bool = Field(default=True, description="Convert images to grayscale")
+    preprocess_autocrop: bool = Field(default=True, description="Crop images to the detected receipt area")
+    preprocess_workers: int = Field(default=2, description="Worker processes for image preprocessing")
+    
+    # PDF Configuration
+    pdf_max_pages: int = Field(default=50, description="Max pages accepted in one PDF")
+    pdf_page_concurrency: int = Field(default=8, description="Pages of one PDF OCR'd or parsed concurrently")
+    
+    # LLM Parser Configuration
+    parse_max_tokens: int = Field(default=512, description="Token cap for each parse completion")
+    parse_max_continuations: int = Field(default=2, description="Follow-up completions when a parse reply is truncated")
+    parse_chunk_lines: int = Field(default=25, description="Item lines per parse request for long receipts (0 disables chunking)")
+    parse_chunk_overlap: int = Field(default=2, description="Item lines repeated between consecutive parse chunks")
+    parse_chunk_concurrency: int = Field(default=8, description="Chunks of one receipt parsed concurrently")
+    
+    # Local Parser Configuration
+    local_parser_enabled: bool = Field(default=True, description="Try the rule-based parser before calling the LLM")
+    local_parser_min_confidence: float = Field(default=0.9, description="Min local parse confidence to skip the LLM")
+    
+    # Near-Duplicate Detection Configuration
+    near_duplicate_enabled: bool = Field(default=True, description="Perceptually hash image uploads to spot retakes of the same receipt (requires Pillow)")
+    near_duplicate_reuse_distance: int = Field(default=-1, description="Max dHash bit difference at which an earlier image's OCR result is reused (-1 never reuses; edited amounts can be a few bits apart)")
+    near_duplicate_flag_distance: int = Field(default=10, description="Max dHash bit difference at which an upload is flagged as a probable duplicate")
+    near_duplicate_max_entries: int = Field(default=100000, description="Image hashes kept in the near-duplicate index")
+    
+    # Result Cache Configuration
+    cache_enabled: bool = Field(default=True, description="Cache OCR and parse results by content hash")
+    cache_max_entries: int = Field(default=1024, description="Max entries in the in-memory LRU tier")
+    cache_ttl_seconds: float = Field(default=7 * 24 * 3600, description="Cache entry time-to-live in seconds")
+    cache_dir: str = Field(default="", description="On-disk cache directory (empty disables the disk tier)")
+    cache_max_disk_bytes: int = Field(default=256 * 1024 * 1024, description="Max total size of the disk tier in bytes")
+    cache_disk_sweep_seconds: float = Field(default=3600, description="Seconds between full scans of the disk tier for expired entries and other workers' writes")
+    cache_shared_max_entries: int = Field(default=10000, description="Max entries in the cross-worker cache tier")
+    
+    # Receipt Store Configuration
+    store_enabled: bool = Field(default=True, description="Persist parsed receipts to the receipt store")
+    receipts_db_path: str = Field(default="database/receipts.db", description="SQLite database for stored receipts")
+    store_batch_size: int = Field(default=100, description="Receipts buffered before a write is forced")
+    store_flush_interval: float = Field(default=0.2, description="Max seconds a receipt waits before being written")
+    
+    # Multi-Worker Coordination Configuration
+    coordinator_db_path: str = Field(default="", description="SQLite file shared by worker processes (empty keeps all state per process)")
+    coordinator_poll_interval: float = Field(default=0.05, description="Seconds between checks while waiting on another worker")
+    coordinator_claim_ttl: float = Field(default=120.0, description="Seconds a worker's claim on an OCR or parse call lasts")
+    upstream_global_concurrency: int = Field(default=16, description="Max upstream calls in flight across all workers")
     
     # CORS Configuration
     cors_origins: str = Field(
@@ -0,0 +1,278 @@
+"""
+Admission control with per-client weighted fair queuing
+
+At most ``admission_max_concurrency`` receipts are processed at once per
+worker. Further requests wait in per-client queues, one flow per client and
+priority class, and are let through in weighted fair queuing order: each
+waiter gets a virtual finish tag of ``max(virtual time, flow's last tag) +
+1 / weight``, and the smallest tag goes next. A bulk importer with a long
+queue therefore only delays its own requests, and interactive uploads,
+weighted more heavily, overtake batch work without starving it.
+
+Before queuing, the wait is estimated from the work ahead in fair-queue
+order and the recent slot hold time. A request that could not finish
+before its deadline is refused at once, with a Retry-After, instead of
+being accepted and timing out later.
+"""
+import asyncio
+import hashlib
+import heapq
+import itertools
+import logging
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Mapping, Optional, Tuple
+
+from backend.app.core.settings import get_settings
+from backend.app.services.deadline import DeadlineExceededError
+from backend.app.services.metrics import ADMISSION_DECISIONS, ADMISSION_WAIT_SECONDS
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Priority classes
+INTERACTIVE = "interactive"
+BATCH = "batch"
+
+# Client id for background jobs whose submitter was not recorded
+BACKGROUND_CLIENT = "background"
+
+# Weight given to recent slot hold times in the service time estimate
+_SERVICE_TIME_ALPHA = 0.2
+
+
+class AdmissionRejectedError(Exception):
+    """A request was refused admission; the client should retry after ``retry_after`` seconds"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class OverloadedError(AdmissionRejectedError):
+    """The estimated queue wait leaves no time to process the request before its deadline"""
+
+
+class ClientQueueFullError(AdmissionRejectedError):
+    """The client already has as many requests waiting as its queue holds"""
+
+
+def client_id(headers: Mapping[str, str], host: Optional[str] = None) -> str:
+    """
+    Identify the client a request is queued for
+
+    The API key (``X-API-Key`` or a bearer token) is used if there is one,
+    hashed so it never appears in logs, then the Origin, then the peer address.
+    """
+    api_key = headers.get("x-api-key")
+    authorization = headers.get("authorization", "")
+    if not api_key and authorization.lower().startswith("bearer "):
+        api_key = authorization[len("bearer "):].strip()
+    if api_key:
+        return "key:" + hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+    origin = headers.get("origin")
+    if origin:
+        return "origin:" + origin
+    return "ip:" + (host or "unknown")
+
+
+class _Waiter:
+    __slots__ = ("flow", "future", "abandoned")
+
+    def __init__(self, flow: Tuple[str, str], future: "asyncio.Future[None]"):
+        self.flow = flow
+        self.future = future
+        self.abandoned = False
+
+
+class AdmissionController:
+    """Concurrency slots handed out in weighted fair order across client flows"""
+
+    def __init__(self, max_concurrency: int, client_queue_size: int, weights: Dict[str, float]):
+        self.capacity = max(1, max_concurrency)
+        self.client_queue_size = max(0, client_queue_size)
+        self.weights = weights
+        self._in_use = 0
+        self._heap: List[Tuple[float, int, _Waiter]] = []
+        self._seq = itertools.count()
+        self._virtual_time = 0.0
+        # Finish tag of the last queued request, and the number waiting, per flow
+        self._last_finish: Dict[Tuple[str, str], float] = {}
+        self._flow_queued: Dict[Tuple[str, str], int] = {}
+        self._client_queued: Dict[str, int] = {}
+        self._queued = 0
+        # Moving average of how long a slot is held, once any has been released
+        self._service_time: Optional[float] = None
+        self._stats = {"admitted": 0, "queued": 0, "shed": 0, "client_queue_full": 0}
+
+    def _tag(self, flow: Tuple[str, str]) -> float:
+        start = max(self._virtual_time, self._last_finish.get(flow, 0.0))
+        return start + 1.0 / self.weights.get(flow[1], 1.0)
+
+    def estimated_wait(self, client: str, priority: str) -> float:
+        """Seconds a request from ``client`` arriving now would wait for a slot"""
+        if self._in_use < self.capacity and not self._queued:
+            return 0.0
+        if self._service_time is None:
+            return 0.0
+        tag = self._tag((client, priority))
+        ahead = sum(1 for queued_tag, _, waiter in self._heap if queued_tag <= tag and not waiter.abandoned)
+        return (ahead + 1) * self._service_time / self.capacity
+
+    def check(self, client: str, priority: str, deadline: float) -> None:
+        """
+        Refuse a request that could not be admitted and processed in time
+
+        Raises:
+            ClientQueueFullError: If the client's queue is full
+            OverloadedError: If the estimated wait plus processing time runs past ``deadline``
+        """
+        if self._in_use < self.capacity and not self._queued:
+            return
+        wait = self.estimated_wait(client, priority)
+        retry_after = max(1.0, math.ceil(wait))
+        if self._client_queued.get(client, 0) >= self.client_queue_size:
+            self._reject("client_queue_full", priority)
+            raise ClientQueueFullError("Too many receipts from this client are already waiting", retry_after)
+        if wait + (self._service_time or 0.0) > deadline - time.monotonic():
+            self._reject("shed", priority)
+            raise OverloadedError("Server is too busy to process this receipt in time. Please try again later.", retry_after)
+
+    def _reject(self, outcome: str, priority: str) -> None:
+        self._stats[outcome] += 1
+        ADMISSION_DECISIONS.inc(priority=priority, outcome=outcome)
+
+    async def acquire(self, client: str, priority: str, deadline: Optional[float]) -> float:
+        """
+        Wait for a processing slot; pair with ``release``
+
+        Args:
+            client: Client id from ``client_id``
+            priority: INTERACTIVE or BATCH
+            deadline: Absolute time.monotonic() deadline of the request, or None
+                for work that was already accepted (background jobs), which
+                waits as long as it takes and is neither bounded nor shed
+
+        Returns:
+            The time the slot was granted, to pass to ``release``
+
+        Raises:
+            ClientQueueFullError: If the client's queue is full
+            OverloadedError: If the request could not finish before ``deadline``
+            DeadlineExceededError: If ``deadline`` passes while waiting
+        """
+        if self._in_use < self.capacity and not self._queued:
+            self._in_use += 1
+            self._stats["admitted"] += 1
+            ADMISSION_DECISIONS.inc(priority=priority, outcome="admitted")
+            return time.monotonic()
+        if deadline is not None:
+            self.check(client, priority, deadline)
+
+        flow = (client, priority)
+        tag = self._tag(flow)
+        waiter = _Waiter(flow, asyncio.get_running_loop().create_future())
+        self._last_finish[flow] = tag
+        self._flow_queued[flow] = self._flow_queued.get(flow, 0) + 1
+        self._client_queued[client] = self._client_queued.get(client, 0) + 1
+        self._queued += 1
+        heapq.heappush(self._heap, (tag, next(self._seq), waiter))
+        self._stats["queued"] += 1
+        ADMISSION_DECISIONS.inc(priority=priority, outcome="queued")
+
+        queued_at = time.monotonic()
+        try:
+            timeout = None if deadline is None else max(0.0, deadline - queued_at)
+            await asyncio.wait_for(waiter.future, timeout=timeout)
+        except asyncio.TimeoutError:
+            self._abandon(waiter)
+            raise DeadlineExceededError("Request deadline exceeded while queued for admission")
+        except BaseException:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Granted just as the caller gave up: hand the slot on
+                self.release(None)
+            else:
+                self._abandon(waiter)
+            raise
+        granted_at = time.monotonic()
+        ADMISSION_WAIT_SECONDS.observe(granted_at - queued_at, priority=priority)
+        return granted_at
+
+    def release(self, granted_at: Optional[float]) -> None:
+        """Return a slot taken by ``acquire`` and admit the next waiter in fair order"""
+        self._in_use -= 1
+        if granted_at is not None:
+            held = time.monotonic() - granted_at
+            if self._service_time is None:
+                self._service_time = held
+            else:
+                self._service_time += _SERVICE_TIME_ALPHA * (held - self._service_time)
+        self._dispatch()
+
+    def _abandon(self, waiter: _Waiter) -> None:
+        waiter.abandoned = True
+        self._dequeued(waiter.flow)
+
+    def _dequeued(self, flow: Tuple[str, str]) -> None:
+        client = flow[0]
+        self._queued -= 1
+        self._flow_queued[flow] -= 1
+        if not self._flow_queued[flow]:
+            del self._flow_queued[flow]
+        self._client_queued[client] -= 1
+        if not self._client_queued[client]:
+            del self._client_queued[client]
+
+    def _dispatch(self) -> None:
+        while self._in_use < self.capacity and self._heap:
+            tag, _, waiter = heapq.heappop(self._heap)
+            if waiter.abandoned:
+                continue
+            self._virtual_time = tag
+            self._dequeued(waiter.flow)
+            if waiter.flow not in self._flow_queued:
+                # An idle flow's next tag starts from the virtual time anyway
+                self._last_finish.pop(waiter.flow, None)
+            self._in_use += 1
+            waiter.future.set_result(None)
+        if not self._heap:
+            self._last_finish.clear()
+
+    @asynccontextmanager
+    async def slot(self, client: str, priority: str, deadline: Optional[float]) -> AsyncIterator[None]:
+        """Hold a processing slot for the duration of the block (see ``acquire``)"""
+        granted_at = await self.acquire(client, priority, deadline)
+        try:
+            yield
+        finally:
+            self.release(granted_at)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_use": self._in_use,
+            "capacity": self.capacity,
+            "waiting": self._queued,
+            "waiting_clients": len(self._client_queued),
+            "service_time": round(self._service_time, 3) if self._service_time is not None else None,
+            **self._stats,
+        }
+
+
+# Global controller instance
+_controller: Optional[AdmissionController] = None
+
+
+def get_admission_controller() -> Optional[AdmissionController]:
+    """Get the admission controller singleton, or None when admission control is disabled"""
+    global _controller
+    settings = get_settings()
+    if not settings.admission_enabled:
+        return None
+    if _controller is None:
+        _controller = AdmissionController(
+            settings.admission_max_concurrency,
+            client_queue_size=settings.admission_client_queue_size,
+            weights={INTERACTIVE: settings.admission_interactive_weight, BATCH: settings.admission_batch_weight},
+        )
+    return _controller
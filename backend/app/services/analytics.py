@@ -0,0 +1,215 @@
+"""
+Materialized spend aggregates over stored receipts
+
+Daily, monthly and merchant-by-month totals are kept in their own tables and
+updated in the same transaction that inserts the receipts, so dashboard
+queries read a handful of pre-summed rows through the primary key instead of
+scanning receipts.
+
+Usage (backfill after importing receipts or changing the bucketing rules):
+    python -m backend.app.services.analytics --rebuild
+"""
+import argparse
+import logging
+import sqlite3
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+UNKNOWN_MERCHANT = "Unknown"
+
+GRANULARITIES = {"day": "spend_daily", "month": "spend_monthly"}
+
+
+def spend_day(date: Optional[str], created_at: float) -> str:
+    """Bucket day for a receipt: its printed date if valid, else the day it was stored"""
+    if date:
+        try:
+            return datetime.strptime(date[:10], "%Y-%m-%d").strftime("%Y-%m-%d")
+        except ValueError:
+            pass
+    return datetime.fromtimestamp(created_at, tz=timezone.utc).strftime("%Y-%m-%d")
+
+
+@dataclass
+class SpendTotals:
+    receipt_count: int = 0
+    total: float = 0.0
+    tax: float = 0.0
+
+
+class SpendDeltas:
+    """Per-bucket increments for a batch of receipts, applied with one upsert per table"""
+
+    def __init__(self):
+        self.daily: Dict[str, SpendTotals] = defaultdict(SpendTotals)
+        self.monthly: Dict[str, SpendTotals] = defaultdict(SpendTotals)
+        self.merchant_monthly: Dict[Tuple[str, str], SpendTotals] = defaultdict(SpendTotals)
+        # Merchants are bucketed case-insensitively; keep the first spelling seen for display
+        self._merchant_names: Dict[str, str] = {}
+        self._removed = False
+
+    def add(self, merchant: Optional[str], date: Optional[str], created_at: float,
+            total: Optional[float], tax: Optional[float], sign: int = 1) -> None:
+        """Count a receipt in its buckets, or with ``sign=-1`` take a stored one back out"""
+        day = spend_day(date, created_at)
+        month = day[:7]
+        merchant = (merchant or "").strip() or UNKNOWN_MERCHANT
+        for totals in (self.daily[day], self.monthly[month], self.merchant_monthly[(merchant.lower(), month)]):
+            totals.receipt_count += sign
+            totals.total += sign * (total or 0.0)
+            totals.tax += sign * (tax or 0.0)
+        self._merchant_names.setdefault(merchant.lower(), merchant)
+
+    def remove(self, merchant: Optional[str], date: Optional[str], created_at: float,
+               total: Optional[float], tax: Optional[float]) -> None:
+        self.add(merchant, date, created_at, total, tax, sign=-1)
+        self._removed = True
+
+    def apply(self, conn: sqlite3.Connection) -> None:
+        """Add the increments to the aggregate tables (caller owns the transaction)"""
+        for table, key, buckets in (("spend_daily", "day", self.daily), ("spend_monthly", "month", self.monthly)):
+            conn.executemany(
+                f"INSERT INTO {table} ({key}, receipt_count, total, tax) VALUES (?, ?, ?, ?) "
+                f"ON CONFLICT ({key}) DO UPDATE SET receipt_count = receipt_count + excluded.receipt_count, "
+                "total = total + excluded.total, tax = tax + excluded.tax",
+                [(bucket, t.receipt_count, t.total, t.tax) for bucket, t in buckets.items()],
+            )
+        conn.executemany(
+            "INSERT INTO spend_merchant_monthly (merchant, month, receipt_count, total, tax) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (merchant, month) DO UPDATE SET receipt_count = receipt_count + excluded.receipt_count, "
+            "total = total + excluded.total, tax = tax + excluded.tax",
+            [(self._merchant_names[merchant], month, t.receipt_count, t.total, t.tax)
+             for (merchant, month), t in self.merchant_monthly.items()],
+        )
+        if self._removed:
+            # Drop buckets left empty by replaced receipts
+            for table in ("spend_daily", "spend_monthly", "spend_merchant_monthly"):
+                conn.execute(f"DELETE FROM {table} WHERE receipt_count <= 0")
+
+
+def _tax_share(total: float, tax: float) -> Optional[float]:
+    return round(tax / total, 4) if total else None
+
+
+def rebuild_spend_aggregates(conn: sqlite3.Connection) -> int:
+    """
+    Recompute every aggregate from the receipts table (caller owns the transaction)
+
+    Returns:
+        Number of receipts aggregated
+    """
+    for table in ("spend_daily", "spend_monthly", "spend_merchant_monthly"):
+        conn.execute(f"DELETE FROM {table}")
+    deltas = SpendDeltas()
+    count = 0
+    for merchant, date, created_at, total, tax in conn.execute(
+        "SELECT merchant, date, created_at, total, tax FROM receipts"
+    ):
+        deltas.add(merchant, date, created_at, total, tax)
+        count += 1
+    deltas.apply(conn)
+    return count
+
+
+def query_spend_by_period(conn: sqlite3.Connection, granularity: str,
+                          date_from: Optional[str], date_to: Optional[str]) -> List[Dict[str, Any]]:
+    """
+    Spend per day or month, oldest first
+
+    Raises:
+        ValueError: If the granularity is not "day" or "month"
+    """
+    table = GRANULARITIES.get(granularity)
+    if table is None:
+        raise ValueError(f"Unsupported granularity: {granularity}. Use one of: {', '.join(GRANULARITIES)}")
+    # Buckets are "YYYY-MM-DD" or "YYYY-MM"; truncate the bounds to match
+    key, width = ("day", 10) if granularity == "day" else ("month", 7)
+    clauses, params = [], []
+    if date_from:
+        clauses.append(f"{key} >= ?")
+        params.append(date_from[:width])
+    if date_to:
+        clauses.append(f"{key} <= ?")
+        params.append(date_to[:width])
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    rows = conn.execute(
+        f"SELECT {key}, receipt_count, total, tax FROM {table} {where} ORDER BY {key}", params
+    ).fetchall()
+    return [
+        {"period": period, "receipt_count": count, "total": round(total, 2), "tax": round(tax, 2),
+         "tax_share": _tax_share(total, tax)}
+        for period, count, total, tax in rows
+    ]
+
+
+def query_spend_by_merchant(conn: sqlite3.Connection, date_from: Optional[str],
+                            date_to: Optional[str], limit: int) -> List[Dict[str, Any]]:
+    """Top merchants by spend; the date range is widened to whole months"""
+    clauses, params = [], []
+    if date_from:
+        clauses.append("month >= ?")
+        params.append(date_from[:7])
+    if date_to:
+        clauses.append("month <= ?")
+        params.append(date_to[:7])
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    rows = conn.execute(
+        "SELECT merchant, SUM(receipt_count), SUM(total), SUM(tax) FROM spend_merchant_monthly "
+        f"{where} GROUP BY merchant ORDER BY SUM(total) DESC LIMIT ?",
+        (*params, limit),
+    ).fetchall()
+    return [
+        {"merchant": merchant, "receipt_count": count, "total": round(total, 2), "tax": round(tax, 2),
+         "tax_share": _tax_share(total, tax)}
+        for merchant, count, total, tax in rows
+    ]
+
+
+def query_spend_summary(conn: sqlite3.Connection, date_from: Optional[str],
+                        date_to: Optional[str]) -> Dict[str, Any]:
+    """Receipt count, spend, tax and tax share over a day range"""
+    clauses, params = [], []
+    if date_from:
+        clauses.append("day >= ?")
+        params.append(date_from[:10])
+    if date_to:
+        clauses.append("day <= ?")
+        params.append(date_to[:10])
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    count, total, tax = conn.execute(
+        f"SELECT COALESCE(SUM(receipt_count), 0), COALESCE(SUM(total), 0), COALESCE(SUM(tax), 0) "
+        f"FROM spend_daily {where}",
+        params,
+    ).fetchone()
+    return {"receipt_count": count, "total": round(total, 2), "tax": round(tax, 2),
+            "tax_share": _tax_share(total, tax)}
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    from backend.app.core.settings import get_settings
+    from backend.app.services.store import ReceiptStore
+
+    parser = argparse.ArgumentParser(description="Maintain the materialized spend aggregates")
+    parser.add_argument("--rebuild", action="store_true", help="Recompute all aggregates from stored receipts")
+    parser.add_argument("--db", default=None, help="Receipt database (defaults to RECEIPTS_DB_PATH)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    if not args.rebuild:
+        parser.error("nothing to do; pass --rebuild")
+
+    store = ReceiptStore(args.db or get_settings().receipts_db_path)
+    try:
+        count = store.rebuild_aggregates()
+    finally:
+        store.close()
+    logger.info(f"Rebuilt spend aggregates from {count} receipts")
+
+
+if __name__ == "__main__":
+    main()
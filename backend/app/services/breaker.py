@@ -0,0 +1,181 @@
+"""
+Circuit breakers for the OCR and parse upstream calls
+
+Each breaker watches a rolling window of call outcomes. A call fails if it
+raises, times out, returns a 5xx or takes longer than the slow-call
+threshold. Once enough calls are in the window and the failure rate
+crosses the threshold, the breaker opens and callers fail at once instead
+of waiting out a timeout. After a cool-down it lets a few probe calls
+through (half-open) and closes again if they succeed.
+
+Breakers are per worker process.
+"""
+import logging
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from backend.app.core.settings import get_settings
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Upstream operations guarded by a breaker
+BREAKER_OPERATIONS = ("ocr", "parse")
+
+
+class CircuitOpenError(Exception):
+    """The operation's breaker is open, so the call was not attempted"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Closed / open / half-open breaker driven by the rolling failure rate"""
+
+    def __init__(
+        self,
+        name: str,
+        window_seconds: float,
+        min_calls: int,
+        failure_rate: float,
+        slow_call_seconds: float,
+        open_seconds: float,
+        half_open_calls: int,
+    ):
+        self.name = name
+        self.window_seconds = window_seconds
+        self.min_calls = max(1, min_calls)
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.open_seconds = open_seconds
+        self.half_open_calls = max(1, half_open_calls)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._outcomes: Deque[Tuple[float, bool]] = deque()
+        self._probes = 0
+        self._probe_successes = 0
+        self._stats = {"opened": 0, "rejected": 0}
+
+    @property
+    def state(self) -> str:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            logger.info(f"Circuit breaker for {self.name} half-open, probing")
+            self._state = HALF_OPEN
+            self._probes = 0
+            self._probe_successes = 0
+        return self._state
+
+    def retry_after(self) -> float:
+        """Seconds until the breaker lets calls through again"""
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self._opened_at + self.open_seconds - time.monotonic())
+
+    def before_call(self) -> None:
+        """
+        Admit one call; pair with ``after_call``
+
+        Raises:
+            CircuitOpenError: If the breaker is open, or half-open with all
+                probe calls already in flight
+        """
+        state = self.state
+        if state == CLOSED:
+            return
+        if state == HALF_OPEN and self._probes < self.half_open_calls:
+            self._probes += 1
+            return
+        self._stats["rejected"] += 1
+        raise CircuitOpenError(
+            f"Upstream {self.name} is unavailable", retry_after=self.retry_after() or self.open_seconds
+        )
+
+    def after_call(self) -> None:
+        """Release the probe slot taken by ``before_call``, whatever the outcome"""
+        if self._state == HALF_OPEN and self._probes > 0:
+            self._probes -= 1
+
+    def record(self, failed: bool, latency: Optional[float] = None) -> None:
+        """Record one completed upstream call; a call slower than the threshold counts as failed"""
+        failed = failed or (latency is not None and latency > self.slow_call_seconds)
+        state = self.state
+        if state == OPEN:
+            return
+        if state == HALF_OPEN:
+            if failed:
+                self._open()
+                return
+            self._probe_successes += 1
+            if self._probe_successes >= self.half_open_calls:
+                logger.info(f"Circuit breaker for {self.name} closed")
+                self._state = CLOSED
+                self._outcomes.clear()
+            return
+
+        now = time.monotonic()
+        self._outcomes.append((now, failed))
+        while self._outcomes and self._outcomes[0][0] < now - self.window_seconds:
+            self._outcomes.popleft()
+        if len(self._outcomes) >= self.min_calls and self._failure_ratio() >= self.failure_rate:
+            self._open()
+
+    def _failure_ratio(self) -> float:
+        if not self._outcomes:
+            return 0.0
+        return sum(1 for _, failed in self._outcomes if failed) / len(self._outcomes)
+
+    def _open(self) -> None:
+        logger.warning(f"Circuit breaker for {self.name} opened")
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+        self._stats["opened"] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "failure_rate": round(self._failure_ratio(), 3),
+            "calls_in_window": len(self._outcomes),
+            "retry_after": round(self.retry_after(), 1),
+            **self._stats,
+        }
+
+
+# Global breaker instances, one per guarded operation
+_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def get_breaker(operation: str) -> Optional[CircuitBreaker]:
+    """Get the breaker guarding an upstream operation, or None if it has none or breakers are disabled"""
+    settings = get_settings()
+    if not settings.breaker_enabled or operation not in BREAKER_OPERATIONS:
+        return None
+    breaker = _breakers.get(operation)
+    if breaker is None:
+        breaker = _breakers[operation] = CircuitBreaker(
+            operation,
+            window_seconds=settings.breaker_window_seconds,
+            min_calls=settings.breaker_min_calls,
+            failure_rate=settings.breaker_failure_rate,
+            slow_call_seconds=settings.breaker_slow_call_seconds,
+            open_seconds=settings.breaker_open_seconds,
+            half_open_calls=settings.breaker_half_open_calls,
+        )
+    return breaker
+
+
+def breaker_states() -> Dict[str, Dict[str, Any]]:
+    """Snapshot of every guarded operation's breaker, for health checks"""
+    states = {}
+    for operation in BREAKER_OPERATIONS:
+        breaker = get_breaker(operation)
+        if breaker is not None:
+            states[operation] = breaker.snapshot()
+    return states
@@ -0,0 +1,391 @@
+"""
+Offline bulk ingestion through the Mistral batch inference API
+
+Scans a directory of receipt images, writes OCR requests to a JSONL batch
+file, submits and polls it, then does the same for the parse step and
+streams every parsed receipt into the output JSONL and the result cache.
+Parsed receipts are also written to the receipt store, one transaction per
+batch.
+
+Usage:
+    python -m backend.app.services.bulk_ingest receipts/ --output results.jsonl
+    python -m backend.app.services.bulk_ingest receipts/ --backend local
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import os
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List, Optional, Set
+
+from backend.app.core.settings import get_settings
+from backend.app.services.cache import get_result_cache, ocr_cache_key, parse_cache_key
+from backend.app.services.chunking import compact_markdown
+from backend.app.services.governor import get_governor
+from backend.app.services.http_client import close_http_client, get_http_client
+from backend.app.services.local_parser import parse_receipt_locally
+from backend.app.services.ocr import (
+    DATA_URL_PLACEHOLDER,
+    ENCODE_CHUNK_SIZE,
+    OCR_MODEL,
+    build_ocr_document,
+    combine_pages,
+    ocr_document_type,
+)
+from backend.app.services.parser import PARSE_MODEL, PROMPT_VERSION, build_parse_payload, extract_receipt_json
+from backend.app.services.store import ReceiptRecord, ReceiptStore
+from backend.app.services.upload import sniff_image_type
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+OCR_ENDPOINT = "/v1/ocr"
+CHAT_ENDPOINT = "/v1/chat/completions"
+
+
+@dataclass
+class ReceiptFile:
+    """An image found on disk, identified by its content hash"""
+    path: str
+    mime_type: str
+    sha256: str
+
+
+def scan_receipts(directory: str, allowed_types: List[str]) -> List[ReceiptFile]:
+    """Find receipt images in a directory, sniffing type and hashing each file"""
+    receipts = []
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if not os.path.isfile(path):
+            continue
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            head = f.read(12)
+            mime_type = sniff_image_type(head)
+            if mime_type is None or mime_type not in allowed_types:
+                continue
+            digest.update(head)
+            for chunk in iter(lambda: f.read(64 * 1024), b""):
+                digest.update(chunk)
+        receipts.append(ReceiptFile(path=path, mime_type=mime_type, sha256=digest.hexdigest()))
+    return receipts
+
+
+def write_ocr_batch(receipts: List[ReceiptFile], path: str) -> None:
+    """Write one OCR request per image or PDF, base64 encoding each file in chunks"""
+    with open(path, "w", encoding="utf-8") as out:
+        for receipt in receipts:
+            line = json.dumps({
+                "custom_id": receipt.sha256,
+                "body": build_ocr_document(DATA_URL_PLACEHOLDER, ocr_document_type(receipt.mime_type))
+            })
+            prefix, suffix = line.split(DATA_URL_PLACEHOLDER)
+            out.write(f"{prefix}data:{receipt.mime_type};base64,")
+            with open(receipt.path, "rb") as f:
+                for chunk in iter(lambda: f.read(ENCODE_CHUNK_SIZE), b""):
+                    out.write(base64.b64encode(chunk).decode("ascii"))
+            out.write(suffix + "\n")
+
+
+def write_parse_batch(markdown_by_id: Dict[str, str], path: str) -> None:
+    """Write one chat completion request per OCR result"""
+    with open(path, "w", encoding="utf-8") as out:
+        for custom_id, markdown_text in markdown_by_id.items():
+            body = build_parse_payload(markdown_text)
+            body.pop("model", None)
+            out.write(json.dumps({"custom_id": custom_id, "body": body}) + "\n")
+
+
+def _response_body(line: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Successful response body of a batch output line, or None"""
+    response = line.get("response") or {}
+    if line.get("error") or response.get("status_code") != 200:
+        return None
+    return response.get("body")
+
+
+class BatchBackend(ABC):
+    """Runs a JSONL batch file and yields its output lines"""
+
+    @abstractmethod
+    def run(self, endpoint: str, model: str, input_path: str) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Yield one batch API output line per input line that got a result
+
+        Lines of requests that never ran (the job failed or timed out) may be
+        missing; the caller reports those.
+        """
+
+
+class MistralBatchBackend(BatchBackend):
+    """Submits batch files to the Mistral batch jobs API and polls them to completion"""
+
+    def __init__(self, api_key: str, poll_interval: float = 30.0, timeout_hours: int = 24):
+        # Imported lazily: the SDK is only needed for offline ingestion
+        from mistralai import Mistral
+
+        self.client = Mistral(api_key=api_key)
+        self.poll_interval = poll_interval
+        self.timeout_hours = timeout_hours
+
+    async def run(self, endpoint: str, model: str, input_path: str) -> AsyncIterator[Dict[str, Any]]:
+        with open(input_path, "rb") as f:
+            uploaded = await self.client.files.upload_async(
+                file={"file_name": os.path.basename(input_path), "content": f},
+                purpose="batch",
+            )
+
+        job = await self.client.batch.jobs.create_async(
+            input_files=[uploaded.id],
+            endpoint=endpoint,
+            model=model,
+            metadata={"source": "bulk_ingest"},
+            timeout_hours=self.timeout_hours,
+        )
+        logger.info(f"Submitted batch job {job.id} ({endpoint}, {model})")
+
+        while job.status in ("QUEUED", "RUNNING"):
+            await asyncio.sleep(self.poll_interval)
+            job = await self.client.batch.jobs.get_async(job_id=job.id)
+            logger.info(
+                f"Batch job {job.id}: {job.status} "
+                f"{job.completed_requests}/{job.total_requests} done, {job.failed_requests} failed"
+            )
+
+        if job.status != "SUCCESS":
+            logger.error(f"Batch job {job.id} ended with status {job.status}")
+
+        for file_id in (job.output_file, job.error_file):
+            if not file_id:
+                continue
+            response = await self.client.files.download_async(file_id=file_id)
+            async for raw_line in response.aiter_lines():
+                if raw_line.strip():
+                    yield json.loads(raw_line)
+
+
+class LocalBatchBackend(BatchBackend):
+    """
+    Offline stand-in for the batch API
+
+    Sends each batch line as a regular request through the shared client, so
+    pointing ``mistral_api_base`` at a local mock makes ingestion testable
+    without network access. Output lines mirror the batch API format.
+    """
+
+    def __init__(self, concurrency: int = 8):
+        self.concurrency = concurrency
+
+    async def run(self, endpoint: str, model: str, input_path: str) -> AsyncIterator[Dict[str, Any]]:
+        client = get_http_client()
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def send(raw_line: str) -> Dict[str, Any]:
+            request = json.loads(raw_line)
+            async with semaphore:
+                try:
+                    payload = {"model": model, **request["body"]}
+                    response = await get_governor().send(
+                        endpoint, lambda: client.post(endpoint, json=payload)
+                    )
+                    return {
+                        "custom_id": request["custom_id"],
+                        "response": {"status_code": response.status_code, "body": response.json()},
+                        "error": None,
+                    }
+                except Exception as e:
+                    return {"custom_id": request["custom_id"], "response": None, "error": str(e)}
+
+        with open(input_path, "r", encoding="utf-8") as f:
+            tasks = [asyncio.create_task(send(line)) for line in f if line.strip()]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+async def ingest_directory(
+    directory: str,
+    output_path: str,
+    backend: BatchBackend,
+    work_dir: str,
+    batch_size: int = 1000,
+    store: Optional[ReceiptStore] = None,
+) -> Dict[str, int]:
+    """
+    OCR and parse every receipt in a directory via batch jobs
+
+    Results already in the result cache are reused instead of resubmitted.
+    Each parsed receipt is appended to ``output_path`` as one JSON line as
+    soon as its batch output is read; receipts a batch job returned nothing
+    for (it failed or timed out) get an error line. With a ``store``,
+    successful receipts are also saved to it in one bulk insert per batch.
+
+    Returns:
+        Counts of processed, succeeded and failed receipts
+    """
+    settings = get_settings()
+    cache = get_result_cache()
+    os.makedirs(work_dir, exist_ok=True)
+
+    receipts = []
+    seen = set()
+    for receipt in scan_receipts(directory, settings.allowed_file_types_list):
+        if receipt.sha256 in seen:
+            logger.info(f"Skipping {receipt.path}: duplicate content")
+            continue
+        seen.add(receipt.sha256)
+        receipts.append(receipt)
+    logger.info(f"Found {len(receipts)} unique receipts in {directory}")
+    stats = {"processed": 0, "succeeded": 0, "failed": 0}
+    records: List[ReceiptRecord] = []
+    emitted: Set[str] = set()
+
+    with open(output_path, "a", encoding="utf-8") as out:
+        def emit(receipt: ReceiptFile, data: Optional[Dict[str, Any]] = None, error: Optional[str] = None) -> None:
+            emitted.add(receipt.sha256)
+            stats["processed"] += 1
+            stats["succeeded" if error is None else "failed"] += 1
+            out.write(json.dumps({
+                "custom_id": receipt.sha256,
+                "filename": receipt.path,
+                "success": error is None,
+                "data": data,
+                "error": error,
+            }) + "\n")
+            out.flush()
+            if store is not None and data is not None:
+                records.append(ReceiptRecord(
+                    content_hash=receipt.sha256, filename=os.path.basename(receipt.path), data=data
+                ))
+
+        for start in range(0, len(receipts), batch_size):
+            chunk = receipts[start:start + batch_size]
+            by_id = {receipt.sha256: receipt for receipt in chunk}
+            batch_no = start // batch_size
+
+            # OCR step: only images without cached markdown are submitted
+            markdown_by_id: Dict[str, str] = {}
+            pending = []
+            for receipt in by_id.values():
+                cached = await cache.get(ocr_cache_key(receipt.sha256)) if cache else None
+                if cached is not None:
+                    markdown_by_id[receipt.sha256] = cached
+                else:
+                    pending.append(receipt)
+
+            if pending:
+                ocr_input = os.path.join(work_dir, f"ocr_{batch_no:05d}.jsonl")
+                write_ocr_batch(pending, ocr_input)
+                missing = "No OCR result: the batch job failed or timed out"
+                try:
+                    async for line in backend.run(OCR_ENDPOINT, OCR_MODEL, ocr_input):
+                        receipt = by_id.get(line.get("custom_id"))
+                        if receipt is None or receipt.sha256 in emitted or receipt.sha256 in markdown_by_id:
+                            continue
+                        body = _response_body(line)
+                        markdown_text = combine_pages(body.get("pages", [])) if body else ""
+                        if not markdown_text.strip():
+                            emit(receipt, error=line.get("error") or "Could not extract text from image")
+                            continue
+                        markdown_by_id[receipt.sha256] = markdown_text
+                        if cache:
+                            await cache.set(ocr_cache_key(receipt.sha256), markdown_text)
+                except Exception as e:
+                    logger.error(f"OCR batch {batch_no} failed: {str(e)}")
+                    missing = f"OCR batch job failed: {str(e)}"
+                for receipt in pending:
+                    if receipt.sha256 not in emitted and receipt.sha256 not in markdown_by_id:
+                        emit(receipt, error=missing)
+
+            # Parse step: confident local parses and cached parses are emitted directly
+            to_parse: Dict[str, str] = {}
+            for custom_id, markdown_text in markdown_by_id.items():
+                if settings.local_parser_enabled:
+                    local = parse_receipt_locally(markdown_text)
+                    if local.confidence >= settings.local_parser_min_confidence:
+                        emit(by_id[custom_id], data=local.data)
+                        continue
+                compacted = compact_markdown(markdown_text)
+                cached = await cache.get(parse_cache_key(compacted, PARSE_MODEL, PROMPT_VERSION)) if cache else None
+                if cached is not None:
+                    emit(by_id[custom_id], data=cached)
+                else:
+                    to_parse[custom_id] = compacted
+
+            if to_parse:
+                parse_input = os.path.join(work_dir, f"parse_{batch_no:05d}.jsonl")
+                write_parse_batch(to_parse, parse_input)
+                missing = "No parse result: the batch job failed or timed out"
+                try:
+                    async for line in backend.run(CHAT_ENDPOINT, PARSE_MODEL, parse_input):
+                        custom_id = line.get("custom_id")
+                        if custom_id not in to_parse or custom_id in emitted:
+                            continue
+                        body = _response_body(line)
+                        try:
+                            if body is None:
+                                raise ValueError(line.get("error") or "Parse request failed")
+                            data = extract_receipt_json(body["choices"][0]["message"]["content"])
+                        except (KeyError, IndexError, ValueError) as e:
+                            emit(by_id[custom_id], error=f"Failed to parse receipt data: {str(e)}")
+                            continue
+                        emit(by_id[custom_id], data=data)
+                        if cache:
+                            await cache.set(parse_cache_key(to_parse[custom_id], PARSE_MODEL, PROMPT_VERSION), data)
+                except Exception as e:
+                    logger.error(f"Parse batch {batch_no} failed: {str(e)}")
+                    missing = f"Parse batch job failed: {str(e)}"
+                for custom_id in to_parse:
+                    if custom_id not in emitted:
+                        emit(by_id[custom_id], error=missing)
+
+            if records:
+                await asyncio.to_thread(store.save_many, records)
+                records = []
+
+    logger.info(f"Bulk ingestion finished: {stats}")
+    return stats
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Bulk-ingest receipt images via the Mistral batch API")
+    parser.add_argument("directory", help="Directory of receipt images")
+    parser.add_argument("--output", default="bulk_results.jsonl", help="JSONL file results are appended to")
+    parser.add_argument("--work-dir", default="receipts/batches", help="Where batch input files are written")
+    parser.add_argument("--backend", choices=["mistral", "local"], default="mistral",
+                        help="'local' sends each line directly to MISTRAL_API_BASE instead of the batch API")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Receipts per batch job")
+    parser.add_argument("--poll-interval", type=float, default=30.0, help="Seconds between batch status polls")
+    parser.add_argument("--no-store", action="store_true", help="Do not write results to the receipt store")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+
+    if args.backend == "local":
+        backend: BatchBackend = LocalBatchBackend()
+    else:
+        backend = MistralBatchBackend(get_settings().mistral_api_key, poll_interval=args.poll_interval)
+
+    settings = get_settings()
+    store = None if args.no_store or not settings.store_enabled else ReceiptStore(settings.receipts_db_path)
+
+    async def run() -> None:
+        try:
+            await ingest_directory(args.directory, args.output, backend, args.work_dir, args.batch_size, store)
+        finally:
+            await close_http_client()
+            if store is not None:
+                store.close()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
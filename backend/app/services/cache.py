@@ -0,0 +1,322 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from backend.app.core.settings import get_settings
+from backend.app.services.coordinator import Coordinator, get_coordinator
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+# Share of the disk budget a size-triggered sweep evicts down to, so the
+# next few writes do not immediately trigger another scan
+_DISK_EVICT_TARGET = 0.9
+
+
+def content_hash(data: bytes) -> str:
+    """SHA-256 hex digest of raw content"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def ocr_cache_key(image_hash: str) -> str:
+    """Cache key for OCR markdown of an image"""
+    return f"ocr:{image_hash}"
+
+
+def parse_cache_key(markdown_text: str, model: str, prompt_version: str) -> str:
+    """Cache key for a parsed receipt: markdown hash + model + prompt version"""
+    markdown_hash = content_hash(markdown_text.encode("utf-8"))
+    return f"parse:{markdown_hash}:{model}:{prompt_version}"
+
+
+class ResultCache:
+    """
+    Tiered result cache
+
+    A bounded in-memory LRU tier sits in front of an optional shared tier
+    (a table in the coordinator database, so worker processes reuse each
+    other's results) and an optional on-disk tier (one JSON file per key)
+    that is evicted by TTL and total size.
+
+    The memory tier keeps values as JSON text, so every lookup returns a
+    fresh copy that callers may modify. The disk tier's size is tracked as
+    files are written; the directory is only scanned when that total goes
+    over budget or every ``disk_sweep_seconds`` (which also catches files
+    written by other processes and expired entries).
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl_seconds: float = 7 * 24 * 3600,
+        disk_dir: Optional[str] = None,
+        max_disk_bytes: int = 256 * 1024 * 1024,
+        shared: Optional[Coordinator] = None,
+        max_shared_entries: int = 10000,
+        disk_sweep_seconds: float = 3600,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.shared = shared
+        self.max_shared_entries = max_shared_entries
+        self.disk_sweep_seconds = disk_sweep_seconds
+        self._memory: "OrderedDict[str, tuple[float, str]]" = OrderedDict()
+        # Disk tier size as of the last sweep plus writes since; None until the first sweep
+        self._disk_bytes: Optional[int] = None
+        self._disk_swept_at = 0.0
+        self._disk_lock = threading.Lock()
+        self._stats = {
+            "memory_hits": 0,
+            "shared_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "sets": 0,
+            "evictions": 0,
+        }
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    # Memory tier
+
+    def _memory_get(self, key: str) -> Any:
+        entry = self._memory.get(key)
+        if entry is None:
+            return _MISSING
+        stored_at, encoded = entry
+        if time.time() - stored_at > self.ttl_seconds:
+            del self._memory[key]
+            return _MISSING
+        self._memory.move_to_end(key)
+        return json.loads(encoded)
+
+    def _memory_set(self, key: str, value: Any, stored_at: Optional[float] = None) -> None:
+        try:
+            encoded = json.dumps(value)
+        except (TypeError, ValueError) as e:
+            logger.warning(f"Failed to write cache entry to memory: {str(e)}")
+            return
+        self._memory[key] = (stored_at or time.time(), encoded)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    # Disk tier
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{content_hash(key.encode('utf-8'))}.json")
+
+    def _disk_get(self, key: str) -> Any:
+        path = self._disk_path(key)
+        try:
+            stat = os.stat(path)
+            if time.time() - stat.st_mtime > self.ttl_seconds:
+                os.remove(path)
+                self._disk_grow(-stat.st_size)
+                return _MISSING
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return _MISSING
+        if entry.get("key") != key:
+            return _MISSING
+        return entry["value"]
+
+    def _disk_set(self, key: str, value: Any) -> None:
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            encoded = json.dumps({"key": key, "value": value}).encode("utf-8")
+            with open(tmp_path, "wb") as f:
+                f.write(encoded)
+            try:
+                replaced = os.path.getsize(path)
+            except OSError:
+                replaced = 0
+            os.replace(tmp_path, path)
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"Failed to write cache entry to disk: {str(e)}")
+            return
+        self._disk_grow(len(encoded) - replaced)
+
+    def _disk_grow(self, delta: int) -> None:
+        """Account for a change in disk tier size, sweeping when over budget or due"""
+        with self._disk_lock:
+            if self._disk_bytes is not None:
+                self._disk_bytes += delta
+                if (self._disk_bytes <= self.max_disk_bytes
+                        and time.monotonic() - self._disk_swept_at < self.disk_sweep_seconds):
+                    return
+            self._disk_evict()
+
+    def _disk_evict(self) -> None:
+        """Drop expired files, then the oldest ones until under the size budget (caller holds the lock)"""
+        now = time.time()
+        files = []
+        total = 0
+        for entry in os.scandir(self.disk_dir):
+            if not entry.name.endswith(".json"):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            if now - stat.st_mtime > self.ttl_seconds:
+                self._remove(entry.path)
+                continue
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+
+        if total > self.max_disk_bytes:
+            files.sort()
+            for _, size, path in files:
+                if total <= self.max_disk_bytes * _DISK_EVICT_TARGET:
+                    break
+                self._remove(path)
+                total -= size
+        self._disk_bytes = total
+        self._disk_swept_at = time.monotonic()
+
+    def _remove(self, path: str) -> None:
+        try:
+            os.remove(path)
+            self._stats["evictions"] += 1
+        except OSError:
+            pass
+
+    def _disk_recent(self, limit: int) -> List[Tuple[float, str, Any]]:
+        """The newest unexpired disk entries as (stored_at, key, value), oldest first"""
+        now = time.time()
+        files = []
+        for entry in os.scandir(self.disk_dir):
+            if not entry.name.endswith(".json"):
+                continue
+            try:
+                mtime = entry.stat().st_mtime
+            except OSError:
+                continue
+            if now - mtime <= self.ttl_seconds:
+                files.append((mtime, entry.path))
+
+        loaded = []
+        for mtime, path in sorted(files)[-limit:]:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    entry = json.load(f)
+                loaded.append((mtime, entry["key"], entry["value"]))
+            except (OSError, ValueError, KeyError):
+                continue
+        return loaded
+
+    # Shared tier
+
+    async def get_shared(self, key: str) -> Optional[Any]:
+        """Look a key up in the shared tier only (no stats); used while waiting on another worker"""
+        if not self.shared:
+            return None
+        entry = await asyncio.to_thread(self.shared.cache_get, key, self.ttl_seconds)
+        if entry is None:
+            return None
+        stored_at, value = entry
+        self._memory_set(key, value, stored_at=stored_at)
+        return value
+
+    # Public API
+
+    async def warm(self) -> int:
+        """
+        Load the most recent shared or disk entries into the memory tier
+
+        Returns:
+            Number of entries loaded
+        """
+        if self.shared:
+            entries = await asyncio.to_thread(self.shared.cache_recent, self.max_entries, self.ttl_seconds)
+        elif self.disk_dir:
+            entries = await asyncio.to_thread(self._disk_recent, self.max_entries)
+        else:
+            return 0
+        for stored_at, key, value in entries:
+            self._memory_set(key, value, stored_at=stored_at)
+        return len(entries)
+
+    async def get(self, key: str) -> Optional[Any]:
+        """Look a key up in memory, then the shared tier, then on disk; returns None on miss"""
+        value = self._memory_get(key)
+        if value is not _MISSING:
+            self._stats["memory_hits"] += 1
+            return value
+
+        if self.shared:
+            value = await self.get_shared(key)
+            if value is not None:
+                self._stats["shared_hits"] += 1
+                return value
+
+        if self.disk_dir:
+            value = await asyncio.to_thread(self._disk_get, key)
+            if value is not _MISSING:
+                self._stats["disk_hits"] += 1
+                self._memory_set(key, value)
+                return value
+
+        self._stats["misses"] += 1
+        return None
+
+    async def set(self, key: str, value: Any) -> None:
+        """Store a JSON-serialisable value in every enabled tier"""
+        self._stats["sets"] += 1
+        self._memory_set(key, value)
+        if self.shared:
+            try:
+                await asyncio.to_thread(self.shared.cache_set, key, value, self.max_shared_entries)
+            except (sqlite3.Error, TypeError, ValueError) as e:
+                logger.warning(f"Failed to write cache entry to the shared tier: {str(e)}")
+        if self.disk_dir:
+            await asyncio.to_thread(self._disk_set, key, value)
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and current memory tier size"""
+        lookups = (
+            self._stats["memory_hits"] + self._stats["shared_hits"] + self._stats["disk_hits"] + self._stats["misses"]
+        )
+        hits = lookups - self._stats["misses"]
+        return {
+            **self._stats,
+            "entries": len(self._memory),
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+# Global cache instance
+_cache: Optional[ResultCache] = None
+
+
+def get_result_cache() -> Optional[ResultCache]:
+    """Get the result cache singleton, or None when caching is disabled"""
+    global _cache
+    settings = get_settings()
+    if not settings.cache_enabled:
+        return None
+    if _cache is None:
+        _cache = ResultCache(
+            max_entries=settings.cache_max_entries,
+            ttl_seconds=settings.cache_ttl_seconds,
+            disk_dir=settings.cache_dir or None,
+            max_disk_bytes=settings.cache_max_disk_bytes,
+            shared=get_coordinator(),
+            max_shared_entries=settings.cache_shared_max_entries,
+            disk_sweep_seconds=settings.cache_disk_sweep_seconds,
+        )
+    return _cache
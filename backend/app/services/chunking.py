@@ -0,0 +1,222 @@
+"""
+Prompt compaction and chunked parsing for long receipts
+
+OCR markdown is reduced to plain text lines before it is sent to the LLM,
+and receipts with many line items are split into overlapping chunks that
+are parsed concurrently: the first chunk carries the header (merchant,
+date), the last one the totals block. Chunk results are merged, items seen
+twice in an overlap are dropped, and the items are reconciled against the
+totals block.
+"""
+import logging
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from backend.app.services.local_parser import (
+    amounts_agree,
+    clean_lines,
+    ends_with_amount,
+    line_keyword,
+    parse_date,
+    parse_receipt_locally,
+)
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Taken from the last result that has them; other fields come from the first
+TOTAL_FIELDS = ("subtotal", "tax", "total")
+
+# Keywords that open the totals block after the line items
+_TOTALS_KEYWORDS = ("subtotal", "tax", "total")
+
+_NAME_NOISE_RE = re.compile(r"[^a-z0-9]+")
+
+
+@dataclass
+class ReceiptChunks:
+    """Compacted prompt text for each chunk plus the receipt's totals block"""
+    texts: List[str]
+    totals: List[str]
+
+
+def compact_markdown(markdown_text: str) -> str:
+    """OCR markdown without table, formatting and layout noise"""
+    return "\n".join(clean_lines(markdown_text))
+
+
+def split_sections(lines: List[str]) -> Tuple[List[str], List[str], List[str]]:
+    """
+    Split cleaned receipt lines into header, line items and totals block
+
+    The items start at the first line ending in an amount that is neither
+    a keyword line nor a date (whose last digits look like an amount); the
+    totals block starts at the first sub-total, tax or
+    total line after that.
+    """
+    first_item = next(
+        (index for index, line in enumerate(lines)
+         if line_keyword(line) is None and ends_with_amount(line) and parse_date(line) is None),
+        len(lines),
+    )
+    totals_start = next(
+        (index for index in range(first_item, len(lines)) if line_keyword(lines[index]) in _TOTALS_KEYWORDS),
+        len(lines),
+    )
+    return lines[:first_item], lines[first_item:totals_start], lines[totals_start:]
+
+
+def chunk_lines(lines: List[str], size: int, overlap: int) -> List[List[str]]:
+    """Consecutive windows of ``size`` lines, each repeating the last ``overlap`` lines of the one before"""
+    if size <= 0 or len(lines) <= size:
+        return [lines]
+    step = max(1, size - overlap)
+    chunks = []
+    start = 0
+    while True:
+        chunks.append(lines[start:start + size])
+        if start + size >= len(lines):
+            return chunks
+        start += step
+
+
+def split_receipt(markdown_text: str, chunk_size: int, overlap: int) -> ReceiptChunks:
+    """
+    Compact a receipt and split its line items into overlapping chunks
+
+    Args:
+        markdown_text: OCR markdown of one page
+        chunk_size: Item lines per chunk (0 keeps the receipt whole)
+        overlap: Item lines repeated at the start of the next chunk, so an
+            item cut at a chunk boundary is still seen whole once
+
+    Returns:
+        One prompt text per chunk (a single one for short receipts) and the
+        totals block lines
+    """
+    lines = clean_lines(markdown_text)
+    header, items, totals = split_sections(lines)
+    groups = chunk_lines(items, chunk_size, overlap)
+    texts = []
+    for index, group in enumerate(groups):
+        chunk = (header if index == 0 else []) + group + (totals if index == len(groups) - 1 else [])
+        texts.append("\n".join(chunk))
+    return ReceiptChunks(texts=texts, totals=totals)
+
+
+def merge_parsed(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Combine parse results for consecutive parts of one receipt
+
+    Merchant, date and any other field come from the first result that has
+    them, subtotal, tax and total from the last result that has them, and
+    items are concatenated in order.
+    """
+    merged: Dict[str, Any] = {"items": []}
+    for result in results:
+        for field, value in result.items():
+            if field == "items":
+                merged["items"].extend(value or [])
+            elif field in TOTAL_FIELDS:
+                if value is not None:
+                    merged[field] = value
+            elif merged.get(field) is None:
+                merged[field] = value
+    return merged
+
+
+def _price(item: Dict[str, Any]) -> Optional[float]:
+    try:
+        return float(item.get("price"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _same_item(a: Dict[str, Any], b: Dict[str, Any]) -> bool:
+    name_a = _NAME_NOISE_RE.sub("", str(a.get("name", "")).lower())
+    name_b = _NAME_NOISE_RE.sub("", str(b.get("name", "")).lower())
+    return name_a == name_b and _price(a) == _price(b)
+
+
+def _overlap_length(previous: List[Dict[str, Any]], following: List[Dict[str, Any]], overlap: int) -> int:
+    """Longest run of items ending ``previous`` that also starts ``following``, up to ``overlap``"""
+    for length in range(min(overlap, len(previous), len(following)), 0, -1):
+        if all(_same_item(a, b) for a, b in zip(previous[-length:], following[:length])):
+            return length
+    return 0
+
+
+def _reconcile(
+    merged: Dict[str, Any],
+    totals: List[str],
+    suspects: List[int],
+    dropped: List[Tuple[int, Dict[str, Any]]],
+) -> None:
+    """
+    Check items against the totals block and fix what can be fixed
+
+    Totals the LLM left out are filled in from a local parse of the totals
+    block. If the items add up to more than the sub-total by exactly the
+    price of an item that may have been read twice at a chunk boundary
+    (same price, differently spelled name), that item is dropped; if they
+    fall short by exactly the price of an overlap item that was dropped as
+    a repeat (a genuine second order of the same thing), it is restored.
+    """
+    local = parse_receipt_locally("\n".join(totals)).data
+    for field in ("subtotal", "total"):
+        if merged.get(field) is None and local[field] is not None:
+            merged[field] = local[field]
+    if merged.get("tax") is None:
+        merged["tax"] = local["tax"]
+
+    subtotal = merged.get("subtotal")
+    items = merged["items"]
+    if subtotal is None or not items:
+        return
+    items_sum = sum(_price(item) or 0.0 for item in items)
+    if amounts_agree(items_sum, subtotal):
+        return
+
+    excess = items_sum - subtotal
+    for index in suspects:
+        price = _price(items[index])
+        if excess > 0 and price and amounts_agree(price, excess):
+            logger.info(f"Dropping item {items[index].get('name')!r} counted twice at a chunk boundary")
+            del items[index]
+            return
+    for index, item in dropped:
+        price = _price(item)
+        if excess < 0 and price and amounts_agree(price, -excess):
+            logger.info(f"Restoring repeated item {item.get('name')!r} at a chunk boundary")
+            items.insert(index, item)
+            return
+    logger.warning(f"Chunked parse items sum to {items_sum}, sub-total is {subtotal}")
+
+
+def merge_chunk_results(results: List[Dict[str, Any]], overlap: int, totals: List[str]) -> Dict[str, Any]:
+    """
+    Merge parse results of the chunks of one receipt
+
+    Items repeated because chunks overlap are dropped where the end of one
+    chunk's items matches the start of the next, then the merged receipt is
+    reconciled against its totals block.
+    """
+    merged = merge_parsed(results)
+    items: List[Dict[str, Any]] = list(results[0].get("items") or [])
+    # Items inside an overlap that did not match exactly but repeat a nearby price
+    suspects: List[int] = []
+    # Items dropped as overlap repeats, with the position they would have had
+    dropped: List[Tuple[int, Dict[str, Any]]] = []
+    for result in results[1:]:
+        chunk_items = list(result.get("items") or [])
+        repeated = _overlap_length(items, chunk_items, overlap)
+        dropped += [(len(items), item) for item in chunk_items[:repeated]]
+        tail_prices = {_price(item) for item in items[-overlap:]} if overlap else set()
+        for offset, item in enumerate(chunk_items[repeated:overlap]):
+            if _price(item) in tail_prices:
+                suspects.append(len(items) + offset)
+        items.extend(chunk_items[repeated:])
+    merged["items"] = items
+    _reconcile(merged, totals, suspects, dropped)
+    return merged
@@ -0,0 +1,294 @@
+"""
+Cross-process coordination for running several uvicorn workers
+
+Worker processes on one host share a SQLite file (WAL mode) holding the
+upstream token bucket, leases for in-flight upstream calls, claims on work
+a worker has started, and a shared result cache tier. Each operation is one
+short IMMEDIATE transaction; async callers run them in a thread. Leases and
+claims carry an expiry and the owner's pid, so a crashed worker cannot hold
+budget or block work for long.
+"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Iterator, List, Optional, Tuple, TypeVar
+
+from backend.app.core.settings import get_settings
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rate_buckets (
+    name TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS upstream_leases (
+    id TEXT PRIMARY KEY,
+    pid INTEGER NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS work_claims (
+    key TEXT PRIMARY KEY,
+    pid INTEGER NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS shared_cache (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    stored_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_shared_cache_stored ON shared_cache (stored_at);
+"""
+
+# Shared cache writes between size checks
+_EVICT_EVERY = 64
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class Coordinator:
+    """
+    SQLite state shared by the worker processes of one deployment
+
+    Calls are blocking and serialised on one connection per process; the
+    database's write lock serialises them across processes.
+    """
+
+    def __init__(self, db_path: str, poll_interval: float = 0.05, busy_timeout: float = 5.0):
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.poll_interval = poll_interval
+        self.pid = os.getpid()
+        self._conn = sqlite3.connect(
+            db_path, check_same_thread=False, isolation_level=None, timeout=busy_timeout
+        )
+        self._lock = threading.Lock()
+        self._cache_writes = 0
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """Hold this process's lock and the database write lock"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def _purge_dead(self, conn: sqlite3.Connection, table: str) -> int:
+        """Drop rows owned by processes that no longer exist"""
+        pids = [row[0] for row in conn.execute(f"SELECT DISTINCT pid FROM {table}")]
+        dead = [pid for pid in pids if pid != self.pid and not _pid_alive(pid)]
+        for pid in dead:
+            conn.execute(f"DELETE FROM {table} WHERE pid = ?", (pid,))
+        return len(dead)
+
+    # Rate budget
+
+    def reserve_token(self, name: str, rate: float, capacity: float, max_wait: float) -> Optional[float]:
+        """
+        Take one token from a shared bucket refilled at ``rate`` per second
+
+        Returns:
+            Seconds to wait before the token may be used, or None (nothing
+            reserved) when that wait would exceed ``max_wait``
+        """
+        with self._transaction() as conn:
+            now = time.time()
+            row = conn.execute(
+                "SELECT tokens, updated_at FROM rate_buckets WHERE name = ?", (name,)
+            ).fetchone()
+            tokens = capacity if row is None else min(capacity, row[0] + (now - row[1]) * rate)
+            wait = 0.0 if tokens >= 1 else (1 - tokens) / rate
+            if wait > max_wait:
+                return None
+            # Reserve now so waiters across processes queue up in order
+            conn.execute(
+                "INSERT INTO rate_buckets (name, tokens, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at",
+                (name, tokens - 1, now),
+            )
+        return wait
+
+    # Concurrency budget
+
+    def acquire_lease(self, limit: int, ttl: float) -> Optional[str]:
+        """Take one of ``limit`` global upstream slots; returns a lease id or None when all are held"""
+        with self._transaction() as conn:
+            now = time.time()
+            conn.execute("DELETE FROM upstream_leases WHERE expires_at < ?", (now,))
+            held = conn.execute("SELECT COUNT(*) FROM upstream_leases").fetchone()[0]
+            if held >= limit and self._purge_dead(conn, "upstream_leases"):
+                held = conn.execute("SELECT COUNT(*) FROM upstream_leases").fetchone()[0]
+            if held >= limit:
+                return None
+            lease_id = uuid.uuid4().hex
+            conn.execute(
+                "INSERT INTO upstream_leases (id, pid, expires_at) VALUES (?, ?, ?)",
+                (lease_id, self.pid, now + ttl),
+            )
+        return lease_id
+
+    def release_lease(self, lease_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM upstream_leases WHERE id = ?", (lease_id,))
+
+    def leases_held(self) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM upstream_leases WHERE expires_at >= ?", (time.time(),)
+            ).fetchone()[0]
+
+    # Work claims
+
+    def claim(self, key: str, ttl: float) -> bool:
+        """Claim a unit of work; False if a live worker already holds it"""
+        with self._transaction() as conn:
+            now = time.time()
+            row = conn.execute("SELECT pid, expires_at FROM work_claims WHERE key = ?", (key,)).fetchone()
+            if row and row[1] >= now and (row[0] == self.pid or _pid_alive(row[0])):
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO work_claims (key, pid, expires_at) VALUES (?, ?, ?)",
+                (key, self.pid, now + ttl),
+            )
+        return True
+
+    def release_claim(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM work_claims WHERE key = ? AND pid = ?", (key, self.pid))
+
+    def claim_active(self, key: str) -> bool:
+        """Whether another live worker still holds the claim on a key"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT pid, expires_at FROM work_claims WHERE key = ?", (key,)
+            ).fetchone()
+        return bool(row) and row[1] >= time.time() and _pid_alive(row[0])
+
+    async def run_once(
+        self,
+        key: str,
+        fn: Callable[[], Awaitable[T]],
+        lookup: Callable[[], Awaitable[Optional[T]]],
+        ttl: float,
+    ) -> T:
+        """
+        Run ``fn`` in at most one worker process at a time per key
+
+        A worker that finds the key claimed waits for the claim to go away
+        and then returns what ``lookup`` finds (the result the other worker
+        cached). If there is nothing, because that worker failed or died, it
+        claims the key and runs ``fn`` itself.
+
+        Args:
+            key: Identifies the unit of work (e.g. a cache key)
+            fn: Does the work and caches its result
+            lookup: Returns the cached result, or None
+            ttl: Seconds a claim lasts before other workers may take over
+        """
+        while True:
+            if await asyncio.to_thread(self.claim, key, ttl):
+                try:
+                    # The previous holder may have finished just before we claimed
+                    value = await lookup()
+                    if value is not None:
+                        return value
+                    return await fn()
+                finally:
+                    await asyncio.to_thread(self.release_claim, key)
+
+            logger.info(f"Waiting on another worker for {key[:24]}")
+            while await asyncio.to_thread(self.claim_active, key):
+                await asyncio.sleep(self.poll_interval)
+            value = await lookup()
+            if value is not None:
+                return value
+
+    # Shared cache tier
+
+    def cache_get(self, key: str, ttl: float) -> Optional[Tuple[float, Any]]:
+        """Unexpired (stored_at, value) for a key, or None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, stored_at FROM shared_cache WHERE key = ? AND stored_at >= ?",
+                (key, time.time() - ttl),
+            ).fetchone()
+        return (row[1], json.loads(row[0])) if row else None
+
+    def cache_set(self, key: str, value: Any, max_entries: int) -> None:
+        encoded = json.dumps(value)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO shared_cache (key, value, stored_at) VALUES (?, ?, ?)",
+                (key, encoded, time.time()),
+            )
+            self._cache_writes += 1
+            if self._cache_writes % _EVICT_EVERY == 0:
+                self._conn.execute(
+                    "DELETE FROM shared_cache WHERE key IN "
+                    "(SELECT key FROM shared_cache ORDER BY stored_at DESC LIMIT -1 OFFSET ?)",
+                    (max_entries,),
+                )
+
+    def cache_recent(self, limit: int, ttl: float) -> List[Tuple[float, str, Any]]:
+        """The newest unexpired entries as (stored_at, key, value), oldest first"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT stored_at, key, value FROM shared_cache WHERE stored_at >= ? "
+                "ORDER BY stored_at DESC LIMIT ?",
+                (time.time() - ttl, limit),
+            ).fetchall()
+        return [(stored_at, key, json.loads(value)) for stored_at, key, value in reversed(rows)]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+# Global coordinator instance
+_coordinator: Optional[Coordinator] = None
+
+
+def get_coordinator() -> Optional[Coordinator]:
+    """Get the coordinator singleton, or None when running as a single process"""
+    global _coordinator
+    settings = get_settings()
+    if not settings.coordinator_db_path:
+        return None
+    if _coordinator is None:
+        _coordinator = Coordinator(settings.coordinator_db_path, settings.coordinator_poll_interval)
+        logger.info(f"Coordinating with other workers through {settings.coordinator_db_path}")
+    return _coordinator
+
+
+def close_coordinator() -> None:
+    global _coordinator
+    if _coordinator is not None:
+        _coordinator.close()
+        _coordinator = None
@@ -0,0 +1,71 @@
+"""
+End-to-end request deadlines
+
+An endpoint fixes one absolute deadline per receipt when the request
+arrives. The deadline travels with the request in a context variable, so
+every upstream call made on its behalf (OCR pages, parse chunks,
+continuations, retries) is bounded by what is left of the budget instead of
+a fixed timeout of its own, and work that can no longer finish in time is
+cancelled rather than left running.
+"""
+import asyncio
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Awaitable, Iterator, Optional, TypeVar
+
+T = TypeVar("T")
+
+# Absolute time.monotonic() deadline of the request being served, if any
+_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceededError(Exception):
+    """The request's end-to-end deadline expired before its work completed"""
+
+
+def current_deadline() -> Optional[float]:
+    """Absolute time.monotonic() deadline of the current request, or None outside a request"""
+    return _deadline.get()
+
+
+def remaining_time() -> Optional[float]:
+    """Seconds left before the current request's deadline (never negative), or None without one"""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.monotonic())
+
+
+@contextmanager
+def deadline_scope(deadline: float) -> Iterator[float]:
+    """
+    Make ``deadline`` the request deadline inside the block
+
+    An enclosing scope with an earlier deadline keeps precedence.
+
+    Yields:
+        The effective deadline
+    """
+    enclosing = _deadline.get()
+    effective = deadline if enclosing is None else min(deadline, enclosing)
+    token = _deadline.set(effective)
+    try:
+        yield effective
+    finally:
+        _deadline.reset(token)
+
+
+async def run_with_deadline(aw: Awaitable[T], deadline: float) -> T:
+    """
+    Await ``aw`` under a request deadline, cancelling it once the deadline passes
+
+    Raises:
+        DeadlineExceededError: If the deadline expires first
+    """
+    with deadline_scope(deadline) as effective:
+        # wait_for runs ``aw`` in a task created here, so it sees the scope
+        try:
+            return await asyncio.wait_for(aw, timeout=max(0.0, effective - time.monotonic()))
+        except asyncio.TimeoutError:
+            raise DeadlineExceededError("Request deadline exceeded")
@@ -0,0 +1,593 @@
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncContextManager, AsyncIterator, Awaitable, Callable, Deque, Dict, Optional, Tuple, TypeVar, Union
+
+import httpx
+
+from backend.app.core.settings import get_settings
+from backend.app.services.breaker import get_breaker
+from backend.app.services.coordinator import Coordinator, get_coordinator
+from backend.app.services.deadline import DeadlineExceededError, current_deadline
+from backend.app.services.metrics import UPSTREAM_HEDGES, UPSTREAM_RESPONSES, UPSTREAM_SECONDS
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+RETRYABLE_STATUS_CODES = (429, 502, 503, 504)
+
+# Weight of the newest sample in the per-operation latency average
+_LATENCY_EWMA_ALPHA = 0.2
+
+# Recent latencies kept per operation for the hedging percentile
+_LATENCY_WINDOW = 200
+
+
+class UpstreamRateLimitedError(Exception):
+    """The provider kept throttling until retries or the deadline ran out"""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class UpstreamDeadlineExceededError(DeadlineExceededError):
+    """The per-request deadline expired before the upstream call completed"""
+
+
+class TokenBucket:
+    """Token bucket refilled at ``rate`` tokens per second, holding up to ``capacity``"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, deadline: float) -> None:
+        """
+        Take one token, waiting for a refill if needed
+
+        Raises:
+            UpstreamDeadlineExceededError: If no token frees up before the deadline
+        """
+        async with self._lock:
+            self._refill()
+            wait = 0.0 if self._tokens >= 1 else (1 - self._tokens) / self.rate
+            if wait and time.monotonic() + wait > deadline:
+                raise UpstreamDeadlineExceededError("Deadline exceeded waiting for upstream rate limit")
+            # Reserve the token now so waiters queue up in order
+            self._tokens -= 1
+        if wait:
+            await asyncio.sleep(wait)
+
+
+class SharedTokenBucket:
+    """Token bucket kept in the coordinator database, so the rate holds across worker processes"""
+
+    def __init__(self, coordinator: Coordinator, rate: float, capacity: float, name: str = "upstream"):
+        self.coordinator = coordinator
+        self.rate = rate
+        self.capacity = capacity
+        self.name = name
+
+    async def acquire(self, deadline: float) -> None:
+        """
+        Take one token, waiting for a refill if needed
+
+        Raises:
+            UpstreamDeadlineExceededError: If no token frees up before the deadline
+        """
+        wait = await asyncio.to_thread(
+            self.coordinator.reserve_token, self.name, self.rate, self.capacity, max(0.0, deadline - time.monotonic())
+        )
+        if wait is None:
+            raise UpstreamDeadlineExceededError("Deadline exceeded waiting for upstream rate limit")
+        if wait:
+            await asyncio.sleep(wait)
+
+
+class SharedSlots:
+    """Global cap on in-flight upstream calls, held as leases in the coordinator database"""
+
+    def __init__(self, coordinator: Coordinator, limit: int):
+        self.coordinator = coordinator
+        self.limit = limit
+
+    @asynccontextmanager
+    async def slot(self, deadline: float, hold_until: Optional[float] = None) -> AsyncIterator[None]:
+        """
+        Hold one global slot for the duration of a call
+
+        Args:
+            deadline: Give up waiting for a slot at this time
+            hold_until: When the call itself must end (defaults to ``deadline``)
+        """
+        while True:
+            # The call itself is bounded, so the lease can be too
+            ttl = max(0.0, (hold_until or deadline) - time.monotonic()) + 1.0
+            lease_id = await asyncio.to_thread(self.coordinator.acquire_lease, self.limit, ttl)
+            if lease_id:
+                break
+            if time.monotonic() + self.coordinator.poll_interval > deadline:
+                raise UpstreamDeadlineExceededError("Deadline exceeded waiting for a global upstream slot")
+            await asyncio.sleep(self.coordinator.poll_interval)
+        try:
+            yield
+        finally:
+            await asyncio.to_thread(self.coordinator.release_lease, lease_id)
+
+
+class AdaptiveLimiter:
+    """
+    AIMD in-flight limit
+
+    Each healthy call grows the limit by 1/limit (about +1 per window of
+    calls); a throttle or latency spike halves it.
+    """
+
+    def __init__(self, initial: int, minimum: int, maximum: int, backoff_ratio: float = 0.5):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.backoff_ratio = backoff_ratio
+        self.limit = float(max(minimum, min(initial, maximum)))
+        self.in_flight = 0
+        self._condition = asyncio.Condition()
+
+    @asynccontextmanager
+    async def slot(self, deadline: float) -> AsyncIterator[None]:
+        """Hold one in-flight slot for the duration of a call"""
+        async with self._condition:
+            while self.in_flight >= int(self.limit):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise UpstreamDeadlineExceededError("Deadline exceeded waiting for an upstream slot")
+                try:
+                    await asyncio.wait_for(self._condition.wait(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    pass
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self.in_flight -= 1
+                # Wake as many waiters as there are free slots (the limit may have grown)
+                self._condition.notify(max(1, int(self.limit) - self.in_flight))
+
+    def on_success(self) -> None:
+        self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+    def on_congestion(self) -> None:
+        self.limit = max(self.minimum, self.limit * self.backoff_ratio)
+
+
+def parse_retry_after(response: httpx.Response) -> Optional[float]:
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date)"""
+    value = response.headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+@asynccontextmanager
+async def _no_slot() -> AsyncIterator[None]:
+    yield
+
+
+class UpstreamGovernor:
+    """
+    Shared admission control for every call to the Mistral API
+
+    Combines a token bucket (requests per minute), an adaptive in-flight
+    limit, jittered retries that honour Retry-After, a per-request
+    deadline and the OCR and parse circuit breakers. With a coordinator,
+    the bucket and a global in-flight cap are shared by every worker
+    process; the adaptive limit and the breakers stay per process.
+
+    With hedging enabled, an attempt still running after the operation's
+    observed latency percentile gets a duplicate, and whichever returns a
+    usable response first wins. Hedges are capped at ``hedge_budget`` of all
+    calls and only go out if a token and a slot are free right away, so
+    they never queue behind or crowd out first attempts.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: int,
+        burst: int,
+        initial_concurrency: int,
+        min_concurrency: int,
+        max_concurrency: int,
+        max_retries: int,
+        backoff_base: float,
+        backoff_max: float,
+        latency_spike_factor: float,
+        default_deadline: float,
+        coordinator: Optional[Coordinator] = None,
+        global_concurrency: int = 0,
+        hedge_enabled: bool = False,
+        hedge_percentile: float = 95.0,
+        hedge_budget: float = 0.05,
+        hedge_min_samples: int = 20,
+    ):
+        self.bucket: Union[TokenBucket, SharedTokenBucket]
+        self.global_slots: Optional[SharedSlots] = None
+        if coordinator is not None:
+            self.bucket = SharedTokenBucket(coordinator, rate=requests_per_minute / 60.0, capacity=max(1, burst))
+            self.global_slots = SharedSlots(coordinator, max(1, global_concurrency))
+        else:
+            self.bucket = TokenBucket(rate=requests_per_minute / 60.0, capacity=max(1, burst))
+        self.limiter = AdaptiveLimiter(initial_concurrency, min_concurrency, max_concurrency)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.latency_spike_factor = latency_spike_factor
+        self.default_deadline = default_deadline
+        self.hedge_enabled = hedge_enabled
+        self.hedge_percentile = hedge_percentile
+        self.hedge_budget = hedge_budget
+        self.hedge_min_samples = max(1, hedge_min_samples)
+        self._latency: Dict[str, float] = {}
+        self._samples: Dict[str, Deque[float]] = {}
+        self._stats = {
+            "calls": 0, "retries": 0, "throttled": 0, "latency_spikes": 0, "deadline_exceeded": 0,
+            "hedges": 0, "hedge_wins": 0,
+        }
+
+    def _backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _global_slot(self, deadline: float, hold_until: float) -> AsyncContextManager[None]:
+        return self.global_slots.slot(deadline, hold_until) if self.global_slots else _no_slot()
+
+    def _record_latency(self, operation: str, latency: float) -> bool:
+        """Update the latency average and report whether this call was a spike"""
+        self._samples.setdefault(operation, deque(maxlen=_LATENCY_WINDOW)).append(latency)
+        average = self._latency.get(operation)
+        if average is None:
+            self._latency[operation] = latency
+            return False
+        self._latency[operation] = average + _LATENCY_EWMA_ALPHA * (latency - average)
+        return latency > average * self.latency_spike_factor
+
+    def _hedge_delay(self, operation: str) -> Optional[float]:
+        """Seconds after which an attempt is hedged, or None while hedging is off or unprimed"""
+        samples = self._samples.get(operation)
+        if not self.hedge_enabled or not samples or len(samples) < self.hedge_min_samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * self.hedge_percentile / 100))]
+
+    def _take_hedge(self) -> bool:
+        """Reserve hedge budget, keeping hedges within ``hedge_budget`` of all calls"""
+        if self._stats["hedges"] + 1 > self.hedge_budget * self._stats["calls"]:
+            return False
+        self._stats["hedges"] += 1
+        return True
+
+    def _refund_hedge(self) -> None:
+        """Give back budget reserved for a hedge that never reached the upstream"""
+        self._stats["hedges"] -= 1
+
+    async def _attempt(
+        self,
+        operation: str,
+        send: Callable[[], Awaitable[httpx.Response]],
+        deadline: float,
+        admit_by: float,
+        consume: Optional[Callable[[httpx.Response], Awaitable[Any]]] = None,
+        upstream_timeout: bool = True,
+        on_send: Optional[Callable[[], None]] = None,
+    ) -> Tuple[httpx.Response, float, Any]:
+        """
+        One call under the rate limit and concurrency budget
+
+        Args:
+            admit_by: Give up waiting for a token or slot at this time
+            deadline: The call must complete by this time
+            consume: Reads a non-retryable response's body before the slot
+                is released; the response is closed afterwards
+            upstream_timeout: Whether ``deadline`` is the upstream's own
+                timeout; when it is the request's tighter end-to-end
+                deadline, running out of time says nothing about the
+                upstream and is not recorded on the breaker
+            on_send: Called once the call holds a token and slot, just
+                before it goes out
+
+        Returns:
+            The response, the call's latency in seconds (including
+            ``consume``) and what ``consume`` returned
+        """
+        breaker = get_breaker(operation)
+        await self.bucket.acquire(admit_by)
+        async with self.limiter.slot(admit_by), self._global_slot(admit_by, deadline):
+            started = time.monotonic()
+            remaining = deadline - started
+            if remaining <= 0:
+                raise UpstreamDeadlineExceededError("Deadline exceeded before the upstream call")
+            result = None
+            rejected: Optional[httpx.HTTPStatusError] = None
+            if on_send is not None:
+                on_send()
+            try:
+                response = await asyncio.wait_for(send(), timeout=remaining)
+                if consume is not None and response.status_code not in RETRYABLE_STATUS_CODES:
+                    try:
+                        result = await asyncio.wait_for(
+                            consume(response), timeout=max(0.0, deadline - time.monotonic())
+                        )
+                    except httpx.HTTPStatusError as e:
+                        # An error status the consumer refused; recorded like any other response
+                        rejected = e
+                    finally:
+                        await response.aclose()
+            except asyncio.TimeoutError:
+                UPSTREAM_RESPONSES.inc(operation=operation, status="timeout")
+                if breaker and upstream_timeout:
+                    breaker.record(failed=True)
+                raise UpstreamDeadlineExceededError("Deadline exceeded during the upstream call")
+            except httpx.HTTPError:
+                UPSTREAM_RESPONSES.inc(operation=operation, status="error")
+                if breaker:
+                    breaker.record(failed=True)
+                raise
+            latency = time.monotonic() - started
+            UPSTREAM_SECONDS.observe(latency, operation=operation)
+            UPSTREAM_RESPONSES.inc(operation=operation, status=str(response.status_code))
+            if breaker:
+                # Throttling (429) is the limiter's business, not a sign of an outage
+                breaker.record(failed=response.status_code >= 500, latency=latency)
+            if rejected is not None:
+                raise rejected
+            return response, latency, result
+
+    async def _hedged_attempt(
+        self,
+        operation: str,
+        send: Callable[[], Awaitable[httpx.Response]],
+        deadline: float,
+        consume: Optional[Callable[[httpx.Response], Awaitable[Any]]] = None,
+        upstream_timeout: bool = True,
+    ) -> Tuple[httpx.Response, float, Any]:
+        """
+        One attempt, duplicated if it outlasts the hedge delay
+
+        The first usable (non-retryable) response wins and the other call is
+        cancelled or its response closed. If neither is usable, the first
+        attempt's outcome is returned or raised. Attempts with a consumer
+        are never hedged, since both copies would feed it.
+        """
+        delay = self._hedge_delay(operation)
+        if delay is None or consume is not None:
+            return await self._attempt(operation, send, deadline, deadline, consume, upstream_timeout)
+
+        primary = asyncio.ensure_future(
+            self._attempt(operation, send, deadline, deadline, upstream_timeout=upstream_timeout)
+        )
+        try:
+            await asyncio.wait({primary}, timeout=delay)
+        except asyncio.CancelledError:
+            primary.cancel()
+            raise
+        if primary.done() or time.monotonic() >= deadline or not self._take_hedge():
+            return await primary
+
+        logger.info(f"Upstream {operation} slower than {delay:.2f}s, sending a hedge")
+        # No waiting for a token or slot: a hedge only goes out on spare
+        # capacity, and its budget is refunded if it never does
+        sent = False
+
+        def hedge_sent() -> None:
+            nonlocal sent
+            sent = True
+
+        hedge = asyncio.ensure_future(
+            self._attempt(operation, send, deadline, time.monotonic(),
+                          upstream_timeout=upstream_timeout, on_send=hedge_sent)
+        )
+        calls = (primary, hedge)
+        pending = set(calls)
+        winner: Optional[asyncio.Future] = None
+        try:
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = next((task for task in calls if task in done and _usable(task)), None)
+            if winner is None:
+                winner = primary
+            elif winner is hedge:
+                self._stats["hedge_wins"] += 1
+            if sent:
+                UPSTREAM_HEDGES.inc(operation=operation, winner="hedge" if winner is hedge else "primary")
+            return winner.result()
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            if not sent:
+                self._refund_hedge()
+            for task in calls:
+                if task is not winner and not task.cancelled() and task.exception() is None:
+                    await task.result()[0].aclose()
+
+    async def send(
+        self,
+        operation: str,
+        send: Callable[[], Awaitable[httpx.Response]],
+        deadline: Optional[float] = None,
+    ) -> httpx.Response:
+        """
+        Run an upstream call under the rate limit and concurrency budget
+
+        Args:
+            operation: Label used for latency tracking (e.g. "ocr", "parse")
+            send: Performs one attempt; called again for every retry
+            deadline: Absolute time.monotonic() deadline; defaults to
+                ``upstream_deadline_seconds`` from now, and is cut to the
+                request's end-to-end deadline when one is set
+
+        Returns:
+            The first non-retryable response
+
+        Raises:
+            UpstreamRateLimitedError: If throttling outlasts retries or the deadline
+            UpstreamDeadlineExceededError: If the deadline expires first
+            CircuitOpenError: If the operation's circuit breaker is open
+        """
+        response, _ = await self._call(operation, send, deadline, None)
+        return response
+
+    async def stream(
+        self,
+        operation: str,
+        send: Callable[[], Awaitable[httpx.Response]],
+        consume: Callable[[httpx.Response], Awaitable[T]],
+        deadline: Optional[float] = None,
+    ) -> T:
+        """
+        Run a streamed upstream call, reading the body inside the call's budget
+
+        ``send`` returns the response as soon as its headers arrive, so the
+        in-flight slot, global lease and latency timing are held until
+        ``consume`` has read the body; the response is then closed. A
+        consumer may raise ``httpx.HTTPStatusError`` for an error status.
+        Retries and errors are handled as in ``send``; streamed calls are
+        not hedged.
+
+        Returns:
+            What ``consume`` returned for the first non-retryable response
+        """
+        _, result = await self._call(operation, send, deadline, consume)
+        return result
+
+    async def _call(
+        self,
+        operation: str,
+        send: Callable[[], Awaitable[httpx.Response]],
+        deadline: Optional[float],
+        consume: Optional[Callable[[httpx.Response], Awaitable[Any]]],
+    ) -> Tuple[httpx.Response, Any]:
+        """Retry loop shared by ``send`` and ``stream``"""
+        if deadline is None:
+            deadline = time.monotonic() + self.default_deadline
+        # Timeouts only count against the breaker when the upstream's own
+        # deadline, not a shorter request deadline, was the limit
+        upstream_timeout = True
+        request_deadline = current_deadline()
+        if request_deadline is not None and request_deadline < deadline:
+            deadline = request_deadline
+            upstream_timeout = False
+
+        breaker = get_breaker(operation)
+        attempt = 0
+        while True:
+            if breaker:
+                breaker.before_call()
+            self._stats["calls"] += 1
+            try:
+                response, latency, result = await self._hedged_attempt(
+                    operation, send, deadline, consume, upstream_timeout
+                )
+            except UpstreamDeadlineExceededError:
+                self._stats["deadline_exceeded"] += 1
+                raise
+            finally:
+                if breaker:
+                    breaker.after_call()
+
+            if response.status_code not in RETRYABLE_STATUS_CODES:
+                if self._record_latency(operation, latency):
+                    self._stats["latency_spikes"] += 1
+                    self.limiter.on_congestion()
+                else:
+                    self.limiter.on_success()
+                return response, result
+
+            self._stats["throttled"] += 1
+            self.limiter.on_congestion()
+            retry_after = parse_retry_after(response)
+            # Release the connection (matters for streamed responses)
+            await response.aclose()
+            delay = retry_after if retry_after is not None else self._backoff(attempt)
+            # Jitter on top of Retry-After so throttled callers do not return in lockstep
+            delay += random.uniform(0, self.backoff_base)
+
+            if attempt >= self.max_retries or time.monotonic() + delay > deadline:
+                logger.error(f"Upstream {operation} still throttled (status {response.status_code}), giving up")
+                raise UpstreamRateLimitedError(
+                    "Upstream service is busy. Please try again later.", retry_after=retry_after
+                )
+
+            logger.warning(
+                f"Upstream {operation} returned {response.status_code}, retry {attempt + 1} in {delay:.2f}s"
+            )
+            self._stats["retries"] += 1
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            **self._stats,
+            "concurrency_limit": round(self.limiter.limit, 2),
+            "in_flight": self.limiter.in_flight,
+            "latency_ewma": {op: round(value, 3) for op, value in self._latency.items()},
+            "hedge_after": {
+                op: round(delay, 3) for op, delay in
+                ((op, self._hedge_delay(op)) for op in self._samples) if delay is not None
+            },
+        }
+
+
+def _usable(task: "asyncio.Future[Tuple[httpx.Response, float]]") -> bool:
+    """A finished attempt that produced a non-retryable response"""
+    return task.exception() is None and task.result()[0].status_code not in RETRYABLE_STATUS_CODES
+
+
+# Global governor instance
+_governor: Optional[UpstreamGovernor] = None
+
+
+def get_governor() -> UpstreamGovernor:
+    """Get the governor singleton shared by the OCR and parse calls"""
+    global _governor
+    if _governor is None:
+        settings = get_settings()
+        _governor = UpstreamGovernor(
+            requests_per_minute=settings.rate_limit_requests,
+            burst=settings.rate_limit_burst,
+            initial_concurrency=settings.upstream_initial_concurrency,
+            min_concurrency=settings.upstream_min_concurrency,
+            max_concurrency=settings.upstream_max_concurrency,
+            max_retries=settings.upstream_max_retries,
+            backoff_base=settings.upstream_backoff_base,
+            backoff_max=settings.upstream_backoff_max,
+            latency_spike_factor=settings.upstream_latency_spike_factor,
+            default_deadline=settings.upstream_deadline_seconds,
+            coordinator=get_coordinator(),
+            global_concurrency=settings.upstream_global_concurrency,
+            hedge_enabled=settings.upstream_hedge_enabled,
+            hedge_percentile=settings.upstream_hedge_percentile,
+            hedge_budget=settings.upstream_hedge_budget,
+            hedge_min_samples=settings.upstream_hedge_min_samples,
+        )
+    return _governor
@@ -0,0 +1,100 @@
+import logging
+from typing import Optional
+
+import httpx
+
+from backend.app.core.settings import get_settings
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# App-lifetime client shared by the OCR and parser services
+_client: Optional[httpx.AsyncClient] = None
+
+
+def _http2_available() -> bool:
+    """Check whether the optional h2 package is installed"""
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def create_http_client() -> httpx.AsyncClient:
+    """
+    Create a pooled async client for the Mistral API
+
+    Returns:
+        An httpx.AsyncClient with keep-alive pooling and the configured limits
+    """
+    settings = get_settings()
+
+    http2 = settings.http_enable_http2
+    if http2 and not _http2_available():
+        logger.warning("HTTP/2 requested but the h2 package is not installed, falling back to HTTP/1.1")
+        http2 = False
+
+    limits = httpx.Limits(
+        max_connections=settings.http_max_connections,
+        max_keepalive_connections=settings.http_max_keepalive_connections,
+        keepalive_expiry=settings.http_keepalive_expiry,
+    )
+    timeout = httpx.Timeout(
+        settings.http_read_timeout,
+        connect=settings.http_connect_timeout,
+    )
+
+    return httpx.AsyncClient(
+        base_url=settings.mistral_api_base,
+        headers={
+            "Authorization": f"Bearer {settings.mistral_api_key}",
+            "User-Agent": "ReceiptScanner/1.0",
+        },
+        limits=limits,
+        timeout=timeout,
+        http2=http2,
+    )
+
+
+async def init_http_client() -> httpx.AsyncClient:
+    """Create the shared client and open a first connection to the API"""
+    global _client
+    if _client is None:
+        _client = create_http_client()
+        await warm_http_client(_client)
+    return _client
+
+
+async def warm_http_client(client: httpx.AsyncClient) -> None:
+    """
+    Establish a pooled connection so the first request skips TCP+TLS setup
+
+    Warm-up failures are logged and ignored; the pool connects lazily instead.
+    """
+    try:
+        response = await client.get("/v1/models")
+        logger.info(f"Upstream connection warmed (status {response.status_code})")
+    except httpx.HTTPError as e:
+        logger.warning(f"Upstream warm-up failed: {str(e)}")
+
+
+async def close_http_client() -> None:
+    """Close the shared client and release pooled connections"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Get the shared upstream client
+
+    Falls back to creating one lazily when used outside the app lifespan
+    (e.g. from scripts), so callers never open a per-request connection.
+    """
+    global _client
+    if _client is None:
+        _client = create_http_client()
+    return _client
@@ -0,0 +1,350 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from backend.app.core.settings import get_settings
+from backend.app.services.admission import BACKGROUND_CLIENT, BATCH
+from backend.app.services.pipeline import ReceiptProcessingError, admitted, process_receipt, request_deadline, within_deadline
+from backend.app.services.store import persist_receipt
+from backend.app.services.upload import ImageUpload
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_SUCCEEDED = "succeeded"
+STATUS_FAILED = "failed"
+TERMINAL_STATUSES = (STATUS_SUCCEEDED, STATUS_FAILED)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    filename TEXT,
+    mime_type TEXT NOT NULL,
+    sha256 TEXT NOT NULL,
+    image BLOB,
+    result TEXT,
+    error TEXT,
+    status_code INTEGER,
+    client_id TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at);
+"""
+
+
+class JobQueueFullError(Exception):
+    """Raised when too many jobs are already pending"""
+
+
+class JobStore:
+    """
+    SQLite persistence for receipt jobs
+
+    The image is kept in the row until the job finishes so queued work
+    survives restarts. Calls are blocking; JobManager runs them in threads.
+    """
+
+    def __init__(self, db_path: str):
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+            columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+            if "client_id" not in columns:
+                # Databases created before jobs recorded who submitted them
+                self._conn.execute("ALTER TABLE jobs ADD COLUMN client_id TEXT")
+
+    def create(self, upload: ImageUpload, client_id: Optional[str] = None) -> str:
+        job_id = str(uuid.uuid4())
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, status, filename, mime_type, sha256, image, client_id, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, STATUS_QUEUED, upload.filename, upload.mime_type, upload.sha256,
+                 bytes(upload.data), client_id, now, now),
+            )
+        return job_id
+
+    def claim(self, job_id: str) -> Optional[Tuple[ImageUpload, str]]:
+        """
+        Atomically move a queued job to running
+
+        Returns:
+            The job's image and the client that submitted it (BACKGROUND_CLIENT
+            for jobs created before that was recorded), or None if the job is
+            not queued
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE id = ? AND status = ?",
+                (STATUS_RUNNING, time.time(), job_id, STATUS_QUEUED),
+            )
+            if cursor.rowcount != 1:
+                return None
+            row = self._conn.execute(
+                "SELECT filename, mime_type, sha256, image, client_id FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        upload = ImageUpload(
+            data=bytearray(row["image"]),
+            mime_type=row["mime_type"],
+            sha256=row["sha256"],
+            filename=row["filename"] or "",
+        )
+        return upload, row["client_id"] or BACKGROUND_CLIENT
+
+    def finish(self, job_id: str, result: Optional[Dict[str, Any]] = None,
+               error: Optional[str] = None, status_code: Optional[int] = None) -> None:
+        """Record the outcome and drop the stored image"""
+        job_status = STATUS_FAILED if error else STATUS_SUCCEEDED
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, status_code = ?, image = NULL, updated_at = ? "
+                "WHERE id = ?",
+                (job_status, json.dumps(result) if result is not None else None, error,
+                 status_code, time.time(), job_id),
+            )
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, status, filename, result, error, status_code, created_at, updated_at "
+                "FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def count_pending(self) -> int:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN (?, ?)", (STATUS_QUEUED, STATUS_RUNNING)
+            ).fetchone()
+        return row[0]
+
+    def touch(self, job_ids: List[str]) -> None:
+        """Refresh running jobs' ``updated_at`` so ``recover`` knows their process is alive"""
+        if not job_ids:
+            return
+        placeholders = ", ".join("?" * len(job_ids))
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE jobs SET updated_at = ? WHERE status = ? AND id IN ({placeholders})",
+                (time.time(), STATUS_RUNNING, *job_ids),
+            )
+
+    def requeue(self, job_id: str) -> None:
+        """Move a running job back to queued (its worker is shutting down)"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE id = ? AND status = ?",
+                (STATUS_QUEUED, time.time(), job_id, STATUS_RUNNING),
+            )
+
+    def recover(self, stale_after: float) -> List[str]:
+        """
+        Re-queue jobs interrupted by a restart
+
+        Running jobs are touched regularly by their process, so one untouched
+        for ``stale_after`` seconds belongs to a process that died without
+        handing it back, and is moved back to queued.
+        """
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE status = ? AND updated_at < ?",
+                (STATUS_QUEUED, time.time(), STATUS_RUNNING, time.time() - stale_after),
+            )
+            rows = self._conn.execute(
+                "SELECT id FROM jobs WHERE status = ? ORDER BY created_at", (STATUS_QUEUED,)
+            ).fetchall()
+        return [row["id"] for row in rows]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class JobManager:
+    """Runs submitted receipts through the pipeline on a bounded worker pool"""
+
+    def __init__(self, store: JobStore, workers: int, max_pending: int, stale_after: float):
+        self.store = store
+        self.workers = workers
+        self.max_pending = max_pending
+        self.stale_after = stale_after
+        self._queue: "asyncio.Queue[str]" = asyncio.Queue()
+        self._tasks: List[asyncio.Task] = []
+        self._done_events: Dict[str, asyncio.Event] = {}
+        # Jobs this process has claimed and not finished
+        self._running: Set[str] = set()
+
+    async def start(self) -> None:
+        for job_id in await asyncio.to_thread(self.store.recover, self.stale_after):
+            self._queue.put_nowait(job_id)
+        if self._queue.qsize():
+            logger.info(f"Recovered {self._queue.qsize()} queued receipt jobs")
+        self._tasks = [asyncio.create_task(self._worker(n)) for n in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._heartbeat()))
+
+    async def stop(self) -> None:
+        """Stop the workers, handing jobs they were running back to the queue"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self.store.close()
+
+    async def _heartbeat(self) -> None:
+        """Keep running jobs fresh, including ones still waiting for an admission slot"""
+        while True:
+            await asyncio.sleep(self.stale_after / 3)
+            try:
+                await asyncio.to_thread(self.store.touch, list(self._running))
+            except sqlite3.Error as e:
+                logger.warning(f"Could not refresh running receipt jobs: {str(e)}")
+
+    @property
+    def queued(self) -> int:
+        """Jobs waiting for a worker in this process"""
+        return self._queue.qsize()
+
+    async def submit(self, upload: ImageUpload, client_id: Optional[str] = None) -> str:
+        """
+        Persist a job and queue it for processing
+
+        Args:
+            upload: The validated image
+            client_id: Admission client id of the submitter (see admission.client_id);
+                the job is admitted under it, at batch priority, when it runs
+
+        Raises:
+            JobQueueFullError: If max_pending jobs are already waiting
+        """
+        if await asyncio.to_thread(self.store.count_pending) >= self.max_pending:
+            raise JobQueueFullError("Too many pending receipt jobs")
+        job_id = await asyncio.to_thread(self.store.create, upload, client_id)
+        self._queue.put_nowait(job_id)
+        return job_id
+
+    async def get(self, job_id: str, wait: float = 0.0) -> Optional[Dict[str, Any]]:
+        """
+        Fetch a job, optionally long-polling up to ``wait`` seconds for it to finish
+
+        The local completion event wakes waiters immediately; the periodic
+        re-read also picks up jobs finished by another worker process.
+        """
+        deadline = time.monotonic() + wait
+        event = self._done_events.setdefault(job_id, asyncio.Event())
+        try:
+            while True:
+                job = await asyncio.to_thread(self.store.get, job_id)
+                remaining = deadline - time.monotonic()
+                if job is None or job["status"] in TERMINAL_STATUSES or remaining <= 0:
+                    return job
+                try:
+                    await asyncio.wait_for(event.wait(), timeout=min(remaining, 1.0))
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            if not event.is_set() and self._done_events.get(job_id) is event:
+                # Keep the map from growing with ids nobody finishes locally
+                self._done_events.pop(job_id, None)
+
+    async def _worker(self, worker_id: int) -> None:
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            except Exception as e:
+                logger.error(f"Job worker {worker_id} crashed on {job_id}: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job_id: str) -> None:
+        claimed = await asyncio.to_thread(self.store.claim, job_id)
+        if claimed is None:
+            # Already claimed elsewhere or no longer queued
+            return
+        upload, client = claimed
+
+        logger.info(f"Processing receipt job {job_id}")
+        self._running.add(job_id)
+        try:
+            # Queue in the submitter's batch flow, behind interactive uploads;
+            # the deadline starts once a slot is free
+            async with admitted(client, BATCH, None):
+                result = await within_deadline(process_receipt(upload), request_deadline())
+            persist_receipt(upload.sha256, upload.filename, result)
+            await asyncio.to_thread(self.store.finish, job_id, result=result)
+        except ReceiptProcessingError as e:
+            await asyncio.to_thread(self.store.finish, job_id, error=e.detail, status_code=e.status_code)
+        except asyncio.CancelledError:
+            # Shutting down: hand the job back so the next start runs it straight away
+            # (blocking, as awaiting is unreliable once cancelled)
+            logger.info(f"Re-queueing interrupted receipt job {job_id}")
+            self.store.requeue(job_id)
+            raise
+        except Exception as e:
+            logger.error(f"Unexpected error in job {job_id}: {str(e)}")
+            await asyncio.to_thread(
+                self.store.finish, job_id,
+                error="An unexpected error occurred while processing the receipt", status_code=500
+            )
+        finally:
+            self._running.discard(job_id)
+
+        event = self._done_events.pop(job_id, None)
+        if event:
+            event.set()
+
+
+# Global job manager instance
+_manager: Optional[JobManager] = None
+
+
+async def start_job_manager() -> JobManager:
+    """Create the job manager and start its workers"""
+    global _manager
+    if _manager is None:
+        settings = get_settings()
+        store = await asyncio.to_thread(JobStore, settings.jobs_db_path)
+        _manager = JobManager(
+            store,
+            workers=settings.job_workers,
+            max_pending=settings.job_max_pending,
+            stale_after=settings.job_stale_seconds,
+        )
+        await _manager.start()
+    return _manager
+
+
+async def stop_job_manager() -> None:
+    """Stop workers; queued jobs stay in the database for the next start"""
+    global _manager
+    if _manager is not None:
+        await _manager.stop()
+        _manager = None
+
+
+def get_job_manager() -> JobManager:
+    """Get the running job manager"""
+    if _manager is None:
+        raise RuntimeError("Job manager is not running")
+    return _manager
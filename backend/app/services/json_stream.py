@@ -0,0 +1,120 @@
+import json
+from typing import Any, Dict, List, Optional
+
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+class IncrementalJSONDecoder:
+    """
+    Decode a JSON object that arrives in fragments
+
+    Text is scanned once as it is fed; every object completed inside the
+    top-level ``array_key`` array is decoded and returned by ``feed`` so
+    callers can use line items before the reply is finished. The decoder
+    also remembers the last point where the document was structurally
+    complete, which lets ``repair`` salvage a reply cut off mid-item.
+    """
+
+    def __init__(self, array_key: str = "items"):
+        self.array_key = array_key
+        self.text = ""
+        self.items: List[Dict[str, Any]] = []
+        self._pos = 0
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_string: Optional[str] = None
+        self._key: Optional[str] = None
+        self._item_start: Optional[int] = None
+        self._safe_end = 0
+        self._safe_stack: List[str] = []
+
+    def _in_array(self) -> bool:
+        return self._stack[:2] == ["{", "["] and self._key == self.array_key
+
+    def _mark_safe(self, end: int) -> None:
+        self._safe_end = end
+        self._safe_stack = list(self._stack)
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        """
+        Append a fragment of the reply
+
+        Returns:
+            Objects of the tracked array completed by this fragment
+        """
+        self.text += chunk
+        completed = []
+        text = self.text
+        for i in range(self._pos, len(text)):
+            ch = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if len(self._stack) == 1:
+                        self._last_string = text[self._string_start:i + 1]
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                self._string_start = i
+            elif ch == ":" and len(self._stack) == 1 and self._last_string is not None:
+                self._key = json.loads(self._last_string)
+                self._last_string = None
+            elif ch in "{[":
+                self._stack.append(ch)
+                if ch == "{" and len(self._stack) == 3 and self._in_array():
+                    self._item_start = i
+            elif ch in "}]":
+                if self._stack:
+                    self._stack.pop()
+                if ch == "}" and self._item_start is not None and len(self._stack) == 2:
+                    item = json.loads(text[self._item_start:i + 1])
+                    self._item_start = None
+                    if isinstance(item, dict):
+                        self.items.append(item)
+                        completed.append(item)
+                    self._mark_safe(i + 1)
+            elif ch == "," and len(self._stack) == 1:
+                # The previous top-level member is complete
+                self._mark_safe(i)
+        self._pos = len(text)
+        return completed
+
+    @property
+    def complete(self) -> bool:
+        """Whether a whole top-level value has been read"""
+        return bool(self.text.strip()) and not self._stack and not self._in_string
+
+    def result(self) -> Dict[str, Any]:
+        """
+        Decode the full document
+
+        Raises:
+            ValueError: If the text is not a complete JSON object
+        """
+        try:
+            data = json.loads(self.text)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON in response: {str(e)}")
+        if not isinstance(data, dict):
+            raise ValueError("Response JSON is not an object")
+        return data
+
+    def repair(self) -> Dict[str, Any]:
+        """
+        Decode a truncated document up to its last complete member or item
+
+        Raises:
+            ValueError: If nothing complete was received
+        """
+        if not self._safe_end:
+            raise ValueError("Response was truncated before any field was complete")
+        head = self.text[:self._safe_end].rstrip().rstrip(",")
+        closing = "".join(_CLOSERS[opener] for opener in reversed(self._safe_stack))
+        return json.loads(head + closing)
@@ -0,0 +1,252 @@
+import re
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Amounts like 75,000  1.346.000  12.50  1,234.56  -45  0 (optionally with a currency symbol)
+_AMOUNT = r"-?(?:[$€£¥]|Rp\.?|RM)?\s?(?:\d{1,3}(?:[.,]\d{3})+(?:[.,]\d{1,2})?|\d+(?:[.,]\d{1,2})?)"
+
+_QTY_ITEM_RE = re.compile(rf"^(?P<qty>\d+)\s*[xX×]\s*(?P<name>.+?)\s+(?P<price>{_AMOUNT})[.,]?$")
+_PLAIN_ITEM_RE = re.compile(rf"^(?P<name>.*?[A-Za-z].*?)\s+(?P<price>{_AMOUNT})[.,]?$")
+_AMOUNT_TOKEN_RE = re.compile(rf"(?P<price>{_AMOUNT})[.,]?$")
+
+# Keyword lines, checked in order (sub-total must win over total)
+_KEYWORDS = (
+    ("subtotal", re.compile(r"^sub[\s\-_]*total\b", re.IGNORECASE)),
+    ("discount", re.compile(r"^(discount|disc\b|diskon)", re.IGNORECASE)),
+    ("service", re.compile(r"^(service|svc|serv\.? ?charge)", re.IGNORECASE)),
+    ("rounding", re.compile(r"^(rounding|round\b|pembulatan)", re.IGNORECASE)),
+    ("tax", re.compile(r"^(tax|vat|gst|hst|pst|pb1|ppn|pajak|sales tax)\b", re.IGNORECASE)),
+    ("total", re.compile(r"^(grand\s*total|total(\s+due)?|amount\s+due|balance\s+due|jumlah|summe|gesamt)\b", re.IGNORECASE)),
+    ("payment", re.compile(r"^(cash|change|card|visa|mastercard|tunai|kembali|paid|tendered)\b", re.IGNORECASE)),
+)
+
+_DATE_PATTERNS = (
+    (re.compile(r"\b(\d{4})[-/.](\d{1,2})[-/.](\d{1,2})\b"), ("y", "m", "d")),
+    (re.compile(r"\b(\d{1,2})[-/.](\d{1,2})[-/.](\d{4})\b"), ("d", "m", "y")),
+    (re.compile(r"\b(\d{1,2})[-/.](\d{1,2})[-/.](\d{2})\b"), ("d", "m", "yy")),
+    (re.compile(r"\b(\d{1,2})\s+([A-Za-z]{3,9})\.?,?\s+(\d{4})\b"), ("d", "mon", "y")),
+    (re.compile(r"\b([A-Za-z]{3,9})\.?\s+(\d{1,2}),?\s+(\d{4})\b"), ("mon", "d", "y")),
+)
+
+# Highest confidence for a parse missing its merchant or date, well under
+# any sensible local_parser_min_confidence, so the LLM fills them in
+_MISSING_FIELD_CONFIDENCE = 0.5
+
+# Half the smallest decimal unit (amounts carry at most two decimals)
+_AMOUNT_TOLERANCE = 0.005
+
+_FRACTION_RE = re.compile(r"([.,])\d{1,2}$")
+_NON_AMOUNT_RE = re.compile(r"[^\d.,]")
+_LETTERS_RE = re.compile(r"[A-Za-z]{2,}")
+_MARKDOWN_NOISE_RE = re.compile(r"[|*#`_>]+")
+_IMAGE_LINK_RE = re.compile(r"!\[[^\]]*\]\([^)]*\)")
+_COMMENT_RE = re.compile(r"<!--.*?-->")
+_PAGE_MARKER_RE = re.compile(r"^=*\s*page\s+\d+\s*=*$", re.IGNORECASE)
+
+
+@dataclass
+class LocalParseResult:
+    """Receipt data in the LLM parser's JSON shape plus a confidence score"""
+    data: Dict[str, Any]
+    confidence: float
+    checks: Dict[str, bool] = field(default_factory=dict)
+
+
+def clean_lines(markdown_text: str) -> List[str]:
+    """
+    OCR markdown as plain text lines
+
+    Table pipes, emphasis and heading markup, image links, HTML comments
+    (such as page breaks), page markers and rule lines are removed and
+    whitespace is collapsed.
+    """
+    lines = []
+    for raw_line in markdown_text.splitlines():
+        raw_line = _COMMENT_RE.sub(" ", _IMAGE_LINK_RE.sub(" ", raw_line))
+        line = " ".join(_MARKDOWN_NOISE_RE.sub(" ", raw_line).split())
+        if line and not _PAGE_MARKER_RE.match(line) and not set(line) <= set("-=:"):
+            lines.append(line)
+    return lines
+
+
+def line_keyword(line: str) -> Optional[str]:
+    """Keyword a cleaned line starts with (subtotal, tax, total, ...), or None"""
+    return next((name for name, pattern in _KEYWORDS if pattern.match(line)), None)
+
+
+def ends_with_amount(line: str) -> bool:
+    """Whether a cleaned line ends in an amount, as item and totals lines do"""
+    return _AMOUNT_TOKEN_RE.search(line) is not None
+
+
+def _detect_decimal_separator(tokens: List[str]) -> Optional[str]:
+    """
+    Work out the document's decimal separator from its amounts
+
+    A separator followed by one or two trailing digits marks decimals
+    (12.50, 12,50). Documents without any (e.g. IDR: 75,000) have no
+    decimal part and every separator groups thousands.
+    """
+    votes = {".": 0, ",": 0}
+    for token in tokens:
+        match = _FRACTION_RE.search(token)
+        if match:
+            votes[match.group(1)] += 1
+    if not votes["."] and not votes[","]:
+        return None
+    return "." if votes["."] >= votes[","] else ","
+
+
+def parse_amount(token: str, decimal_separator: Optional[str]) -> float:
+    """Convert an amount token to a float using the document's decimal separator"""
+    negative = token.strip().startswith("-")
+    digits = _NON_AMOUNT_RE.sub("", token)
+    if decimal_separator:
+        thousands = "," if decimal_separator == "." else "."
+        digits = digits.replace(thousands, "").replace(decimal_separator, ".")
+        # A lone separator followed by three digits still groups thousands
+        if re.search(r"\.\d{3}$", digits) and digits.count(".") == 1 and not _FRACTION_RE.search(token):
+            digits = digits.replace(".", "")
+    else:
+        digits = digits.replace(".", "").replace(",", "")
+    value = float(digits or 0)
+    return -value if negative else value
+
+
+def parse_date(text: str) -> Optional[str]:
+    """Find a date in a line and return it as YYYY-MM-DD"""
+    for pattern, order in _DATE_PATTERNS:
+        match = pattern.search(text)
+        if not match:
+            continue
+        parts = dict(zip(order, match.groups()))
+        try:
+            if "mon" in parts:
+                month = datetime.strptime(parts["mon"][:3].title(), "%b").month
+            else:
+                month = int(parts["m"])
+            day = int(parts["d"])
+            year = int(parts["y"]) if "y" in parts else 2000 + int(parts["yy"])
+            if month > 12 and day <= 12:
+                # US-style month/day order
+                month, day = day, month
+            return datetime(year, month, day).strftime("%Y-%m-%d")
+        except ValueError:
+            continue
+    return None
+
+
+def amounts_agree(a: float, b: float) -> bool:
+    """
+    Amounts agree to the currency's smallest unit
+
+    Within half a cent, which absorbs float noise in sums of decimal
+    amounts; amounts in currencies without decimals (IDR) must match
+    exactly. Any looser and a missed line item can pass the checks.
+    """
+    return abs(a - b) < _AMOUNT_TOLERANCE
+
+
+def parse_receipt_locally(markdown_text: str) -> LocalParseResult:
+    """
+    Extract receipt data from OCR markdown without calling the LLM
+
+    Handles "qty x name price" and "name price" item lines, sub-total /
+    tax / service / rounding / discount / total keywords, common date
+    formats and both comma and dot thousands separators.
+
+    The confidence score reflects whether the arithmetic checks pass:
+    items must add up to the sub-total, and the sub-total plus charges
+    must add up to the total. A parse without a merchant or a date is
+    capped at ``_MISSING_FIELD_CONFIDENCE`` however well it adds up.
+    """
+    lines = clean_lines(markdown_text)
+
+    amount_tokens = [m.group("price") for m in (_AMOUNT_TOKEN_RE.search(line) for line in lines) if m]
+    decimal_separator = _detect_decimal_separator(amount_tokens)
+
+    merchant = ""
+    date = None
+    items: List[Dict[str, Any]] = []
+    amounts: Dict[str, float] = {}
+
+    for line in lines:
+        if date is None:
+            date = parse_date(line)
+
+        keyword = line_keyword(line)
+        if keyword:
+            match = _AMOUNT_TOKEN_RE.search(line)
+            if match and keyword != "payment":
+                # Later occurrences (e.g. a repeated total) overwrite earlier ones
+                value = parse_amount(match.group("price"), decimal_separator)
+                if keyword in ("tax", "service"):
+                    amounts[keyword] = amounts.get(keyword, 0.0) + value
+                else:
+                    amounts[keyword] = value
+            continue
+
+        match = _QTY_ITEM_RE.match(line)
+        if match is None:
+            match = _PLAIN_ITEM_RE.match(line)
+            # With decimal prices, a bare integer ("Store 1234") is not an item
+            if match and decimal_separator and not _FRACTION_RE.search(match.group("price")):
+                match = None
+        if match and "total" not in amounts:
+            items.append({
+                "name": match.group("name").strip(" .:-"),
+                "quantity": int(match.groupdict().get("qty") or 1),
+                "price": parse_amount(match.group("price"), decimal_separator),
+            })
+            continue
+
+        if not merchant and not items and _LETTERS_RE.search(line) and parse_date(line) is None:
+            merchant = line
+
+    items_sum = sum(item["price"] for item in items)
+    subtotal = amounts.get("subtotal", items_sum if items else None)
+    tax = amounts.get("tax", 0.0)
+    total = amounts.get("total")
+
+    checks = {
+        "has_items": bool(items),
+        "has_total": total is not None,
+        "has_merchant": bool(merchant),
+        "has_date": date is not None,
+    }
+    if items and "subtotal" in amounts:
+        checks["items_match_subtotal"] = amounts_agree(items_sum, amounts["subtotal"])
+    if total is not None and subtotal is not None:
+        expected_total = (
+            subtotal + tax + amounts.get("service", 0.0)
+            + amounts.get("rounding", 0.0) - abs(amounts.get("discount", 0.0))
+        )
+        checks["charges_match_total"] = amounts_agree(expected_total, total)
+
+    if not checks["has_items"] or not checks["has_total"]:
+        confidence = 0.0
+    else:
+        confidence = 0.3
+        if checks.get("items_match_subtotal", checks.get("charges_match_total")):
+            confidence += 0.3
+        if checks.get("charges_match_total"):
+            confidence += 0.3
+        if date and merchant:
+            confidence += 0.1
+        else:
+            confidence = min(confidence, _MISSING_FIELD_CONFIDENCE)
+
+    data = {
+        "merchant": merchant,
+        "date": date or "",
+        "items": items,
+        "subtotal": subtotal,
+        "tax": tax,
+        "total": total,
+    }
+    return LocalParseResult(data=data, confidence=round(confidence, 2), checks=checks)
@@ -0,0 +1,298 @@
+"""
+In-process metrics rendered in the Prometheus text exposition format
+
+Counters, gauges and histograms are plain dicts keyed by label values, so
+recording a sample costs a dict lookup and an addition. Values that other
+components already track (cache, governor, job queue) are copied in at
+scrape time rather than on every event.
+"""
+import asyncio
+import bisect
+import logging
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (1024, 16 * 1024, 64 * 1024, 256 * 1024, 1024 ** 2, 2 * 1024 ** 2, 5 * 1024 ** 2, 10 * 1024 ** 2)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    @abstractmethod
+    def render(self) -> List[str]:
+        """Exposition lines for every sample, without the header"""
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def set_total(self, value: float, **labels: str) -> None:
+        """Mirror a cumulative count maintained elsewhere"""
+        self._values[self._key(labels)] = value
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+                for key, value in self._values.items()]
+
+
+class Gauge(_Metric):
+    """Value that can go up and down"""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels: str) -> None:
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+                for key, value in self._values.items()]
+
+
+class Histogram(_Metric):
+    """Distribution of observations over fixed buckets"""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [per-bucket counts (non-cumulative) ..., +Inf count], sum
+        self._series: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = ([0] * (len(self.buckets) + 1), [0.0])
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1][0] += value
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """Observe the duration of the enclosed block (also when it raises)"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self) -> List[str]:
+        lines = []
+        for key, (counts, total) in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                labels = _format_labels(self.label_names, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total[0])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines += metric.header() + metric.render()
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+# Request and pipeline latency
+HTTP_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ("method", "route", "status")
+))
+HTTP_REQUESTS_IN_FLIGHT = REGISTRY.register(Gauge(
+    "http_requests_in_flight", "HTTP requests currently being served"
+))
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "receipt_stage_duration_seconds",
+    "Pipeline stage latency (upload_read, preprocess, ocr, local_parse, parse)",
+    ("stage",)
+))
+
+# Payload sizes
+UPLOAD_BYTES = REGISTRY.register(Histogram(
+    "receipt_upload_bytes", "Size of uploaded receipt images", buckets=SIZE_BUCKETS
+))
+OCR_PAYLOAD_BYTES = REGISTRY.register(Histogram(
+    "receipt_ocr_payload_bytes", "Size of images sent to OCR after preprocessing", buckets=SIZE_BUCKETS
+))
+
+# Upstream calls
+UPSTREAM_RESPONSES = REGISTRY.register(Counter(
+    "upstream_responses_total", "Mistral API responses by operation and status code", ("operation", "status")
+))
+UPSTREAM_SECONDS = REGISTRY.register(Histogram(
+    "upstream_request_duration_seconds", "Mistral API call latency per attempt", ("operation",)
+))
+UPSTREAM_HEDGES = REGISTRY.register(Counter(
+    "upstream_hedged_requests_total", "Slow Mistral API calls duplicated, by which call answered first", ("operation", "winner")
+))
+UPSTREAM_BREAKER_OPEN = REGISTRY.register(Gauge(
+    "upstream_circuit_open", "1 while the operation's circuit breaker is open or half-open", ("operation",)
+))
+DEGRADED_RESULTS = REGISTRY.register(Counter(
+    "receipt_degraded_results_total", "Partial results returned because a stage's upstream was unavailable", ("stage",)
+))
+UPSTREAM_IN_FLIGHT = REGISTRY.register(Gauge(
+    "upstream_requests_in_flight", "Mistral API calls currently in flight"
+))
+UPSTREAM_CONCURRENCY_LIMIT = REGISTRY.register(Gauge(
+    "upstream_concurrency_limit", "Current adaptive limit on concurrent Mistral API calls"
+))
+PARSE_TRUNCATIONS = REGISTRY.register(Counter(
+    "receipt_parse_truncations_total", "Parse replies cut off by the token cap, by recovery", ("recovery",)
+))
+
+# Caches and coalescing
+CACHE_LOOKUPS = REGISTRY.register(Counter(
+    "result_cache_lookups_total", "Result cache lookups by outcome", ("result",)
+))
+CACHE_HIT_RATIO = REGISTRY.register(Gauge(
+    "result_cache_hit_ratio", "Share of result cache lookups served from any tier"
+))
+CACHE_ENTRIES = REGISTRY.register(Gauge(
+    "result_cache_entries", "Entries in the in-memory cache tier"
+))
+NEAR_DUPLICATES = REGISTRY.register(Counter(
+    "near_duplicate_uploads_total", "Image uploads resembling an earlier one (flagged), and those whose OCR result was reused", ("outcome",)
+))
+SINGLE_FLIGHT_CALLS = REGISTRY.register(Counter(
+    "single_flight_calls_total", "Upstream calls started (leader) or joined (coalesced)", ("role",)
+))
+SINGLE_FLIGHT_IN_FLIGHT = REGISTRY.register(Gauge(
+    "single_flight_in_flight", "Distinct coalesced calls currently running"
+))
+JOBS_QUEUED = REGISTRY.register(Gauge(
+    "receipt_jobs_queued", "Background receipt jobs waiting for a worker"
+))
+
+# Admission control
+ADMISSION_DECISIONS = REGISTRY.register(Counter(
+    "admission_decisions_total",
+    "Receipts admitted at once, queued, shed as overload or refused for a full client queue",
+    ("priority", "outcome")
+))
+ADMISSION_WAIT_SECONDS = REGISTRY.register(Histogram(
+    "admission_queue_wait_seconds", "Time queued receipts waited for a processing slot", ("priority",)
+))
+ADMISSION_QUEUED = REGISTRY.register(Gauge(
+    "admission_queued", "Receipts waiting for a processing slot"
+))
+
+# Event loop health
+EVENT_LOOP_LAG = REGISTRY.register(Histogram(
+    "event_loop_lag_seconds", "Delay in waking a periodic timer on the event loop", buckets=LAG_BUCKETS
+))
+
+
+class LoopLagMonitor:
+    """Samples event-loop lag by measuring how late a periodic sleep wakes up"""
+
+    def __init__(self, interval: float = 0.5):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            EVENT_LOOP_LAG.observe(max(0.0, time.monotonic() - started - self.interval))
+
+
+# Global monitor instance
+_lag_monitor: Optional[LoopLagMonitor] = None
+
+
+def start_loop_lag_monitor() -> None:
+    global _lag_monitor
+    if _lag_monitor is None:
+        _lag_monitor = LoopLagMonitor()
+        _lag_monitor.start()
+
+
+async def stop_loop_lag_monitor() -> None:
+    global _lag_monitor
+    if _lag_monitor is not None:
+        await _lag_monitor.stop()
+        _lag_monitor = None
+
+
+def render_metrics() -> str:
+    """All registered metrics in the Prometheus text format"""
+    return REGISTRY.render()
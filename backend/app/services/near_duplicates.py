@@ -0,0 +1,156 @@
+"""
+Near-duplicate detection for receipt images
+
+Every image upload gets a 64-bit perceptual hash (dHash, see
+``preprocess.image_dhash``). Photos of the same paper receipt taken twice,
+re-encoded or slightly reframed differ in only a few bits, so the hashes of
+earlier uploads are kept in a multi-index hash table searched by Hamming
+distance, which answers in well under a millisecond at 100k entries. A new
+upload close to an earlier one is flagged as a probable duplicate expense.
+
+A small distance does not prove the receipts match: painting over the
+amounts moves the hash by only a few bits. OCR results are therefore only
+shared between uploads with the same SHA-256, unless
+``near_duplicate_reuse_distance`` is set.
+
+The index lives in process memory and fills up as receipts are OCR'd.
+"""
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from itertools import combinations
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from backend.app.core.settings import get_settings
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+if hasattr(int, "bit_count"):
+    def hamming_distance(a: int, b: int) -> int:
+        """Number of differing bits between two hashes"""
+        return (a ^ b).bit_count()
+else:  # Python < 3.10
+    def hamming_distance(a: int, b: int) -> int:
+        """Number of differing bits between two hashes"""
+        return bin(a ^ b).count("1")
+
+
+class MultiIndexHash:
+    """
+    Multi-index hashing over 64-bit hashes under Hamming distance
+
+    Each hash is split into ``blocks`` equal substrings, each with its own
+    lookup table. By pigeonhole, an entry within ``radius`` bits of the
+    query differs in at most ``radius // blocks`` bits on at least one
+    block, so a search only probes each table for the block values within
+    that many bits of the query's and checks the few candidates found.
+    Each table entry keeps the full hash, so candidates are checked without
+    a further lookup.
+    """
+
+    def __init__(self, bits: int = 64, blocks: int = 4):
+        self.blocks = blocks
+        self.block_bits = bits // blocks
+        self._block_mask = (1 << self.block_bits) - 1
+        self._tables: List[Dict[int, Dict[str, int]]] = [{} for _ in range(blocks)]
+        self._flips: Dict[int, List[int]] = {}
+
+    def _parts(self, value: int) -> List[int]:
+        return [(value >> (index * self.block_bits)) & self._block_mask for index in range(self.blocks)]
+
+    def _flip_masks(self, max_bits: int) -> List[int]:
+        """Every mask of at most ``max_bits`` set bits within one block"""
+        masks = self._flips.get(max_bits)
+        if masks is None:
+            masks = [
+                sum(1 << bit for bit in combination)
+                for count in range(max_bits + 1)
+                for combination in combinations(range(self.block_bits), count)
+            ]
+            self._flips[max_bits] = masks
+        return masks
+
+    def add(self, value: int, key: str) -> None:
+        for table, part in zip(self._tables, self._parts(value)):
+            table.setdefault(part, {})[key] = value
+
+    def remove(self, value: int, key: str) -> None:
+        for table, part in zip(self._tables, self._parts(value)):
+            keys = table.get(part)
+            if keys is not None:
+                keys.pop(key, None)
+                if not keys:
+                    del table[part]
+
+    def search(self, value: int, radius: int) -> Iterator[Tuple[int, str]]:
+        """(distance, key) of every entry within ``radius``, in no particular order"""
+        masks = self._flip_masks(radius // self.blocks)
+        seen = set()
+        for table, part in zip(self._tables, self._parts(value)):
+            for mask in masks:
+                entries = table.get(part ^ mask)
+                if not entries:
+                    continue
+                for key, candidate in entries.items():
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    distance = hamming_distance(value, candidate)
+                    if distance <= radius:
+                        yield distance, key
+
+
+@dataclass
+class DuplicateMatch:
+    """The closest earlier upload that looks like the same receipt"""
+    content_hash: str
+    distance: int
+
+
+class NearDuplicateIndex:
+    """Perceptual hashes of recent uploads, keyed by content hash, oldest evicted first"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max(1, max_entries)
+        self._table = MultiIndexHash()
+        self._hashes: "OrderedDict[str, int]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    def add(self, perceptual_hash: int, content_hash: str) -> None:
+        """Index an upload (a content hash is only indexed once)"""
+        if content_hash in self._hashes:
+            return
+        while len(self._hashes) >= self.max_entries:
+            oldest, oldest_hash = self._hashes.popitem(last=False)
+            self._table.remove(oldest_hash, oldest)
+        self._hashes[content_hash] = perceptual_hash
+        self._table.add(perceptual_hash, content_hash)
+
+    def nearest(self, perceptual_hash: int, max_distance: int) -> Optional[DuplicateMatch]:
+        """Closest indexed upload within ``max_distance`` bits, or None"""
+        if max_distance < 0:
+            return None
+        found = min(self._table.search(perceptual_hash, max_distance), default=None)
+        if found is None:
+            return None
+        distance, content_hash = found
+        return DuplicateMatch(content_hash=content_hash, distance=distance)
+
+
+# Global index instance
+_index: Optional[NearDuplicateIndex] = None
+
+
+def get_near_duplicate_index() -> Optional[NearDuplicateIndex]:
+    """Get the index singleton, or None when near-duplicate detection is disabled"""
+    global _index
+    settings = get_settings()
+    if not settings.near_duplicate_enabled:
+        return None
+    if _index is None:
+        _index = NearDuplicateIndex(settings.near_duplicate_max_entries)
+    return _index
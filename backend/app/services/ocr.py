@@ -1,103 +1,127 @@
 import base64
-import mimetypes
-import requests
-import os
+import json
+import httpx
 import logging
-from typing import Optional
-from core.settings import get_settings
+from typing import Any, AsyncIterator, Dict, List, Tuple
+from backend.app.core.settings import get_settings
+from backend.app.services.governor import get_governor
+from backend.app.services.http_client import get_http_client
+from backend.app.services.pdf import PDF_MIME_TYPE, join_pages
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
-def encode_image(image_path: str) -> str:
-    """Encode image to base64"""
-    try:
-        if not os.path.exists(image_path):
-            raise FileNotFoundError(f"Image file not found: {image_path}")
-            
-        with open(image_path, "rb") as f:
-            encoded = base64.b64encode(f.read()).decode("utf-8")
-            logger.info(f"Successfully encoded image: {image_path}")
-            return encoded
-            
-    except Exception as e:
-        logger.error(f"Failed to encode image {image_path}: {str(e)}")
-        raise
+OCR_MODEL = "mistral-ocr-2505"
+
+# Raw bytes per base64 chunk; a multiple of 3 so chunks concatenate without padding
+ENCODE_CHUNK_SIZE = 3 * 16 * 1024
+
+# Stands in for the data URL when a JSON envelope is split around the image
+DATA_URL_PLACEHOLDER = "__DATA_URL__"
+
+
+def ocr_document_type(mime_type: str) -> str:
+    """OCR document type for a MIME type: PDFs are documents, everything else an image"""
+    return "document_url" if mime_type == PDF_MIME_TYPE else "image_url"
+
+def build_ocr_document(url: str, document_type: str = "image_url") -> Dict[str, Any]:
+    """OCR request fields for one image or document, without the model"""
+    return {
+        "document": {
+            "type": document_type,
+            document_type: url
+        },
+        "include_image_base64": False
+    }
+
+def build_ocr_body(image: bytes, mime_type: str) -> Tuple[int, AsyncIterator[bytes]]:
+    """
+    Build a streamed OCR request body
 
-def get_mime_type(image_path: str) -> str:
-    """Get MIME type of image file"""
-    mime, _ = mimetypes.guess_type(image_path)
-    detected_type = mime or "image/jpeg"
-    logger.debug(f"Detected MIME type for {image_path}: {detected_type}")
-    return detected_type
+    The JSON envelope is split around the data URL so the image is base64
+    encoded chunk by chunk straight into the outgoing request instead of being
+    materialised as one large string inside the payload.
 
-def run_mistral_ocr(image_path: str) -> str:
+    Args:
+        image: Raw image (or PDF) bytes
+        mime_type: Sniffed MIME type of the image
+
+    Returns:
+        The exact body length and an async iterator over the body bytes
+    """
+    envelope = json.dumps({
+        "model": OCR_MODEL, **build_ocr_document(DATA_URL_PLACEHOLDER, ocr_document_type(mime_type))
+    })
+    prefix, suffix = envelope.split(DATA_URL_PLACEHOLDER)
+    prefix = f"{prefix}data:{mime_type};base64,".encode("utf-8")
+    suffix = suffix.encode("utf-8")
+    encoded_length = 4 * ((len(image) + 2) // 3)
+
+    async def body() -> AsyncIterator[bytes]:
+        yield prefix
+        view = memoryview(image)
+        for offset in range(0, len(view), ENCODE_CHUNK_SIZE):
+            yield base64.b64encode(view[offset:offset + ENCODE_CHUNK_SIZE])
+        yield suffix
+
+    return len(prefix) + encoded_length + len(suffix), body()
+
+def combine_pages(pages: List[Any]) -> str:
+    """Combine markdown from all pages of an OCR response, in order, with page breaks"""
+    markdown_texts = []
+    for page in pages:
+        if isinstance(page, dict) and "markdown" in page:
+            markdown_text = page.get("markdown", "")
+            if markdown_text:
+                markdown_texts.append(markdown_text)
+    return join_pages(markdown_texts)
+
+async def run_mistral_ocr(image: bytes, mime_type: str) -> str:
     """
-    Run Mistral OCR on the given image
+    Run Mistral OCR on the given image or PDF
     
     Args:
-        image_path: Path to the image file
+        image: Raw image or PDF bytes
+        mime_type: MIME type of the image (``application/pdf`` for PDFs)
         
     Returns:
         Extracted text in markdown format
         
     Raises:
-        FileNotFoundError: If image file doesn't exist
-        requests.RequestException: If API request fails
-        ValueError: If API response is invalid
+        ValueError: If API request fails or the response is invalid
     """
     settings = get_settings()  # Only call here, not at top level
     try:
         # Validate inputs
-        if not image_path:
-            raise ValueError("Image path cannot be empty")
-            
-        if not os.path.exists(image_path):
-            raise FileNotFoundError(f"Image file not found: {image_path}")
+        if not image:
+            raise ValueError("Image cannot be empty")
             
         if not settings.mistral_api_key:
             raise ValueError("Mistral API key not configured")
         
-        # Get file info
-        mime_type = get_mime_type(image_path)
-        image_b64 = encode_image(image_path)
-        
         # Prepare API request
-        ocr_url = "https://api.mistral.ai/v1/ocr"
-        
-        payload = {
-            "model": "mistral-ocr-2505",
-            "document": {
-                "type": "image_url",
-                "image_url": f"data:{mime_type};base64,{image_b64}"
-            },
-            "include_image_base64": False
-        }
+        ocr_url = "/v1/ocr"
+        client = get_http_client()
         
-        headers = {
-            "Authorization": f"Bearer {settings.mistral_api_key}",
-            "Content-Type": "application/json",
-            "User-Agent": "ReceiptScanner/1.0"
-        }
+        def send():
+            # The streamed body is single-use, so every attempt builds a fresh one
+            content_length, body = build_ocr_body(image, mime_type)
+            headers = {
+                "Content-Type": "application/json",
+                "Content-Length": str(content_length)
+            }
+            return client.post(ocr_url, headers=headers, content=body)
         
-        logger.info(f"Sending OCR request for image: {image_path}")
+        logger.info(f"Sending OCR request for {len(image)} byte {mime_type} image")
         
-        # Make API request with timeout
-        response = requests.post(
-            ocr_url, 
-            headers=headers, 
-            json=payload, 
-            timeout=30  # 30 second timeout
-        )
+        # Make API request on the shared pooled client, under the upstream governor
+        response = await get_governor().send("ocr", send)
         
         # Check response
         if response.status_code == 401:
             logger.error("Mistral API authentication failed")
             raise ValueError("Invalid Mistral API key")
-        elif response.status_code == 429:
-            logger.error("Mistral API rate limit exceeded")
-            raise ValueError("Rate limit exceeded. Please try again later.")
-        elif not response.ok:
+        elif not response.is_success:
             logger.error(f"Mistral API error: {response.status_code} - {response.text}")
             response.raise_for_status()
         
@@ -118,15 +142,7 @@ def run_mistral_ocr(image_path: str) -> str:
             logger.warning("No pages found in OCR response")
             return ""
         
-        # Combine markdown from all pages
-        markdown_texts = []
-        for page in pages:
-            if isinstance(page, dict) and "markdown" in page:
-                markdown_text = page.get("markdown", "")
-                if markdown_text:
-                    markdown_texts.append(markdown_text)
-        
-        combined_text = "\n\n".join(markdown_texts)
+        combined_text = combine_pages(pages)
         
         if not combined_text.strip():
             logger.warning("No text extracted from image")
@@ -135,13 +151,13 @@ def run_mistral_ocr(image_path: str) -> str:
         logger.info(f"Successfully extracted {len(combined_text)} characters from image")
         return combined_text
         
-    except requests.exceptions.Timeout:
+    except httpx.TimeoutException:
         logger.error("OCR request timed out")
         raise ValueError("OCR request timed out. Please try again.")
-    except requests.exceptions.ConnectionError:
+    except httpx.ConnectError:
         logger.error("Failed to connect to Mistral API")
         raise ValueError("Failed to connect to OCR service")
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         logger.error(f"OCR request failed: {str(e)}")
         raise ValueError(f"OCR request failed: {str(e)}")
     except Exception as e:
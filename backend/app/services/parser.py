@@ -1,32 +1,56 @@
-import requests
+import json
+import logging
+from typing import Any, Callable, Dict, Optional
+
+import httpx
+
 from backend.app.core.settings import get_settings
+from backend.app.services.governor import get_governor
+from backend.app.services.http_client import get_http_client
+from backend.app.services.json_stream import IncrementalJSONDecoder
+from backend.app.services.metrics import PARSE_TRUNCATIONS
 
+# Configure logging
+logger = logging.getLogger(__name__)
+
+PARSE_MODEL = "mistral-medium-2505"
+
+# Bump whenever SYSTEM_PROMPT or the request shape changes so cached parses are not reused
+PROMPT_VERSION = "3"
+
+SYSTEM_PROMPT = (
+    "You are a receipt parser. Extract merchant, date, items with names and prices, "
+    "subtotal, tax, and total. Return only JSON matching:\n"
+    "{\n"
+    '  "merchant": "string",\n'
+    '  "date": "YYYY-MM-DD",\n'
+    '  "items": [{"name":"string","price":float}],\n'
+    '  "subtotal": float,\n'
+    '  "tax": float,\n'
+    '  "total": float\n'
+    "}"
+)
+
+CHAT_URL = "/v1/chat/completions"
 
-def parse_receipt(markdown_text: str) -> str:
-    settings = get_settings()  # Only call here, not at top level
-    url = "https://api.mistral.ai/v1/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {settings.mistral_api_key}",
-        "Content-Type": "application/json"
-    }
 
+def build_parse_payload(markdown_text: str, stream: bool = False, prefix: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Chat completion request body for parsing one receipt
+
+    Args:
+        markdown_text: OCR output to parse
+        stream: Request server-sent event chunks
+        prefix: Reply received so far; the model continues it instead of
+            starting over (used after a truncated reply)
+    """
+    settings = get_settings()
     payload = {
-        "model": "mistral-medium-2505",
+        "model": PARSE_MODEL,
         "messages": [
             {
                 "role": "system",
-                "content": (
-                    "You are a receipt parser. Extract merchant, date, items with names and prices, "
-                    "subtotal, tax, and total. Return only JSON matching:\n"
-                    "{\n"
-                    '  "merchant": "string",\n'
-                    '  "date": "YYYY-MM-DD",\n'
-                    '  "items": [{"name":"string","price":float}],\n'
-                    '  "subtotal": float,\n'
-                    '  "tax": float,\n'
-                    '  "total": float\n'
-                    "}"
-                )
+                "content": SYSTEM_PROMPT
             },
             {
                 "role": "user",
@@ -34,9 +58,140 @@ def parse_receipt(markdown_text: str) -> str:
             }
         ],
         "temperature": 0.0,
-        "max_tokens": 512
+        "max_tokens": settings.parse_max_tokens
     }
+    if prefix:
+        # The prefix already pins the reply to the JSON being written
+        payload["messages"].append({"role": "assistant", "content": prefix, "prefix": True})
+    else:
+        payload["response_format"] = {"type": "json_object"}
+    if stream:
+        payload["stream"] = True
+    return payload
+
+
+def extract_receipt_json(content: str) -> Dict[str, Any]:
+    """
+    Decode the receipt JSON from a complete model reply
+
+    Raises:
+        ValueError: If the reply is not a JSON object
+    """
+    decoder = IncrementalJSONDecoder()
+    decoder.feed(content)
+    return decoder.result()
+
+
+class _PrefixEcho:
+    """
+    Drops the assistant prefix from the start of a continued reply
+
+    In prefix mode the API may send the reply back starting with the prefix
+    itself; that text is already in the decoder and must not be fed twice.
+    A reply that does not start with the prefix is passed through whole.
+    """
+
+    def __init__(self, prefix: str):
+        self.prefix: Optional[str] = prefix
+        self.held = ""
+
+    def strip(self, content: str) -> str:
+        if self.prefix is None:
+            return content
+        self.held += content
+        if len(self.held) < len(self.prefix) and self.prefix.startswith(self.held):
+            # Could still be the echo; wait for more
+            return ""
+        if self.held.startswith(self.prefix):
+            text = self.held[len(self.prefix):]
+        else:
+            text = self.held
+        self.prefix = None
+        self.held = ""
+        return text
+
+
+async def _stream_completion(
+    payload: Dict[str, Any],
+    decoder: IncrementalJSONDecoder,
+    on_item: Optional[Callable[[Dict[str, Any]], None]],
+    prefix: Optional[str] = None,
+) -> Optional[str]:
+    """
+    Stream one chat completion into the decoder
+
+    Args:
+        payload: Chat completion request body
+        decoder: Decoder holding the reply so far
+        on_item: Called with each line item as soon as it is complete
+        prefix: Assistant prefix the request continues, dropped from the
+            reply if the API echoes it
+
+    Returns:
+        The completion's finish reason ("stop", "length", ...)
+    """
+    client = get_http_client()
+    echo = _PrefixEcho(prefix) if prefix else None
+
+    async def consume(response: httpx.Response) -> Optional[str]:
+        if response.is_error:
+            await response.aread()
+            response.raise_for_status()
+
+        finish_reason = None
+        async for line in response.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                break
+            choice = json.loads(data)["choices"][0]
+            content = (choice.get("delta") or {}).get("content")
+            if content and echo is not None:
+                content = echo.strip(content)
+            if content:
+                for item in decoder.feed(content):
+                    if on_item:
+                        on_item(item)
+            finish_reason = choice.get("finish_reason") or finish_reason
+        return finish_reason
+
+    # The generation is read inside the governor's slot, so it counts against the caps
+    return await get_governor().stream(
+        "parse", lambda: client.send(client.build_request("POST", CHAT_URL, json=payload), stream=True), consume
+    )
+
+
+async def parse_receipt(
+    markdown_text: str,
+    on_item: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> Dict[str, Any]:
+    """
+    Parse OCR markdown into structured receipt data with the LLM
+
+    The reply is streamed in JSON mode and decoded as it arrives; ``on_item``
+    is called with each line item as soon as it is complete. If the reply
+    hits the token cap, the request is repeated with the partial reply as
+    an assistant prefix so generation resumes where it stopped, up to
+    ``parse_max_continuations`` times. A reply still truncated after that is
+    cut back to its last complete item.
+
+    Raises:
+        ValueError: If no usable JSON object is received
+        httpx.HTTPStatusError: If the API returns an error status
+    """
+    settings = get_settings()
+    decoder = IncrementalJSONDecoder()
+
+    for _ in range(settings.parse_max_continuations + 1):
+        prefix = decoder.text or None
+        payload = build_parse_payload(markdown_text, stream=True, prefix=prefix)
+        finish_reason = await _stream_completion(payload, decoder, on_item, prefix)
+        if finish_reason != "length" or decoder.complete:
+            return decoder.result()
+        logger.warning(f"Parse reply truncated after {len(decoder.text)} characters, continuing")
+        PARSE_TRUNCATIONS.inc(recovery="continued")
 
-    response = requests.post(url, headers=headers, json=payload)
-    response.raise_for_status()
-    return response.json()["choices"][0]["message"]["content"]
+    logger.warning(f"Parse reply still truncated after {settings.parse_max_continuations} continuations")
+    PARSE_TRUNCATIONS.inc(recovery="repaired")
+    return decoder.repair()
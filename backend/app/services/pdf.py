@@ -0,0 +1,70 @@
+"""
+Multi-page PDF handling
+
+Pages are split out of an uploaded PDF one at a time (each as its own
+single-page PDF) so they can be OCR'd in parallel, and page markdown is
+joined with a marker so the parse stage can work page by page. Splitting
+needs the optional ``pypdf`` package; without it the whole document is
+sent to OCR in one call.
+"""
+import importlib.util
+import io
+import logging
+import threading
+from typing import TYPE_CHECKING, List
+
+if TYPE_CHECKING:
+    from pypdf import PdfReader
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+PDF_MIME_TYPE = "application/pdf"
+
+PYPDF_AVAILABLE = importlib.util.find_spec("pypdf") is not None
+
+# Separates page markdown in the merged OCR text
+PAGE_BREAK = "\n\n<!-- page break -->\n\n"
+
+
+class PdfPages:
+    """
+    Lazy page splitter over an in-memory PDF
+
+    Only the document's cross-reference table is read up front; each page
+    is written out on request, so at most as many page copies exist as
+    there are callers holding one. pypdf is not thread-safe, so extraction
+    is serialised.
+    """
+
+    def __init__(self, data: bytes):
+        from pypdf import PdfReader
+        from pypdf.errors import PdfReadError
+
+        try:
+            self._reader: "PdfReader" = PdfReader(io.BytesIO(data))
+            self.count = len(self._reader.pages)
+        except (PdfReadError, ValueError) as e:
+            raise ValueError(f"Could not read PDF: {str(e)}")
+        self._lock = threading.Lock()
+
+    def page(self, index: int) -> bytes:
+        """One page as a standalone PDF"""
+        from pypdf import PdfWriter
+
+        with self._lock:
+            writer = PdfWriter()
+            writer.add_page(self._reader.pages[index])
+            buffer = io.BytesIO()
+            writer.write(buffer)
+        return buffer.getvalue()
+
+
+def join_pages(pages: List[str]) -> str:
+    """Merge page markdown in page order, dropping blank pages"""
+    return PAGE_BREAK.join(page.strip() for page in pages if page.strip())
+
+
+def split_pages(markdown_text: str) -> List[str]:
+    """Non-empty page markdown from merged OCR text (one entry for single-page text)"""
+    return [page.strip() for page in markdown_text.split(PAGE_BREAK.strip()) if page.strip()]
@@ -0,0 +1,508 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, TypeVar
+
+from fastapi import status
+
+from backend.app.core.settings import get_settings
+from backend.app.services.admission import AdmissionRejectedError, ClientQueueFullError, get_admission_controller
+from backend.app.services.breaker import OPEN, CircuitOpenError, get_breaker
+from backend.app.services.cache import get_result_cache, ocr_cache_key, parse_cache_key
+from backend.app.services.chunking import merge_chunk_results, merge_parsed, split_receipt
+from backend.app.services.coordinator import get_coordinator
+from backend.app.services.deadline import DeadlineExceededError, run_with_deadline
+from backend.app.services.governor import UpstreamRateLimitedError
+from backend.app.services.local_parser import parse_receipt_locally
+from backend.app.services.metrics import DEGRADED_RESULTS, NEAR_DUPLICATES, OCR_PAYLOAD_BYTES, STAGE_SECONDS
+from backend.app.services.near_duplicates import DuplicateMatch, get_near_duplicate_index
+from backend.app.services.ocr import run_mistral_ocr
+from backend.app.services.pdf import PDF_MIME_TYPE, PYPDF_AVAILABLE, PdfPages, join_pages, split_pages
+from backend.app.services.preprocess import perceptual_hash, preprocess_for_ocr
+from backend.app.services.parser import PARSE_MODEL, PROMPT_VERSION, parse_receipt
+from backend.app.services.singleflight import get_single_flight
+from backend.app.services.upload import ImageUpload
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+REQUIRED_FIELDS = ["merchant", "date", "total"]
+
+T = TypeVar("T")
+
+
+class ReceiptProcessingError(Exception):
+    """A pipeline failure carrying the HTTP status and client-facing detail"""
+
+    def __init__(self, status_code: int, detail: str, headers: Optional[Dict[str, str]] = None):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.headers = headers
+
+
+class UpstreamUnavailableError(ReceiptProcessingError):
+    """A stage was skipped because its upstream circuit breaker is open"""
+
+
+def _upstream_error(e: Exception) -> Optional[ReceiptProcessingError]:
+    """Map governor failures to 503/504 so clients can back off instead of seeing a 500"""
+    if isinstance(e, CircuitOpenError):
+        return UpstreamUnavailableError(
+            status.HTTP_503_SERVICE_UNAVAILABLE,
+            "Receipt processing is temporarily unavailable. Please try again later.",
+            headers={"Retry-After": str(max(1, int(e.retry_after)))}
+        )
+    if isinstance(e, UpstreamRateLimitedError):
+        retry_after = str(int(e.retry_after or 0) or 30)
+        return ReceiptProcessingError(
+            status.HTTP_503_SERVICE_UNAVAILABLE, str(e), headers={"Retry-After": retry_after}
+        )
+    if isinstance(e, DeadlineExceededError):
+        return ReceiptProcessingError(
+            status.HTTP_504_GATEWAY_TIMEOUT, "Receipt processing timed out. Please try again."
+        )
+    return None
+
+
+def _admission_error(e: AdmissionRejectedError) -> ReceiptProcessingError:
+    """Map a refused admission to 429 (this client's queue is full) or 503 (overloaded)"""
+    status_code = (
+        status.HTTP_429_TOO_MANY_REQUESTS if isinstance(e, ClientQueueFullError)
+        else status.HTTP_503_SERVICE_UNAVAILABLE
+    )
+    return ReceiptProcessingError(status_code, str(e), headers={"Retry-After": str(int(e.retry_after))})
+
+
+def check_admission(client: str, priority: str, deadline: float) -> None:
+    """
+    Refuse a receipt up front if it could not be admitted and processed before its deadline
+
+    Raises:
+        ReceiptProcessingError: 429 or 503 with Retry-After
+    """
+    controller = get_admission_controller()
+    if controller is None:
+        return
+    try:
+        controller.check(client, priority, deadline)
+    except AdmissionRejectedError as e:
+        raise _admission_error(e)
+
+
+@asynccontextmanager
+async def admitted(client: str, priority: str, deadline: Optional[float]) -> AsyncIterator[None]:
+    """
+    Hold one of the worker's receipt processing slots for the block
+
+    Slots are shared out fairly between clients, with interactive uploads
+    weighted above batch work (see ``admission``).
+
+    Args:
+        client: Client id from ``admission.client_id``
+        priority: ``admission.INTERACTIVE`` or ``admission.BATCH``
+        deadline: The receipt's deadline, or None for already-accepted
+            background work, which waits for a slot however long it takes
+
+    Raises:
+        ReceiptProcessingError: 429 or 503 with Retry-After if the receipt is
+            refused, 504 if the deadline passes while it waits
+    """
+    controller = get_admission_controller()
+    if controller is None:
+        yield
+        return
+    try:
+        granted_at = await controller.acquire(client, priority, deadline)
+    except AdmissionRejectedError as e:
+        raise _admission_error(e)
+    except DeadlineExceededError as e:
+        raise _upstream_error(e)
+    try:
+        yield
+    finally:
+        controller.release(granted_at)
+
+
+def _fail_fast(operation: str) -> None:
+    """
+    Refuse work up front while the operation's breaker is open
+
+    Raises:
+        UpstreamUnavailableError: If the breaker is open
+    """
+    breaker = get_breaker(operation)
+    if breaker and breaker.state == OPEN:
+        raise _upstream_error(CircuitOpenError(f"Upstream {operation} is unavailable", breaker.retry_after()))
+
+
+def _partial_result(markdown_text: str) -> Dict[str, Any]:
+    """
+    Best-effort receipt data for when the LLM parser is unavailable
+
+    The local parse is used if it found any items or a total, otherwise the
+    fields are left empty. Either way the OCR markdown is included and
+    ``partial`` is set, so clients can show the text and retry later.
+    """
+    data = parse_receipt_locally(markdown_text).data
+    if not data["items"] and data["total"] is None:
+        data = {"merchant": "", "date": "", "items": [], "subtotal": None, "tax": None, "total": None}
+    return {**data, "markdown": markdown_text, "partial": True}
+
+
+def request_deadline() -> float:
+    """Absolute time.monotonic() deadline for a receipt whose processing starts now"""
+    return time.monotonic() + get_settings().request_deadline_seconds
+
+
+async def within_deadline(aw: Awaitable[T], deadline: float) -> T:
+    """
+    Await a pipeline stage under the receipt's end-to-end deadline
+
+    Upstream calls made by the stage are bounded by the time left rather
+    than their own timeouts, and the stage is cancelled once the deadline
+    passes.
+
+    Raises:
+        ReceiptProcessingError: 504 if the deadline expires first
+    """
+    try:
+        return await run_with_deadline(aw, deadline)
+    except DeadlineExceededError as e:
+        raise _upstream_error(e)
+
+
+async def _gather_all(aws: Iterable[Awaitable[T]]) -> List[T]:
+    """Await all in order; if one fails, cancel the rest instead of letting them run on"""
+    tasks = [asyncio.ensure_future(aw) for aw in aws]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+async def _across_workers(key: str, fn: Callable[[], Awaitable[T]]) -> T:
+    """Run an upstream call in one worker process per key; the others reuse its cached result"""
+    coordinator = get_coordinator()
+    cache = get_result_cache()
+    if coordinator is None or cache is None:
+        return await fn()
+    return await coordinator.run_once(
+        key, fn, lambda: cache.get_shared(key), get_settings().coordinator_claim_ttl
+    )
+
+
+async def _ocr_pdf(upload: ImageUpload) -> str:
+    """
+    OCR a PDF page by page, ``pdf_page_concurrency`` pages at a time
+
+    Each page is split out just before its OCR call, so only the pages in
+    flight exist as separate copies, and the document takes about as long
+    as its slowest page rather than the sum of all pages. Without pypdf
+    the whole document goes to OCR in one call.
+
+    Raises:
+        ReceiptProcessingError: If the PDF is unreadable or has too many pages
+    """
+    settings = get_settings()
+    if not PYPDF_AVAILABLE:
+        upload.ocr_payload_size = upload.size
+        OCR_PAYLOAD_BYTES.observe(upload.size)
+        return await run_mistral_ocr(bytes(upload.data), PDF_MIME_TYPE)
+
+    try:
+        pages = await asyncio.to_thread(PdfPages, bytes(upload.data))
+    except ValueError as e:
+        raise ReceiptProcessingError(status.HTTP_400_BAD_REQUEST, str(e))
+    if pages.count > settings.pdf_max_pages:
+        raise ReceiptProcessingError(
+            status.HTTP_400_BAD_REQUEST,
+            f"PDF has {pages.count} pages. Maximum: {settings.pdf_max_pages}"
+        )
+
+    semaphore = asyncio.Semaphore(settings.pdf_page_concurrency)
+    upload.ocr_payload_size = 0
+
+    async def ocr_page(index: int) -> str:
+        async with semaphore:
+            page = await asyncio.to_thread(pages.page, index)
+            upload.ocr_payload_size += len(page)
+            OCR_PAYLOAD_BYTES.observe(len(page))
+            return await run_mistral_ocr(page, PDF_MIME_TYPE)
+
+    logger.info(f"Starting OCR processing for {pages.count} PDF pages")
+    return join_pages(await _gather_all(ocr_page(index) for index in range(pages.count)))
+
+
+async def _ocr_upload(upload: ImageUpload, key: str) -> str:
+    """Preprocess and OCR an upload, then cache the markdown"""
+    try:
+        if upload.mime_type == PDF_MIME_TYPE:
+            with STAGE_SECONDS.time(stage="ocr"):
+                markdown_text = await _ocr_pdf(upload)
+        else:
+            with STAGE_SECONDS.time(stage="preprocess"):
+                image, mime_type = await preprocess_for_ocr(upload.data, upload.mime_type)
+            upload.ocr_payload_size = len(image)
+            OCR_PAYLOAD_BYTES.observe(len(image))
+            logger.info("Starting OCR processing")
+            with STAGE_SECONDS.time(stage="ocr"):
+                markdown_text = await run_mistral_ocr(image, mime_type)
+    except ReceiptProcessingError:
+        raise
+    except Exception as e:
+        logger.error(f"OCR processing failed: {str(e)}")
+        raise _upstream_error(e) or ReceiptProcessingError(
+            status.HTTP_500_INTERNAL_SERVER_ERROR,
+            "Failed to process image with OCR"
+        )
+
+    if not markdown_text or not markdown_text.strip():
+        raise ReceiptProcessingError(
+            status.HTTP_400_BAD_REQUEST,
+            "Could not extract text from image. Please ensure the image is clear and contains a receipt."
+        )
+
+    cache = get_result_cache()
+    if cache:
+        await cache.set(key, markdown_text)
+    return markdown_text
+
+
+async def _match_near_duplicate(upload: ImageUpload) -> Optional[DuplicateMatch]:
+    """
+    Hash an image upload and look up the closest earlier upload
+
+    Sets ``upload.perceptual_hash`` and, within ``near_duplicate_flag_distance``
+    bits, ``upload.duplicate_of`` (an identical re-upload matches itself at
+    distance 0). PDFs are not hashed.
+    """
+    index = get_near_duplicate_index()
+    if index is None or upload.mime_type == PDF_MIME_TYPE:
+        return None
+    with STAGE_SECONDS.time(stage="perceptual_hash"):
+        upload.perceptual_hash = await perceptual_hash(upload.data)
+    if upload.perceptual_hash is None:
+        return None
+    upload.duplicate_of = index.nearest(upload.perceptual_hash, get_settings().near_duplicate_flag_distance)
+    if upload.duplicate_of is not None:
+        logger.info(
+            f"Image {upload.sha256[:12]} looks like {upload.duplicate_of.content_hash[:12]} "
+            f"({upload.duplicate_of.distance} bits apart)"
+        )
+        NEAR_DUPLICATES.inc(outcome="flagged")
+    return upload.duplicate_of
+
+
+def _index_upload(upload: ImageUpload) -> None:
+    """Add an OCR'd image to the near-duplicate index"""
+    index = get_near_duplicate_index()
+    if index is not None and upload.perceptual_hash is not None:
+        index.add(upload.perceptual_hash, upload.sha256)
+
+
+def _reuses_ocr(match: Optional[DuplicateMatch]) -> bool:
+    """
+    Whether a near-duplicate's OCR result may stand in for this image's
+
+    Perceptually close is not the same receipt: an edited amount moves the
+    dHash by only a few bits, so reuse is off unless explicitly configured.
+    """
+    reuse_distance = get_settings().near_duplicate_reuse_distance
+    return match is not None and reuse_distance >= 0 and match.distance <= reuse_distance
+
+
+async def run_ocr_stage(upload: ImageUpload) -> str:
+    """
+    OCR an in-memory image or PDF, served from cache when it was seen before
+
+    PDF pages are OCR'd in parallel and their markdown joined in page order.
+
+    Concurrent requests for the same image share one in-flight OCR call,
+    also across worker processes when a coordinator is configured. Images
+    resembling an earlier one are flagged through ``upload.duplicate_of``;
+    their OCR result is only reused when ``near_duplicate_reuse_distance``
+    is set (off by default). While the OCR circuit breaker is open,
+    uncached images fail at once.
+
+    Raises:
+        ReceiptProcessingError: If OCR fails or yields no text
+        UpstreamUnavailableError: If the OCR breaker is open
+    """
+    cache = get_result_cache()
+    key = ocr_cache_key(upload.sha256)
+    match = await _match_near_duplicate(upload)
+
+    markdown_text = await cache.get(key) if cache else None
+    if markdown_text is not None:
+        logger.info(f"OCR cache hit for image {upload.sha256[:12]}")
+        _index_upload(upload)
+        return markdown_text
+
+    if cache and _reuses_ocr(match):
+        markdown_text = await cache.get(ocr_cache_key(match.content_hash))
+        if markdown_text is not None:
+            logger.info(f"Reusing OCR result of near-duplicate image {match.content_hash[:12]}")
+            NEAR_DUPLICATES.inc(outcome="reused")
+            _index_upload(upload)
+            return markdown_text
+
+    _fail_fast("ocr")
+    markdown_text = await get_single_flight().do(
+        key, lambda: _across_workers(key, lambda: _ocr_upload(upload, key))
+    )
+    _index_upload(upload)
+    return markdown_text
+
+
+async def _parse_markdown(
+    markdown_text: str, key: str, on_item: Optional[Callable[[Dict[str, Any]], None]] = None
+) -> Dict[str, Any]:
+    """Parse markdown with the LLM, then cache the structured data"""
+    try:
+        logger.info("Starting receipt parsing")
+        with STAGE_SECONDS.time(stage="parse"):
+            structured_data = await parse_receipt(markdown_text, on_item)
+    except Exception as e:
+        logger.error(f"Receipt parsing failed: {str(e)}")
+        raise _upstream_error(e) or ReceiptProcessingError(
+            status.HTTP_500_INTERNAL_SERVER_ERROR,
+            "Failed to parse receipt data"
+        )
+
+    cache = get_result_cache()
+    if cache:
+        await cache.set(key, structured_data)
+    return structured_data
+
+
+async def _parse_with_llm(
+    markdown_text: str, on_item: Optional[Callable[[Dict[str, Any]], None]] = None
+) -> Dict[str, Any]:
+    """Parse with the LLM, served from cache and coalesced with identical in-flight parses"""
+    cache = get_result_cache()
+    key = parse_cache_key(markdown_text, PARSE_MODEL, PROMPT_VERSION)
+
+    structured_data = await cache.get(key) if cache else None
+    if structured_data is not None:
+        logger.info("Parse cache hit")
+        return structured_data
+
+    return await get_single_flight().do(
+        key, lambda: _across_workers(key, lambda: _parse_markdown(markdown_text, key, on_item))
+    )
+
+
+async def _parse_document(
+    markdown_text: str, on_item: Optional[Callable[[Dict[str, Any]], None]] = None
+) -> Dict[str, Any]:
+    """
+    Parse one page of markdown with the LLM, compacted and chunked when long
+
+    Long receipts are parsed as overlapping chunks of ``parse_chunk_lines``
+    item lines, concurrently, then merged and reconciled with the totals.
+    Items from chunked parses are passed to ``on_item`` once merged.
+    """
+    settings = get_settings()
+    chunks = split_receipt(markdown_text, settings.parse_chunk_lines, settings.parse_chunk_overlap)
+    if len(chunks.texts) == 1:
+        return await _parse_with_llm(chunks.texts[0], on_item)
+
+    semaphore = asyncio.Semaphore(settings.parse_chunk_concurrency)
+
+    async def parse_chunk(text: str) -> Dict[str, Any]:
+        async with semaphore:
+            return await _parse_with_llm(text)
+
+    logger.info(f"Parsing long receipt in {len(chunks.texts)} chunks")
+    results = await _gather_all(parse_chunk(text) for text in chunks.texts)
+    merged = merge_chunk_results(results, settings.parse_chunk_overlap, chunks.totals)
+    if on_item:
+        for item in merged["items"]:
+            on_item(item)
+    return merged
+
+
+async def _parse_pages(
+    pages: List[str], on_item: Optional[Callable[[Dict[str, Any]], None]] = None
+) -> Dict[str, Any]:
+    """Parse the pages of a multi-page document concurrently and merge the results"""
+    semaphore = asyncio.Semaphore(get_settings().pdf_page_concurrency)
+
+    async def parse_page(page: str) -> Dict[str, Any]:
+        async with semaphore:
+            return await _parse_document(page, on_item)
+
+    logger.info(f"Parsing {len(pages)} pages")
+    # Merchant and date come from the first page that has them, totals from the last
+    return merge_parsed(await _gather_all(parse_page(page) for page in pages))
+
+
+async def run_parse_stage(
+    markdown_text: str, on_item: Optional[Callable[[Dict[str, Any]], None]] = None
+) -> Dict[str, Any]:
+    """
+    Turn OCR markdown into structured receipt data
+
+    The rule-based local parser runs first; the LLM (cached per model and
+    prompt) is only called when the local result fails its arithmetic checks.
+    The LLM gets compacted markdown; multi-page markdown is parsed page by
+    page and long pages chunk by chunk, concurrently, and merged.
+    Concurrent parses of the same markdown share one in-flight LLM call.
+    ``on_item`` receives line items as the LLM streams them (for multi-page
+    documents, in the order pages finish); only the caller that starts the
+    call sees them, others just get the final result.
+
+    While the parse circuit breaker is open, a partial result (see
+    ``_partial_result``) is returned instead, unless
+    ``breaker_degraded_results`` is off.
+
+    Raises:
+        ReceiptProcessingError: If the parser fails or returns no JSON
+    """
+    settings = get_settings()
+    if settings.local_parser_enabled:
+        with STAGE_SECONDS.time(stage="local_parse"):
+            local = parse_receipt_locally(markdown_text)
+        if local.confidence >= settings.local_parser_min_confidence:
+            logger.info(f"Parsed receipt locally (confidence {local.confidence})")
+            return local.data
+        logger.info(f"Local parse not trusted (confidence {local.confidence}, checks {local.checks})")
+
+    try:
+        pages = split_pages(markdown_text)
+        if len(pages) > 1:
+            return await _parse_pages(pages, on_item)
+        return await _parse_document(markdown_text, on_item)
+    except UpstreamUnavailableError:
+        if not settings.breaker_degraded_results:
+            raise
+        logger.warning("Parser unavailable, returning a partial result")
+        DEGRADED_RESULTS.inc(stage="parse")
+        return _partial_result(markdown_text)
+
+
+async def process_receipt(upload: ImageUpload) -> Dict[str, Any]:
+    """
+    Run the full OCR -> parse pipeline for one upload
+
+    Returns:
+        Structured receipt data (merchant, date, total, items, ...)
+
+    Raises:
+        ReceiptProcessingError: If any stage fails
+    """
+    markdown_text = await run_ocr_stage(upload)
+    structured_data = await run_parse_stage(markdown_text)
+
+    # Validate required fields in response
+    missing_fields = [field for field in REQUIRED_FIELDS if field not in structured_data]
+    if missing_fields:
+        logger.warning(f"Missing required fields: {missing_fields}")
+        # Don't fail, but log the issue
+
+    return structured_data
@@ -0,0 +1,231 @@
+import asyncio
+import importlib.util
+import io
+import logging
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Optional, Tuple
+
+from backend.app.core.settings import get_settings
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+if TYPE_CHECKING:
+    from concurrent.futures import ProcessPoolExecutor
+
+    from PIL import Image
+
+# Pillow is optional (without it images are sent as-is) and is only imported
+# inside the worker processes, keeping it out of the web process's startup
+PILLOW_AVAILABLE = importlib.util.find_spec("PIL") is not None
+
+# Auto-crop analyses a thumbnail of this size instead of the full image
+_CROP_ANALYSIS_SIZE = 256
+# Only crop when the detected paper covers a plausible share of the frame
+_CROP_MIN_AREA = 0.2
+_CROP_MAX_AREA = 0.95
+_CROP_MARGIN = 0.02
+# dHash compares neighbouring pixels of a (size + 1) x size grayscale thumbnail
+_DHASH_SIZE = 8
+
+
+@dataclass
+class PreprocessOptions:
+    """Picklable preprocessing settings passed to pool workers"""
+    max_dimension: int
+    jpeg_quality: int
+    grayscale: bool
+    autocrop: bool
+
+
+def _receipt_bbox(image: "Image.Image") -> Optional[Tuple[int, int, int, int]]:
+    """Bounding box of the bright paper area, or None if it is not distinct"""
+    from PIL import ImageOps
+
+    thumb = ImageOps.autocontrast(image.convert("L"))
+    thumb.thumbnail((_CROP_ANALYSIS_SIZE, _CROP_ANALYSIS_SIZE))
+    histogram = thumb.histogram()
+    pixels = sum(histogram)
+
+    # Paper is the bright mass: threshold at the mean brightness
+    mean = sum(level * count for level, count in enumerate(histogram)) / pixels
+    bbox = thumb.point(lambda level: 255 if level > mean else 0).getbbox()
+    if bbox is None:
+        return None
+
+    left, top, right, bottom = bbox
+    area = (right - left) * (bottom - top) / (thumb.width * thumb.height)
+    if not _CROP_MIN_AREA <= area <= _CROP_MAX_AREA:
+        return None
+
+    scale_x = image.width / thumb.width
+    scale_y = image.height / thumb.height
+    margin_x = image.width * _CROP_MARGIN
+    margin_y = image.height * _CROP_MARGIN
+    return (
+        max(0, int(left * scale_x - margin_x)),
+        max(0, int(top * scale_y - margin_y)),
+        min(image.width, int(right * scale_x + margin_x)),
+        min(image.height, int(bottom * scale_y + margin_y)),
+    )
+
+
+def preprocess_image(data: bytes, mime_type: str, options: PreprocessOptions) -> Tuple[bytes, str]:
+    """
+    Shrink a receipt photo for OCR
+
+    Applies EXIF orientation, crops to the receipt, downscales to
+    ``max_dimension``, optionally converts to grayscale and re-encodes as
+    JPEG. Runs in a worker process; returns the original bytes when the
+    result would not be smaller.
+
+    Returns:
+        The image bytes and their MIME type
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(data)) as original:
+        image = ImageOps.exif_transpose(original)
+
+        if options.autocrop:
+            bbox = _receipt_bbox(image)
+            if bbox:
+                image = image.crop(bbox)
+
+        if max(image.size) > options.max_dimension:
+            image.thumbnail((options.max_dimension, options.max_dimension), Image.LANCZOS)
+
+        image = image.convert("L" if options.grayscale else "RGB")
+
+        output = io.BytesIO()
+        image.save(output, format="JPEG", quality=options.jpeg_quality, optimize=True)
+
+    processed = output.getvalue()
+    if len(processed) >= len(data):
+        return bytes(data), mime_type
+    return processed, "image/jpeg"
+
+
+def image_dhash(data: bytes, autocrop: bool) -> int:
+    """
+    64-bit difference hash (dHash) of an image
+
+    Each bit records whether a pixel of a 9x8 grayscale thumbnail is
+    brighter than its right-hand neighbour, so the hash survives
+    re-encoding, rescaling and small changes in framing or exposure. With
+    ``autocrop`` the receipt is cropped out first, as for OCR, so the
+    background around it does not count. Runs in a worker process.
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(data)) as original:
+        # JPEGs can be decoded straight at a fraction of their size
+        original.draft("L", (_CROP_ANALYSIS_SIZE * 2, _CROP_ANALYSIS_SIZE * 2))
+        image = ImageOps.exif_transpose(original)
+        if autocrop:
+            bbox = _receipt_bbox(image)
+            if bbox:
+                image = image.crop(bbox)
+        thumb = image.convert("L").resize((_DHASH_SIZE + 1, _DHASH_SIZE), Image.LANCZOS)
+
+    pixels = list(thumb.getdata())
+    value = 0
+    for row in range(_DHASH_SIZE):
+        for col in range(_DHASH_SIZE):
+            offset = row * (_DHASH_SIZE + 1) + col
+            value = (value << 1) | (pixels[offset] > pixels[offset + 1])
+    return value
+
+
+# Process pool for CPU-bound image work, shared for the app lifetime
+_pool: Optional["ProcessPoolExecutor"] = None
+
+
+def start_preprocess_pool() -> Optional["ProcessPoolExecutor"]:
+    """Create the worker pool when preprocessing is enabled and Pillow is installed"""
+    global _pool
+    settings = get_settings()
+    if _pool is None and settings.preprocess_enabled:
+        if not PILLOW_AVAILABLE:
+            logger.warning("Image preprocessing enabled but Pillow is not installed, skipping it")
+            return None
+        from concurrent.futures import ProcessPoolExecutor
+
+        _pool = ProcessPoolExecutor(max_workers=settings.preprocess_workers)
+    return _pool
+
+
+def _load_pillow() -> None:
+    """Import Pillow in a worker so the first real image does not pay for it"""
+    from PIL import Image, ImageOps  # noqa: F401
+
+
+async def warm_preprocess_pool() -> None:
+    """Spawn every pool worker and load Pillow in it"""
+    pool = start_preprocess_pool()
+    if pool is None:
+        return
+    loop = asyncio.get_running_loop()
+    await asyncio.gather(*(
+        loop.run_in_executor(pool, _load_pillow) for _ in range(get_settings().preprocess_workers)
+    ))
+
+
+def stop_preprocess_pool() -> None:
+    """Shut the worker pool down"""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+async def preprocess_for_ocr(data: bytes, mime_type: str) -> Tuple[bytes, str]:
+    """
+    Preprocess an image off the event loop
+
+    Falls back to the original bytes if preprocessing is disabled,
+    unavailable or fails.
+    """
+    settings = get_settings()
+    pool = start_preprocess_pool()
+    if pool is None:
+        return data, mime_type
+
+    options = PreprocessOptions(
+        max_dimension=settings.preprocess_max_dimension,
+        jpeg_quality=settings.preprocess_jpeg_quality,
+        grayscale=settings.preprocess_grayscale,
+        autocrop=settings.preprocess_autocrop,
+    )
+    try:
+        loop = asyncio.get_running_loop()
+        processed, processed_type = await loop.run_in_executor(
+            pool, preprocess_image, bytes(data), mime_type, options
+        )
+    except Exception as e:
+        logger.warning(f"Image preprocessing failed, sending original: {str(e)}")
+        return data, mime_type
+
+    logger.info(f"Preprocessed image: {len(data)} -> {len(processed)} bytes")
+    return processed, processed_type
+
+
+async def perceptual_hash(data: bytes) -> Optional[int]:
+    """
+    dHash of an image off the event loop (in the preprocessing pool if it runs)
+
+    Returns:
+        The hash, or None if Pillow is missing or the image cannot be decoded
+    """
+    if not PILLOW_AVAILABLE:
+        return None
+    pool = start_preprocess_pool()
+    autocrop = get_settings().preprocess_autocrop
+    try:
+        if pool is None:
+            return await asyncio.to_thread(image_dhash, bytes(data), autocrop)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(pool, image_dhash, bytes(data), autocrop)
+    except Exception as e:
+        logger.warning(f"Perceptual hashing failed: {str(e)}")
+        return None
@@ -0,0 +1,425 @@
+"""
+Resumable chunked uploads (tus-style, offset-based PATCH)
+
+A client announces the upload's total length, then sends the bytes in any
+number of PATCH requests, each starting at the offset the server reports.
+When a connection drops, the bytes that arrived are kept; the client asks
+for the current offset and sends the rest.
+
+Chunks are appended to a spool file, so every worker process sees the same
+upload. Work that can run before the last byte arrives does: the type is
+sniffed as soon as the first bytes land (and bad uploads are rejected
+then), and the SHA-256 is updated as each chunk is written. Chunks may
+carry a checksum (``Upload-Checksum``) and the whole file an expected
+SHA-256, both verified before the data is accepted.
+"""
+import asyncio
+import base64
+import binascii
+import hashlib
+import json
+import logging
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+from backend.app.core.settings import get_settings
+from backend.app.services.upload import ImageUpload, UnsupportedFileTypeError, UploadTooLargeError, sniff_image_type
+
+try:
+    import fcntl
+except ImportError:  # Windows: uploads are only locked within a process
+    fcntl = None
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Checksum algorithms accepted in Upload-Checksum
+CHECKSUM_ALGORITHMS = ("md5", "sha1", "sha256")
+
+# Seconds between sweeps for expired uploads
+_SWEEP_INTERVAL = 60.0
+
+_HASH_READ_SIZE = 1024 * 1024
+
+
+class UploadNotFoundError(Exception):
+    """No upload with this id (never created, expired or already processed and removed)"""
+
+
+class UploadOffsetMismatchError(Exception):
+    """A chunk was sent for an offset other than the upload's current one"""
+
+    def __init__(self, message: str, offset: int):
+        super().__init__(message)
+        self.offset = offset
+
+
+class UploadBusyError(Exception):
+    """Another request is still writing to this upload"""
+
+
+class ChecksumMismatchError(ValueError):
+    """A chunk or the assembled file does not match the checksum sent with it"""
+
+
+@dataclass
+class ResumableUpload:
+    """State of one resumable upload, persisted next to its spool file"""
+    id: str
+    length: int
+    filename: str
+    created_at: float
+    expires_at: float
+    offset: int = 0
+    mime_type: Optional[str] = None
+    # Expected SHA-256 of the whole file (hex), if the client sent one
+    sha256: Optional[str] = None
+    # Background job processing the finished upload
+    job_id: Optional[str] = None
+
+    @property
+    def complete(self) -> bool:
+        return self.offset >= self.length
+
+
+def parse_upload_metadata(header: Optional[str]) -> Dict[str, str]:
+    """
+    Decode a tus Upload-Metadata header ("key base64value,key2 base64value2")
+
+    Raises:
+        ValueError: If a value is not valid base64 or UTF-8
+    """
+    metadata = {}
+    for pair in (header or "").split(","):
+        parts = pair.strip().split(" ")
+        if not parts[0]:
+            continue
+        try:
+            metadata[parts[0]] = base64.b64decode(parts[1], validate=True).decode("utf-8") if len(parts) > 1 else ""
+        except (binascii.Error, UnicodeDecodeError):
+            raise ValueError(f"Invalid Upload-Metadata value for {parts[0]!r}")
+    return metadata
+
+
+def parse_checksum(header: Optional[str]) -> Optional[Tuple[str, bytes]]:
+    """
+    Decode an Upload-Checksum header ("sha256 <base64 digest>")
+
+    Raises:
+        ValueError: If the algorithm is not supported or the digest is not base64
+    """
+    if not header:
+        return None
+    algorithm, _, digest = header.strip().partition(" ")
+    algorithm = algorithm.lower()
+    if algorithm not in CHECKSUM_ALGORITHMS:
+        raise ValueError(f"Unsupported checksum algorithm. Supported: {', '.join(CHECKSUM_ALGORITHMS)}")
+    try:
+        return algorithm, base64.b64decode(digest.strip(), validate=True)
+    except binascii.Error:
+        raise ValueError("Invalid Upload-Checksum digest")
+
+
+class ResumableUploadStore:
+    """
+    Spool directory of in-progress uploads
+
+    Each upload is a ``<id>.part`` data file, whose size is the upload
+    offset, plus a ``<id>.json`` state file. Writes to one upload are
+    serialised by an exclusive file lock, so concurrent PATCHes from any
+    worker are refused rather than interleaved.
+    """
+
+    def __init__(self, spool_dir: str, ttl: float, max_size: int, allowed_types: List[str]):
+        self.spool_dir = spool_dir
+        self.ttl = ttl
+        self.max_size = max_size
+        self.allowed_types = allowed_types
+        os.makedirs(spool_dir, exist_ok=True)
+        # Running SHA-256 per upload written by this process, with the offset it covers
+        self._hashers: Dict[str, Tuple[int, Any]] = {}
+        self._last_sweep = 0.0
+
+    def _path(self, upload_id: str, suffix: str) -> str:
+        # Ids are generated here; anything else cannot name a file in the spool
+        if not upload_id.isalnum():
+            raise UploadNotFoundError("Upload not found")
+        return os.path.join(self.spool_dir, f"{upload_id}{suffix}")
+
+    def _save(self, upload: ResumableUpload) -> None:
+        path = self._path(upload.id, ".json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(asdict(upload), f)
+        os.replace(path + ".tmp", path)
+
+    def _load(self, upload_id: str) -> ResumableUpload:
+        try:
+            with open(self._path(upload_id, ".json")) as f:
+                upload = ResumableUpload(**json.load(f))
+        except FileNotFoundError:
+            raise UploadNotFoundError("Upload not found")
+        if upload.expires_at < time.time():
+            self._remove(upload_id)
+            raise UploadNotFoundError("Upload not found")
+        if upload.job_id is None:
+            try:
+                upload.offset = os.path.getsize(self._path(upload_id, ".part"))
+            except FileNotFoundError:
+                upload.offset = 0
+        return upload
+
+    def _remove(self, upload_id: str, keep_state: bool = False) -> None:
+        self._hashers.pop(upload_id, None)
+        suffixes = (".part",) if keep_state else (".part", ".json")
+        for suffix in suffixes:
+            try:
+                os.remove(self._path(upload_id, suffix))
+            except FileNotFoundError:
+                pass
+
+    @contextmanager
+    def _locked(self, upload_id: str) -> Iterator[Any]:
+        """Open the spool file for appending under an exclusive, non-blocking lock"""
+        with open(self._path(upload_id, ".part"), "ab") as f:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    raise UploadBusyError("Upload is busy with another request")
+            yield f
+
+    def _sweep(self) -> None:
+        """Delete expired uploads"""
+        now = time.time()
+        if now - self._last_sweep < _SWEEP_INTERVAL:
+            return
+        self._last_sweep = now
+        for name in os.listdir(self.spool_dir):
+            if name.endswith(".json"):
+                try:
+                    self._load(name[:-len(".json")])
+                except (UploadNotFoundError, OSError, ValueError, TypeError):
+                    pass
+
+    def create(self, length: int, filename: str, sha256: Optional[str] = None) -> ResumableUpload:
+        """
+        Start an upload of ``length`` bytes
+
+        Raises:
+            UploadTooLargeError: If length exceeds the upload size limit
+            ValueError: If length is not positive or sha256 is not a hex digest
+        """
+        if length <= 0:
+            raise ValueError("Upload-Length must be a positive integer")
+        if length > self.max_size:
+            raise UploadTooLargeError(f"File too large. Maximum size: {self.max_size} bytes")
+        if sha256 is not None and (len(sha256) != 64 or any(c not in "0123456789abcdef" for c in sha256.lower())):
+            raise ValueError("sha256 metadata must be a hex SHA-256 digest")
+        self._sweep()
+        now = time.time()
+        upload = ResumableUpload(
+            id=uuid.uuid4().hex,
+            length=length,
+            filename=filename,
+            created_at=now,
+            expires_at=now + self.ttl,
+            sha256=sha256.lower() if sha256 else None,
+        )
+        open(self._path(upload.id, ".part"), "wb").close()
+        self._save(upload)
+        return upload
+
+    def status(self, upload_id: str) -> ResumableUpload:
+        """
+        Current state of an upload
+
+        Raises:
+            UploadNotFoundError: If there is no such upload
+        """
+        return self._load(upload_id)
+
+    def _hasher(self, upload_id: str, offset: int) -> Any:
+        """Running SHA-256 covering the first ``offset`` bytes, caught up from the spool if needed"""
+        cached = self._hashers.get(upload_id)
+        if cached is not None and cached[0] == offset:
+            return cached[1]
+        # The earlier chunks were written by another process (or before a restart)
+        digest = hashlib.sha256()
+        with open(self._path(upload_id, ".part"), "rb") as f:
+            remaining = offset
+            while remaining > 0:
+                block = f.read(min(_HASH_READ_SIZE, remaining))
+                if not block:
+                    break
+                digest.update(block)
+                remaining -= len(block)
+        return digest
+
+    async def append(
+        self,
+        upload_id: str,
+        offset: int,
+        chunks: AsyncIterator[bytes],
+        checksum: Optional[Tuple[str, bytes]] = None,
+    ) -> ResumableUpload:
+        """
+        Append request body chunks at ``offset``
+
+        Without a checksum, each chunk is written as it arrives, so a dropped
+        connection keeps what was received. With one, the body is verified
+        first and written all at once, or not at all.
+
+        Raises:
+            UploadNotFoundError: If there is no such upload
+            UploadOffsetMismatchError: If ``offset`` is not the current offset
+            UploadBusyError: If another request is writing to the upload
+            UploadTooLargeError: If the body runs past the announced length
+            UnsupportedFileTypeError: If the first bytes are not an allowed type
+            ChecksumMismatchError: If the body does not match ``checksum``
+        """
+        upload = await asyncio.to_thread(self._load, upload_id)
+        if upload.job_id is not None and offset == upload.length:
+            # Repeated final chunk: the upload is already being processed
+            return upload
+        if upload.job_id is not None or offset != upload.offset:
+            raise UploadOffsetMismatchError(
+                f"Upload is at offset {upload.offset}, not {offset}", upload.offset
+            )
+
+        with self._locked(upload_id) as f:
+            # Re-read under the lock: another worker may have written meanwhile
+            start = await asyncio.to_thread(os.path.getsize, f.name)
+            if start != offset:
+                raise UploadOffsetMismatchError(f"Upload is at offset {start}, not {offset}", start)
+            digest = await asyncio.to_thread(self._hasher, upload_id, start)
+            written = start
+            body = bytearray()
+            try:
+                async for chunk in chunks:
+                    if not chunk:
+                        continue
+                    if written + len(body) + len(chunk) > upload.length:
+                        raise UploadTooLargeError(f"Body exceeds the announced Upload-Length of {upload.length} bytes")
+                    if checksum is not None:
+                        body += chunk
+                        continue
+                    await asyncio.to_thread(self._write, f, chunk)
+                    digest.update(chunk)
+                    written += len(chunk)
+                    self._hashers[upload_id] = (written, digest)
+                    if upload.mime_type is None:
+                        upload.mime_type = await asyncio.to_thread(self._sniff, upload)
+
+                if checksum is not None and body:
+                    algorithm, expected = checksum
+                    if hashlib.new(algorithm, bytes(body)).digest() != expected:
+                        raise ChecksumMismatchError("Chunk does not match Upload-Checksum")
+                    await asyncio.to_thread(self._write, f, bytes(body))
+                    digest.update(body)
+                    written += len(body)
+                    self._hashers[upload_id] = (written, digest)
+                    if upload.mime_type is None:
+                        upload.mime_type = await asyncio.to_thread(self._sniff, upload)
+            except UnsupportedFileTypeError:
+                await asyncio.to_thread(self._remove, upload_id)
+                raise
+            except UploadTooLargeError:
+                # Drop the whole offending request so the offset stays where it was
+                await asyncio.to_thread(self._truncate, f, start)
+                self._hashers.pop(upload_id, None)
+                raise
+            finally:
+                upload.offset = written
+
+        await asyncio.to_thread(self._save, upload)
+        return upload
+
+    @staticmethod
+    def _write(f: Any, data: bytes) -> None:
+        f.write(data)
+        f.flush()
+
+    @staticmethod
+    def _truncate(f: Any, size: int) -> None:
+        f.flush()
+        f.truncate(size)
+
+    def _sniff(self, upload: ResumableUpload) -> Optional[str]:
+        """Detect the type once enough bytes are in; raises UnsupportedFileTypeError for disallowed types"""
+        with open(self._path(upload.id, ".part"), "rb") as f:
+            head = f.read(12)
+        if len(head) < 12 and len(head) < upload.length:
+            return None
+        mime_type = sniff_image_type(head)
+        if mime_type is None or mime_type not in self.allowed_types:
+            raise UnsupportedFileTypeError(
+                f"File type {mime_type or 'unknown'} not allowed. Allowed types: {', '.join(self.allowed_types)}"
+            )
+        return mime_type
+
+    async def assemble(self, upload_id: str) -> ImageUpload:
+        """
+        Load a finished upload for processing, checking the whole-file SHA-256
+
+        Raises:
+            UploadNotFoundError: If there is no such upload
+            UploadOffsetMismatchError: If the upload is not complete yet
+            ChecksumMismatchError: If the file does not match the expected SHA-256
+                (the upload is discarded)
+        """
+        upload = await asyncio.to_thread(self._load, upload_id)
+        if not upload.complete or upload.job_id is not None:
+            raise UploadOffsetMismatchError("Upload is not complete", upload.offset)
+        cached = self._hashers.get(upload_id)
+        if cached is not None and cached[0] == upload.offset:
+            # Every chunk was written here: the running digest is the file's, so
+            # a mismatch is caught without reading the file at all
+            sha256 = cached[1].hexdigest()
+            await asyncio.to_thread(self._check_sha256, upload, sha256)
+            data = await asyncio.to_thread(self._read, upload_id)
+        else:
+            data = await asyncio.to_thread(self._read, upload_id)
+            sha256 = await asyncio.to_thread(lambda: hashlib.sha256(data).hexdigest())
+            await asyncio.to_thread(self._check_sha256, upload, sha256)
+        mime_type = upload.mime_type or await asyncio.to_thread(self._sniff, upload)
+        return ImageUpload(data=data, mime_type=mime_type, sha256=sha256, filename=upload.filename)
+
+    def _read(self, upload_id: str) -> bytearray:
+        with open(self._path(upload_id, ".part"), "rb") as f:
+            return bytearray(f.read())
+
+    def _check_sha256(self, upload: ResumableUpload, sha256: str) -> None:
+        """Discard the upload if it does not match the sha256 the client announced"""
+        if upload.sha256 and upload.sha256 != sha256:
+            self._remove(upload.id)
+            raise ChecksumMismatchError("Uploaded file does not match its sha256 metadata")
+
+    async def mark_processing(self, upload_id: str, job_id: str) -> ResumableUpload:
+        """Record the job processing a finished upload and drop its spooled data"""
+        upload = await asyncio.to_thread(self._load, upload_id)
+        upload.job_id = job_id
+        await asyncio.to_thread(self._save, upload)
+        await asyncio.to_thread(self._remove, upload_id, True)
+        return upload
+
+
+# Global store instance
+_store: Optional[ResumableUploadStore] = None
+
+
+def get_resumable_store() -> ResumableUploadStore:
+    """Get the resumable upload store singleton"""
+    global _store
+    if _store is None:
+        settings = get_settings()
+        _store = ResumableUploadStore(
+            settings.resumable_upload_dir,
+            ttl=settings.resumable_upload_ttl_seconds,
+            max_size=settings.max_file_size,
+            allowed_types=settings.allowed_file_types_list,
+        )
+    return _store
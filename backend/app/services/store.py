@@ -0,0 +1,475 @@
+import asyncio
+import base64
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from backend.app.core.settings import get_settings
+from backend.app.services.analytics import (
+    SpendDeltas,
+    query_spend_by_merchant,
+    query_spend_by_period,
+    query_spend_summary,
+    rebuild_spend_aggregates,
+)
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Failed writes of one receipt before it is dropped instead of retried
+_MAX_WRITE_ATTEMPTS = 3
+
+SCHEMA_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "..", "database", "schema.sql")
+
+# Receipt ids are derived from the image hash, so storing the same image again
+# updates its receipt instead of adding another
+_RECEIPT_ID_NAMESPACE = uuid.UUID("6f1c2b8e-4d0a-4f5e-9b7a-3c2d1e0f9a8b")
+
+
+def receipt_id_for(content_hash: str) -> str:
+    """Id of the receipt stored for an image with this sha256"""
+    return str(uuid.uuid5(_RECEIPT_ID_NAMESPACE, content_hash))
+
+
+def _to_float(value: Any) -> Optional[float]:
+    """Best-effort numeric coercion for model output ("12.50", 12, None)"""
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_text(value: Any) -> Optional[str]:
+    """Coerce a model output field stored as text; objects and lists become None"""
+    if isinstance(value, str):
+        return value.strip() or None
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    return None
+
+
+@dataclass
+class ReceiptRecord:
+    """A parsed receipt ready to be persisted"""
+    content_hash: str
+    filename: Optional[str]
+    data: Dict[str, Any]
+    id: str = ""
+    created_at: float = field(default_factory=time.time)
+    # Text columns, coerced from whatever the model returned
+    merchant: Optional[str] = field(init=False, default=None)
+    date: Optional[str] = field(init=False, default=None)
+
+    def __post_init__(self):
+        if not self.id:
+            self.id = receipt_id_for(self.content_hash)
+        self.merchant = _to_text(self.data.get("merchant"))
+        self.date = _to_text(self.data.get("date"))
+
+    def row(self) -> Tuple:
+        return (
+            self.id,
+            self.content_hash,
+            self.filename,
+            self.merchant,
+            self.date,
+            _to_float(self.data.get("total")),
+            _to_float(self.data.get("subtotal")),
+            _to_float(self.data.get("tax")),
+            json.dumps(self.data),
+            self.created_at,
+        )
+
+    def item_rows(self) -> List[Tuple]:
+        rows = []
+        for line_no, item in enumerate(self.data.get("items") or []):
+            if not isinstance(item, dict):
+                continue
+            rows.append((
+                self.id,
+                line_no,
+                str(item.get("name", "")),
+                _to_float(item.get("quantity", 1)),
+                _to_float(item.get("price")),
+            ))
+        return rows
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "content_hash": self.content_hash,
+            "filename": self.filename,
+            "created_at": self.created_at,
+            "data": self.data,
+        }
+
+
+def encode_cursor(created_at: float, receipt_id: str) -> str:
+    return base64.urlsafe_b64encode(f"{created_at!r}|{receipt_id}".encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[float, str]:
+    """
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        created_at, receipt_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|", 1)
+        return float(created_at), receipt_id
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+class ReceiptStore:
+    """
+    SQLite storage for receipts and their line items
+
+    Calls are blocking and serialised on one connection; async callers run
+    them in a thread.
+    """
+
+    def __init__(self, db_path: str, schema_path: str = SCHEMA_PATH):
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with open(schema_path, "r", encoding="utf-8") as f:
+            schema = f.read()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("PRAGMA foreign_keys=ON")
+            removed = self._drop_duplicate_receipts()
+            self._conn.executescript(schema)
+            if removed:
+                with self._conn:
+                    rebuild_spend_aggregates(self._conn)
+
+    def _drop_duplicate_receipts(self) -> int:
+        """
+        Prepare a database from before content_hash was unique for the unique index
+
+        Only the newest receipt per image is kept (the aggregates, which counted
+        every copy, must be rebuilt afterwards).
+
+        Returns:
+            Number of receipts removed
+        """
+        indexes = self._conn.execute("PRAGMA index_list(receipts)").fetchall()
+        if not indexes or any(row["name"] == "idx_receipts_content_hash" and row["unique"] for row in indexes):
+            return 0
+        with self._conn:
+            removed = self._conn.execute(
+                "DELETE FROM receipts WHERE EXISTS (SELECT 1 FROM receipts AS newer "
+                "WHERE newer.content_hash = receipts.content_hash AND (newer.created_at > receipts.created_at "
+                "OR (newer.created_at = receipts.created_at AND newer.id > receipts.id)))"
+            ).rowcount
+            self._conn.execute("DROP INDEX IF EXISTS idx_receipts_content_hash")
+        if removed:
+            logger.info(f"Removed {removed} duplicate receipts")
+        return removed
+
+    def save_many(self, records: List[ReceiptRecord]) -> None:
+        """
+        Upsert receipts and items and update the spend aggregates in a single transaction
+
+        A receipt whose image is already stored replaces the stored one (keeping
+        its created_at), so saving the same result twice is harmless.
+        """
+        if not records:
+            return
+        # The last result for an image wins
+        records = list({record.content_hash: record for record in records}.values())
+        with self._lock, self._conn:
+            # A replaced receipt moves from its old buckets to its new ones
+            deltas = SpendDeltas()
+            for record in records:
+                stored = self._conn.execute(
+                    "SELECT merchant, date, created_at, total, tax FROM receipts WHERE content_hash = ?",
+                    (record.content_hash,),
+                ).fetchone()
+                if stored is not None:
+                    deltas.remove(stored["merchant"], stored["date"], stored["created_at"],
+                                  stored["total"], stored["tax"])
+                    record.created_at = stored["created_at"]
+                deltas.add(record.merchant, record.date, record.created_at,
+                           _to_float(record.data.get("total")), _to_float(record.data.get("tax")))
+            # Items of a replaced receipt go first: its line count may change, and
+            # rows stored before ids were derived from the hash change id below
+            self._conn.executemany(
+                "DELETE FROM receipt_items WHERE receipt_id IN (SELECT id FROM receipts WHERE content_hash = ?)",
+                [(record.content_hash,) for record in records],
+            )
+            self._conn.executemany(
+                "INSERT INTO receipts "
+                "(id, content_hash, filename, merchant, date, total, subtotal, tax, data, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (content_hash) DO UPDATE SET id = excluded.id, filename = excluded.filename, "
+                "merchant = excluded.merchant, date = excluded.date, total = excluded.total, "
+                "subtotal = excluded.subtotal, tax = excluded.tax, data = excluded.data",
+                [record.row() for record in records],
+            )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO receipt_items (receipt_id, line_no, name, quantity, price) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [row for record in records for row in record.item_rows()],
+            )
+            deltas.apply(self._conn)
+
+    def get(self, receipt_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, content_hash, filename, data, created_at FROM receipts WHERE id = ?",
+                (receipt_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "id": row["id"],
+            "content_hash": row["content_hash"],
+            "filename": row["filename"],
+            "created_at": row["created_at"],
+            "data": json.loads(row["data"]),
+        }
+
+    def list(
+        self,
+        limit: int,
+        cursor: Optional[str] = None,
+        merchant: Optional[str] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        min_total: Optional[float] = None,
+        max_total: Optional[float] = None,
+        content_hash: Optional[str] = None,
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        List receipt summaries newest first using keyset pagination
+
+        Returns:
+            The page of receipts and the cursor for the next page (None at the end)
+
+        Raises:
+            ValueError: If the cursor is malformed
+        """
+        clauses = []
+        params: List[Any] = []
+        if cursor:
+            created_at, receipt_id = decode_cursor(cursor)
+            clauses.append("(created_at < ? OR (created_at = ? AND id < ?))")
+            params += [created_at, created_at, receipt_id]
+        if merchant:
+            clauses.append("merchant = ? COLLATE NOCASE")
+            params.append(merchant)
+        if date_from:
+            clauses.append("date >= ?")
+            params.append(date_from)
+        if date_to:
+            clauses.append("date <= ?")
+            params.append(date_to)
+        if min_total is not None:
+            clauses.append("total >= ?")
+            params.append(min_total)
+        if max_total is not None:
+            clauses.append("total <= ?")
+            params.append(max_total)
+        if content_hash:
+            clauses.append("content_hash = ?")
+            params.append(content_hash)
+
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, content_hash, filename, merchant, date, total, subtotal, tax, created_at "
+                f"FROM receipts {where} ORDER BY created_at DESC, id DESC LIMIT ?",
+                (*params, limit + 1),
+            ).fetchall()
+
+        page = [dict(row) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = page[-1]
+            next_cursor = encode_cursor(last["created_at"], last["id"])
+        return page, next_cursor
+
+    def spend_by_period(self, granularity: str, date_from: Optional[str] = None,
+                        date_to: Optional[str] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            return query_spend_by_period(self._conn, granularity, date_from, date_to)
+
+    def spend_by_merchant(self, date_from: Optional[str] = None, date_to: Optional[str] = None,
+                          limit: int = 20) -> List[Dict[str, Any]]:
+        with self._lock:
+            return query_spend_by_merchant(self._conn, date_from, date_to, limit)
+
+    def spend_summary(self, date_from: Optional[str] = None, date_to: Optional[str] = None) -> Dict[str, Any]:
+        with self._lock:
+            return query_spend_summary(self._conn, date_from, date_to)
+
+    def rebuild_aggregates(self) -> int:
+        """Recompute the spend aggregates from all stored receipts"""
+        with self._lock, self._conn:
+            return rebuild_spend_aggregates(self._conn)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class ReceiptWriter:
+    """
+    Buffers receipts and writes them to the store in batches
+
+    Records are flushed once ``batch_size`` accumulate or every
+    ``flush_interval`` seconds, so concurrent uploads share one transaction.
+    Buffered records are visible through ``pending`` until written.
+    """
+
+    def __init__(self, store: ReceiptStore, batch_size: int, flush_interval: float):
+        self.store = store
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.pending: Dict[str, ReceiptRecord] = {}
+        # Failed write attempts per pending record id
+        self._failures: Dict[str, int] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+        self.store.close()
+
+    def add(self, record: ReceiptRecord) -> str:
+        """Queue a record for writing and return its id (a newer result for the same image replaces it)"""
+        self.pending[record.id] = record
+        self._failures.pop(record.id, None)
+        if len(self.pending) >= self.batch_size:
+            self._wakeup.set()
+        return record.id
+
+    async def flush(self) -> None:
+        """
+        Write the pending records in one transaction
+
+        If the batch fails, its records are written one at a time, so a record
+        the store rejects cannot hold back the rest. A record that keeps
+        failing is dropped after ``_MAX_WRITE_ATTEMPTS`` flushes.
+        """
+        if not self.pending:
+            return
+        batch = list(self.pending.values())
+        try:
+            await asyncio.to_thread(self.store.save_many, batch)
+        except Exception as e:
+            logger.error(f"Failed to write {len(batch)} receipts, retrying one by one: {str(e)}")
+        else:
+            self._done(batch)
+            logger.info(f"Stored {len(batch)} receipts")
+            return
+
+        stored = []
+        for record in batch:
+            try:
+                await asyncio.to_thread(self.store.save_many, [record])
+            except Exception as e:
+                attempts = self._failures.get(record.id, 0) + 1
+                self._failures[record.id] = attempts
+                if attempts < _MAX_WRITE_ATTEMPTS:
+                    logger.warning(f"Failed to write receipt {record.id} (attempt {attempts}): {str(e)}")
+                    continue
+                logger.error(f"Dropping receipt {record.id} after {attempts} failed writes: {str(e)}")
+            else:
+                stored.append(record)
+            self._done([record])
+        if stored:
+            logger.info(f"Stored {len(stored)} receipts")
+
+    def _done(self, records: List[ReceiptRecord]) -> None:
+        """Remove written (or dropped) records from ``pending``"""
+        for record in records:
+            self._failures.pop(record.id, None)
+            # Keep a record queued again for the same image while this batch was written
+            if self.pending.get(record.id) is record:
+                del self.pending[record.id]
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+
+# Global writer instance
+_writer: Optional[ReceiptWriter] = None
+
+
+async def start_receipt_writer() -> Optional[ReceiptWriter]:
+    """Open the store and start the batching writer when storage is enabled"""
+    global _writer
+    settings = get_settings()
+    if _writer is None and settings.store_enabled:
+        store = await asyncio.to_thread(ReceiptStore, settings.receipts_db_path)
+        _writer = ReceiptWriter(store, settings.store_batch_size, settings.store_flush_interval)
+        _writer.start()
+    return _writer
+
+
+async def stop_receipt_writer() -> None:
+    """Flush buffered receipts and close the store"""
+    global _writer
+    if _writer is not None:
+        await _writer.stop()
+        _writer = None
+
+
+def get_receipt_writer() -> Optional[ReceiptWriter]:
+    """Get the running writer, or None when storage is disabled"""
+    return _writer
+
+
+def persist_receipt(content_hash: str, filename: Optional[str], data: Dict[str, Any]) -> Optional[str]:
+    """
+    Queue a parsed receipt for storage
+
+    Partial results (see pipeline._partial_result) are not stored, so they can
+    never replace a complete receipt for the same image.
+
+    Returns:
+        The receipt id, the same for every upload of the image, or None when
+        storage is disabled or the result is partial
+    """
+    writer = get_receipt_writer()
+    if writer is None or data.get("partial"):
+        return None
+    return writer.add(ReceiptRecord(content_hash=content_hash, filename=filename, data=data))
+
+
+async def get_stored_receipt(receipt_id: str) -> Optional[Dict[str, Any]]:
+    """Fetch one receipt, including ones still waiting to be flushed"""
+    writer = get_receipt_writer()
+    if writer is None:
+        return None
+    record = writer.pending.get(receipt_id)
+    if record is not None:
+        return record.to_dict()
+    return await asyncio.to_thread(writer.store.get, receipt_id)
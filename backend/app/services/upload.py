@@ -0,0 +1,117 @@
+import hashlib
+import logging
+from dataclasses import dataclass
+from typing import List, Optional
+
+from fastapi import UploadFile
+
+from backend.app.services.near_duplicates import DuplicateMatch
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+READ_CHUNK_SIZE = 64 * 1024
+
+# Magic-byte signatures for the image and document formats we accept
+_SIGNATURES = (
+    (b"%PDF-", "application/pdf"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+
+
+class UploadTooLargeError(ValueError):
+    """Raised when an upload exceeds the configured size limit"""
+
+
+class UnsupportedFileTypeError(ValueError):
+    """Raised when the sniffed content type is not allowed"""
+
+
+@dataclass
+class ImageUpload:
+    """An upload (image or PDF) held in memory along with its sniffed type and content hash"""
+    data: bytearray
+    mime_type: str
+    sha256: str
+    filename: str
+    # Size actually sent to OCR, once preprocessing has run
+    ocr_payload_size: Optional[int] = None
+    # Perceptual hash and closest earlier look-alike, once the OCR stage has run
+    perceptual_hash: Optional[int] = None
+    duplicate_of: Optional[DuplicateMatch] = None
+
+    @property
+    def size(self) -> int:
+        return len(self.data)
+
+
+def sniff_image_type(head: bytes) -> Optional[str]:
+    """
+    Detect the image (or PDF) type from its leading magic bytes
+
+    Args:
+        head: At least the first 12 bytes of the file
+
+    Returns:
+        The MIME type, or None if the format is not recognised
+    """
+    for signature, mime_type in _SIGNATURES:
+        if head.startswith(signature):
+            return mime_type
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+async def read_upload(
+    file: UploadFile,
+    max_size: int,
+    allowed_types: List[str],
+    chunk_size: int = READ_CHUNK_SIZE,
+) -> ImageUpload:
+    """
+    Read an upload chunk by chunk into a single buffer
+
+    The size limit is enforced as chunks arrive, the type is sniffed from the
+    first chunk and the SHA-256 is computed incrementally, so the body is
+    copied into memory exactly once (Starlette's own spool file, used for
+    large parts, is read in chunks and never loaded whole).
+
+    Raises:
+        UploadTooLargeError: If the body exceeds max_size
+        UnsupportedFileTypeError: If the sniffed type is not in allowed_types
+    """
+    buffer = bytearray()
+    digest = hashlib.sha256()
+    mime_type = None
+
+    while True:
+        chunk = await file.read(chunk_size)
+        if not chunk:
+            break
+        if len(buffer) + len(chunk) > max_size:
+            raise UploadTooLargeError(f"File too large. Maximum size: {max_size} bytes")
+
+        buffer += chunk
+        digest.update(chunk)
+
+        if mime_type is None and len(buffer) >= 12:
+            mime_type = sniff_image_type(bytes(buffer[:12]))
+            if mime_type is None or mime_type not in allowed_types:
+                raise UnsupportedFileTypeError(
+                    f"File type {mime_type or 'unknown'} not allowed. Allowed types: {', '.join(allowed_types)}"
+                )
+
+    if mime_type is None:
+        raise UnsupportedFileTypeError("File is empty or not a recognised image or PDF")
+
+    logger.info(f"Read upload {file.filename}: {len(buffer)} bytes, {mime_type}")
+    return ImageUpload(
+        data=buffer,
+        mime_type=mime_type,
+        sha256=digest.hexdigest(),
+        filename=file.filename or "",
+    )
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Check that importing the app stays fast and side-effect free
+
+Imports ``main`` in fresh interpreters (the best of several runs counts),
+fails if that takes longer than the budget, and fails if modules meant to
+load lazily (Pillow, the mistralai SDK, the process pool) were pulled in at
+import time. The slowest modules by self time are listed to show where a
+regression came from.
+
+Usage:
+    python benchmarks/import_time.py [--budget-ms 1500] [--runs 5]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# Modules that must only be imported on first use
+LAZY_MODULES = ["PIL", "mistralai", "concurrent.futures.process"]
+
+_PROBE = (
+    "import json, sys, time\n"
+    "started = time.perf_counter()\n"
+    "import main\n"
+    "elapsed = time.perf_counter() - started\n"
+    f"print(json.dumps({{'seconds': elapsed, 'loaded': [m for m in {LAZY_MODULES!r} if m in sys.modules]}}))\n"
+)
+
+
+def probe(env: dict) -> dict:
+    result = subprocess.run(
+        [sys.executable, "-c", _PROBE], cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def slowest_modules(env: dict, count: int) -> list:
+    """Modules with the highest self import time, from ``-X importtime``"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        rows.append((int(self_us), name.strip()))
+    return sorted(rows, reverse=True)[:count]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Import-time budget check for main.py")
+    parser.add_argument("--budget-ms", type=float, default=1500.0, help="Max wall time to import main")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters to try; the fastest counts")
+    parser.add_argument("--top", type=int, default=10, help="Slowest modules to list")
+    args = parser.parse_args()
+
+    # Settings are not loaded at import time, but provide a key in case that regresses
+    env = {**os.environ, "MISTRAL_API_KEY": os.environ.get("MISTRAL_API_KEY", "import-check")}
+    results = [probe(env) for _ in range(args.runs)]
+    best_ms = min(result["seconds"] for result in results) * 1000
+    eager = sorted({module for result in results for module in result["loaded"]})
+
+    print(f"import main: {best_ms:.0f} ms (best of {args.runs}, budget {args.budget_ms:.0f} ms)")
+    print("slowest modules by self time:")
+    for self_us, name in slowest_modules(env, args.top):
+        print(f"  {self_us / 1000:8.1f} ms  {name}")
+
+    failed = False
+    if best_ms > args.budget_ms:
+        print(f"FAIL: import took {best_ms:.0f} ms, over the {args.budget_ms:.0f} ms budget")
+        failed = True
+    if eager:
+        print(f"FAIL: lazily loaded modules imported at startup: {', '.join(eager)}")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
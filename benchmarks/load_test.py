@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Load test the receipt API against the local mock Mistral server
+
+Starts benchmarks/mock_mistral.py and the app (under uvicorn) as
+subprocesses, replays the images in receipts/temp in a fixed order at the
+requested concurrency, and reports throughput, latency percentiles, the
+app's peak memory (all of its processes) and how many upstream calls the mock received.
+
+The mock's randomness is seeded and the result cache is off by default, so
+two runs with the same arguments are comparable. The app's upstream rate
+limit is raised so the mock's latency, not the token bucket, is what gets
+measured; pass --app-env to override any setting.
+
+Usage:
+    python benchmarks/load_test.py --requests 200 --concurrency 16
+    python benchmarks/load_test.py --throttle-rate 0.05 --app-env LOCAL_PARSER_ENABLED=false --output run.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+IMAGE_TYPES = {".png": "image/png", ".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".webp": "image/webp"}
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def peak_memory_bytes(pid: int) -> Optional[int]:
+    """Peak resident set size of a process (Linux only)"""
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def process_tree(pid: int) -> List[int]:
+    """A process and all of its descendants (Linux only)"""
+    pids = [pid]
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children", "r") as f:
+            for child in f.read().split():
+                pids += process_tree(int(child))
+    except OSError:
+        pass
+    return pids
+
+
+def load_samples(directory: str) -> List[Dict[str, Any]]:
+    samples = []
+    for name in sorted(os.listdir(directory)):
+        mime_type = IMAGE_TYPES.get(os.path.splitext(name)[1].lower())
+        if mime_type:
+            with open(os.path.join(directory, name), "rb") as f:
+                samples.append({"name": name, "mime_type": mime_type, "data": f.read()})
+    if not samples:
+        raise SystemExit(f"No sample images found in {directory}")
+    return samples
+
+
+def wait_until_up(url: str, process: subprocess.Popen, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"Process for {url} exited with code {process.returncode}")
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    raise SystemExit(f"Timed out waiting for {url}")
+
+
+async def run_load(base_url: str, path: str, samples: List[Dict[str, Any]],
+                   total: int, concurrency: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    next_index = 0
+
+    async def worker(client: httpx.AsyncClient) -> None:
+        nonlocal next_index
+        while next_index < total:
+            sample = samples[next_index % len(samples)]
+            next_index += 1
+            started = time.perf_counter()
+            try:
+                response = await client.post(
+                    path, files={"file": (sample["name"], sample["data"], sample["mime_type"])}
+                )
+                await response.aread()
+                outcome = str(response.status_code)
+            except httpx.HTTPError as e:
+                outcome = type(e).__name__
+            latencies.append(time.perf_counter() - started)
+            statuses[outcome] = statuses.get(outcome, 0) + 1
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120.0, limits=limits) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": total,
+        "elapsed_seconds": round(elapsed, 3),
+        "rps": round(total / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50) * 1000, 1),
+            "p95": round(percentile(latencies, 95) * 1000, 1),
+            "p99": round(percentile(latencies, 99) * 1000, 1),
+            "max": round(latencies[-1] * 1000, 1) if latencies else 0.0,
+        },
+        "status_codes": statuses,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Load test the receipt API against a mock Mistral server")
+    parser.add_argument("--requests", type=int, default=200, help="Measured requests")
+    parser.add_argument("--warmup", type=int, default=10, help="Requests sent before measuring")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--samples", default=os.path.join(ROOT, "receipts", "temp"))
+    parser.add_argument("--path", default="/api/v1/receipt/upload-receipt/", help="Endpoint to load")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="App worker processes; more than one shares a coordinator database")
+    parser.add_argument("--app-port", type=int, default=9000)
+    parser.add_argument("--mock-port", type=int, default=9100)
+    parser.add_argument("--ocr-latency-ms", type=float, default=800.0)
+    parser.add_argument("--parse-latency-ms", type=float, default=400.0)
+    parser.add_argument("--jitter-ms", type=float, default=100.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--cache", action="store_true", help="Leave the result cache enabled")
+    parser.add_argument("--app-env", action="append", default=[], metavar="KEY=VALUE",
+                        help="Extra environment for the app (repeatable)")
+    parser.add_argument("--output", help="Also write the report as JSON to this file")
+    parser.add_argument("--show-logs", action="store_true", help="Print app and mock server logs")
+    args = parser.parse_args()
+
+    samples = load_samples(args.samples)
+    mock_url = f"http://127.0.0.1:{args.mock_port}"
+    app_url = f"http://127.0.0.1:{args.app_port}"
+
+    with tempfile.TemporaryDirectory(prefix="receipt-bench-") as work_dir:
+        app_env = {
+            **os.environ,
+            "MISTRAL_API_KEY": "benchmark",
+            "MISTRAL_API_BASE": mock_url,
+            "RATE_LIMIT_REQUESTS": "1000000",
+            "RATE_LIMIT_BURST": "1000",
+            "CACHE_ENABLED": "true" if args.cache else "false",
+            "CACHE_DIR": "",
+            "JOBS_DB_PATH": os.path.join(work_dir, "jobs.db"),
+            "RECEIPTS_DB_PATH": os.path.join(work_dir, "receipts.db"),
+        }
+        if args.workers > 1:
+            app_env["COORDINATOR_DB_PATH"] = os.path.join(work_dir, "coordinator.db")
+        for item in args.app_env:
+            key, _, value = item.partition("=")
+            app_env[key] = value
+
+        # Per-request app logging would otherwise be part of what is measured
+        log_target = None if args.show_logs else subprocess.DEVNULL
+        mock = subprocess.Popen([
+            sys.executable, os.path.join(ROOT, "benchmarks", "mock_mistral.py"),
+            "--port", str(args.mock_port),
+            "--ocr-latency-ms", str(args.ocr_latency_ms),
+            "--parse-latency-ms", str(args.parse_latency_ms),
+            "--jitter-ms", str(args.jitter_ms),
+            "--throttle-rate", str(args.throttle_rate),
+            "--seed", str(args.seed),
+        ], cwd=ROOT, stdout=log_target, stderr=log_target)
+        app = subprocess.Popen([
+            sys.executable, "-m", "uvicorn", "main:app",
+            "--port", str(args.app_port), "--log-level", "warning", "--workers", str(args.workers),
+        ], cwd=ROOT, env=app_env, stdout=log_target, stderr=log_target)
+
+        try:
+            wait_until_up(f"{mock_url}/stats", mock)
+            wait_until_up(f"{app_url}/health", app)
+
+            if args.warmup:
+                asyncio.run(run_load(app_url, args.path, samples, args.warmup, args.concurrency))
+            httpx.post(f"{mock_url}/stats/reset")
+
+            report = asyncio.run(run_load(app_url, args.path, samples, args.requests, args.concurrency))
+            report["upstream_calls"] = httpx.get(f"{mock_url}/stats").json()
+            # Summed over the uvicorn supervisor, its workers and their preprocess pools
+            peaks = [peak_memory_bytes(pid) for pid in process_tree(app.pid)]
+            report["app_peak_rss_bytes"] = sum(peak for peak in peaks if peak) or None
+        finally:
+            for process in (app, mock):
+                process.terminate()
+            for process in (app, mock):
+                try:
+                    process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+
+    report["config"] = {
+        key: value for key, value in vars(args).items() if key not in ("output", "samples")
+    }
+    report["config"]["sample_images"] = len(samples)
+
+    latency = report["latency_ms"]
+    rss = report["app_peak_rss_bytes"]
+    print(f"requests      {report['requests']} at concurrency {args.concurrency} in {report['elapsed_seconds']}s")
+    print(f"throughput    {report['rps']} req/s")
+    print(f"latency (ms)  p50 {latency['p50']}  p95 {latency['p95']}  p99 {latency['p99']}  max {latency['max']}")
+    print(f"status codes  {report['status_codes']}")
+    print(f"peak RSS      {rss / 1024 ** 2:.1f} MiB" if rss else "peak RSS      unavailable")
+    print(f"upstream      {report['upstream_calls']}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Mistral OCR and chat completion endpoints
+
+Serves /v1/ocr, /v1/chat/completions (plain and streamed) and /v1/models
+with configurable latency, jitter and injected 429s, so the app can be load
+tested without network calls or API spend. With --truncate-chars, streamed
+replies stop at that many characters with finish_reason "length"; a
+request continuing one with an assistant prefix gets the next part, echoed
+after the prefix as the real API does. All randomness comes from one
+seeded generator, and GET /stats reports how many calls each endpoint saw.
+
+Usage:
+    python benchmarks/mock_mistral.py --port 9100 --ocr-latency-ms 800 --jitter-ms 100 --throttle-rate 0.05
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+from typing import Any, Dict
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+
+PARSED_RECEIPT = {
+    "merchant": "Bebek Bengil",
+    "date": "2024-01-01",
+    "items": [
+        {"name": "Nasi Campur Bali", "price": 75000},
+        {"name": "Bbk Bengil Nasi", "price": 125000},
+        {"name": "MilkShake Starwb", "price": 37000},
+    ],
+    "subtotal": 1346000,
+    "tax": 144695,
+    "total": 1591600,
+}
+
+
+def create_app(options: argparse.Namespace) -> FastAPI:
+    app = FastAPI(title="Mock Mistral API")
+    rng = random.Random(options.seed)
+    with open(options.markdown, "r", encoding="utf-8") as f:
+        markdown_text = f.read()
+    reply = json.dumps(PARSED_RECEIPT)
+    stats: Dict[str, Any] = {"ocr": 0, "chat": 0, "models": 0, "throttled": 0, "ocr_request_bytes": 0}
+
+    async def delay(latency_ms: float) -> None:
+        jitter = rng.uniform(-options.jitter_ms, options.jitter_ms)
+        await asyncio.sleep(max(0.0, latency_ms + jitter) / 1000)
+
+    def throttled() -> bool:
+        if rng.random() < options.throttle_rate:
+            stats["throttled"] += 1
+            return True
+        return False
+
+    def too_many_requests() -> Response:
+        return JSONResponse(
+            {"message": "Requests rate limit exceeded"}, status_code=429,
+            headers={"Retry-After": str(options.retry_after)}
+        )
+
+    @app.post("/v1/ocr")
+    async def ocr(request: Request):
+        body = await request.body()
+        stats["ocr"] += 1
+        stats["ocr_request_bytes"] += len(body)
+        if throttled():
+            return too_many_requests()
+        await delay(options.ocr_latency_ms)
+        return {"pages": [{"index": 0, "markdown": markdown_text}], "model": "mock-ocr"}
+
+    @app.post("/v1/chat/completions")
+    async def chat(request: Request):
+        payload = await request.json()
+        stats["chat"] += 1
+        if throttled():
+            return too_many_requests()
+        await delay(options.parse_latency_ms)
+        if not payload.get("stream"):
+            return {"choices": [{"message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}]}
+
+        last = payload["messages"][-1]
+        prefix = last["content"] if last.get("role") == "assistant" and last.get("prefix") else ""
+        end = len(reply)
+        if options.truncate_chars:
+            end = min(end, len(prefix) + options.truncate_chars)
+        streamed = prefix + reply[len(prefix):end]
+        finish_reason = "length" if end < len(reply) else "stop"
+
+        async def chunks():
+            step = max(1, len(streamed) // 8)
+            for start in range(0, len(streamed), step):
+                chunk = {"choices": [{"delta": {"content": streamed[start:start + step]}, "finish_reason": None}]}
+                yield f"data: {json.dumps(chunk)}\n\n"
+                await asyncio.sleep(options.token_interval_ms / 1000)
+            yield f"data: {json.dumps({'choices': [{'delta': {}, 'finish_reason': finish_reason}]})}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(chunks(), media_type="text/event-stream")
+
+    @app.get("/v1/models")
+    async def models():
+        stats["models"] += 1
+        return {"data": [{"id": "mock-ocr"}]}
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+
+    @app.post("/stats/reset")
+    async def reset_stats():
+        for key in stats:
+            stats[key] = 0
+        return stats
+
+    return app
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Mock Mistral API for load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--ocr-latency-ms", type=float, default=800.0, help="Mean OCR response time")
+    parser.add_argument("--parse-latency-ms", type=float, default=400.0, help="Mean time to first parse token")
+    parser.add_argument("--token-interval-ms", type=float, default=20.0, help="Delay between streamed parse chunks")
+    parser.add_argument("--truncate-chars", type=int, default=0,
+                        help="Cut streamed parse replies at this many new characters (0 = never)")
+    parser.add_argument("--jitter-ms", type=float, default=100.0, help="Uniform +/- jitter added to latencies")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Share of calls answered with 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--seed", type=int, default=1234, help="Seed for jitter and throttling")
+    parser.add_argument("--markdown", default=os.path.join(ROOT, "extracted_text.txt"),
+                        help="OCR markdown returned for every image")
+    return parser
+
+
+def main() -> None:
+    import uvicorn
+
+    options = build_parser().parse_args()
+    uvicorn.run(create_app(options), host=options.host, port=options.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Check that image preprocessing keeps OCR accuracy on the sample receipts
+
+For every image in receipts/temp, OCR is run on the original bytes and on
+the preprocessed bytes. The script reports payload size before/after, OCR
+latency and how similar the two markdown outputs are, and exits non-zero
+if any sample drops below the similarity threshold.
+
+Usage:
+    python benchmarks/preprocess_accuracy.py [--samples receipts/temp] [--min-similarity 0.9]
+"""
+import argparse
+import asyncio
+import difflib
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from backend.app.core.settings import get_settings
+from backend.app.services.http_client import close_http_client
+from backend.app.services.local_parser import parse_receipt_locally
+from backend.app.services.ocr import run_mistral_ocr
+from backend.app.services.preprocess import PreprocessOptions, preprocess_image
+from backend.app.services.upload import sniff_image_type
+
+
+def similarity(a: str, b: str) -> float:
+    """Token-level similarity of two OCR outputs (1.0 = identical)"""
+    return difflib.SequenceMatcher(None, a.split(), b.split()).ratio()
+
+
+async def timed_ocr(image: bytes, mime_type: str):
+    start = time.perf_counter()
+    markdown_text = await run_mistral_ocr(image, mime_type)
+    return markdown_text, time.perf_counter() - start
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--samples", default="receipts/temp", help="Directory of sample receipt images")
+    parser.add_argument("--min-similarity", type=float, default=0.9, help="Fail below this OCR text similarity")
+    args = parser.parse_args()
+
+    settings = get_settings()
+    options = PreprocessOptions(
+        max_dimension=settings.preprocess_max_dimension,
+        jpeg_quality=settings.preprocess_jpeg_quality,
+        grayscale=settings.preprocess_grayscale,
+        autocrop=settings.preprocess_autocrop,
+    )
+
+    print(f"{'sample':<45} {'bytes before':>12} {'bytes after':>12} {'ocr s before':>12} "
+          f"{'ocr s after':>12} {'similarity':>10} {'total match':>11}")
+    failures = 0
+    try:
+        for name in sorted(os.listdir(args.samples)):
+            path = os.path.join(args.samples, name)
+            with open(path, "rb") as f:
+                original = f.read()
+            mime_type = sniff_image_type(original[:12])
+            if mime_type is None:
+                continue
+
+            processed, processed_type = preprocess_image(original, mime_type, options)
+            text_before, seconds_before = await timed_ocr(original, mime_type)
+            text_after, seconds_after = await timed_ocr(processed, processed_type)
+
+            score = similarity(text_before, text_after)
+            total_before = parse_receipt_locally(text_before).data["total"]
+            total_after = parse_receipt_locally(text_after).data["total"]
+            if score < args.min_similarity:
+                failures += 1
+
+            print(f"{name[:45]:<45} {len(original):>12} {len(processed):>12} {seconds_before:>12.2f} "
+                  f"{seconds_after:>12.2f} {score:>10.3f} {str(total_before == total_after):>11}")
+    finally:
+        await close_http_client()
+
+    print(f"\n{failures} sample(s) below similarity {args.min_similarity}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -1 +1,59 @@
+-- Receipt store schema (SQLite)
+-- Applied on startup by backend/app/services/store.py; every statement is idempotent.
 
+CREATE TABLE IF NOT EXISTS receipts (
+    id TEXT PRIMARY KEY,
+    content_hash TEXT NOT NULL,
+    filename TEXT,
+    merchant TEXT,
+    date TEXT,
+    total REAL,
+    subtotal REAL,
+    tax REAL,
+    data TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS receipt_items (
+    receipt_id TEXT NOT NULL REFERENCES receipts (id) ON DELETE CASCADE,
+    line_no INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    quantity REAL,
+    price REAL,
+    PRIMARY KEY (receipt_id, line_no)
+);
+
+-- Keyset pagination walks (created_at, id) newest first
+CREATE INDEX IF NOT EXISTS idx_receipts_created ON receipts (created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_receipts_merchant ON receipts (merchant COLLATE NOCASE, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_receipts_date ON receipts (date);
+CREATE INDEX IF NOT EXISTS idx_receipts_total ON receipts (total);
+-- One receipt per image; writes upsert on it
+CREATE UNIQUE INDEX IF NOT EXISTS idx_receipts_content_hash ON receipts (content_hash);
+
+-- Spend aggregates, maintained in the same transaction as receipt inserts.
+-- Rebuild with: python -m backend.app.services.analytics --rebuild
+CREATE TABLE IF NOT EXISTS spend_daily (
+    day TEXT PRIMARY KEY,
+    receipt_count INTEGER NOT NULL DEFAULT 0,
+    total REAL NOT NULL DEFAULT 0,
+    tax REAL NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS spend_monthly (
+    month TEXT PRIMARY KEY,
+    receipt_count INTEGER NOT NULL DEFAULT 0,
+    total REAL NOT NULL DEFAULT 0,
+    tax REAL NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS spend_merchant_monthly (
+    merchant TEXT NOT NULL COLLATE NOCASE,
+    month TEXT NOT NULL,
+    receipt_count INTEGER NOT NULL DEFAULT 0,
+    total REAL NOT NULL DEFAULT 0,
+    tax REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (merchant, month)
+);
+
+CREATE INDEX IF NOT EXISTS idx_spend_merchant_monthly_month ON spend_merchant_monthly (month);
@@ -26,6 +26,26 @@ print_error() {
     echo -e "${RED}[ERROR]${NC} $1"
 }
 
+# Parse arguments
+WORKERS=1
+while [[ $# -gt 0 ]]; do
+    case "$1" in
+        --workers)
+            WORKERS="$2"
+            shift 2
+            ;;
+        *)
+            print_error "Unknown option: $1 (usage: $0 [--workers N])"
+            exit 1
+            ;;
+    esac
+done
+
+if ! [[ "$WORKERS" =~ ^[1-9][0-9]*$ ]]; then
+    print_error "--workers must be a positive integer"
+    exit 1
+fi
+
 # Check if running as root
 if [[ $EUID -eq 0 ]]; then
    print_error "This script should not be run as root"
@@ -103,6 +123,15 @@ EOF
     print_warning "Please update the MISTRAL_API_KEY in .env file with your actual API key"
 fi
 
+# Worker processes share the upstream budget and result cache through one SQLite file
+WORKER_ENV=""
+if [ "$WORKERS" -gt 1 ]; then
+    print_status "Configuring $WORKERS worker processes..."
+    mkdir -p database
+    WORKER_ENV="Environment=COORDINATOR_DB_PATH=$APP_DIR/database/coordinator.db
+Environment=PREPROCESS_WORKERS=1"
+fi
+
 # Create systemd service
 print_status "Creating systemd service..."
 sudo tee /etc/systemd/system/receipt-scanner.service << EOF
@@ -116,7 +145,8 @@ User=$(whoami)
 Group=$(whoami)
 WorkingDirectory=$APP_DIR
 Environment=PATH=$APP_DIR/venv/bin
-ExecStart=$APP_DIR/venv/bin/uvicorn main:app --host 0.0.0.0 --port 8000
+$WORKER_ENV
+ExecStart=$APP_DIR/venv/bin/uvicorn main:app --host 0.0.0.0 --port 8000 --workers $WORKERS
 Restart=always
 RestartSec=10
 
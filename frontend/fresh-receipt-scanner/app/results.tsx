@@ -7,7 +7,7 @@ import { router, useLocalSearchParams } from 'expo-router';
 const { width } = Dimensions.get('window');
 
 export default function ResultsScreen() {
-  const { result, loading, error, scanReceipt, resetScan } = useReceiptScanner();
+  const { result, loading, error, ocrText, scanReceipt, resetScan } = useReceiptScanner();
   const params = useLocalSearchParams();
 
   useEffect(() => {
@@ -29,8 +29,17 @@ export default function ResultsScreen() {
             <MaterialIcons name="auto-awesome" size={48} color="white" />
           </View>
           <ActivityIndicator size="large" color="white" style={styles.spinner} />
-          <Text style={styles.loadingText}>Processing your receipt...</Text>
-          <Text style={styles.loadingSubtext}>AI is extracting the data</Text>
+          <Text style={styles.loadingText}>
+            {ocrText ? 'Reading the details...' : 'Processing your receipt...'}
+          </Text>
+          <Text style={styles.loadingSubtext}>
+            {ocrText ? 'Text extracted, organising items' : 'AI is extracting the data'}
+          </Text>
+          {ocrText && (
+            <ScrollView style={styles.ocrPreview}>
+              <Text style={styles.ocrPreviewText}>{ocrText}</Text>
+            </ScrollView>
+          )}
         </View>
       </View>
     );
@@ -186,6 +195,19 @@ const styles = StyleSheet.create({
     fontSize: 16,
     color: 'rgba(255, 255, 255, 0.8)',
   },
+  ocrPreview: {
+    maxHeight: 240,
+    alignSelf: 'stretch',
+    marginTop: 24,
+    padding: 16,
+    borderRadius: 12,
+    backgroundColor: 'rgba(255, 255, 255, 0.15)',
+  },
+  ocrPreviewText: {
+    fontSize: 13,
+    color: 'white',
+    fontFamily: 'monospace',
+  },
 
   // Error Styles
   errorContainer: {
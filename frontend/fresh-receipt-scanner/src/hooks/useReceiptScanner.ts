@@ -14,10 +14,33 @@ interface Receipt {
     items: ReceiptItem[];
 }
 
+interface ServerEvent {
+    event: string;
+    data: any;
+}
+
+// Split a server-sent event buffer into complete events and the unfinished remainder
+function parseServerEvents(buffer: string): { events: ServerEvent[]; rest: string } {
+    const blocks = buffer.split('\n\n');
+    const rest = blocks.pop() || '';
+    const events = blocks.filter(block => block.trim()).map(block => {
+        let event = 'message';
+        let data = '';
+        for (const line of block.split('\n')) {
+            if (line.startsWith('event: ')) event = line.slice(7);
+            else if (line.startsWith('data: ')) data += line.slice(6);
+        }
+        return { event, data: data ? JSON.parse(data) : null };
+    });
+    return { events, rest };
+}
+
 export const useReceiptScanner = () => {
     const [loading, setLoading] = useState(false);
     const [error, setError] = useState<string | null>(null);
     const [result, setResult] = useState<Receipt | null>(null);
+    // OCR text, available while the receipt is still being parsed
+    const [ocrText, setOcrText] = useState<string | null>(null);
 
     // Helper to convert base64 to Blob
     function base64ToBlob(base64: string, type = 'image/jpeg') {
@@ -38,6 +61,7 @@ export const useReceiptScanner = () => {
         console.log('Starting receipt scan with URI:', imageUri);
         setLoading(true);
         setError(null);
+        setOcrText(null);
         try {
             const formData = new FormData();
             if (base64) {
@@ -46,12 +70,12 @@ export const useReceiptScanner = () => {
             } else {
                 throw new Error('No base64 image data provided for web upload.');
             }
-            // Use AWS EC2 server URL
-            const response = await fetch('http://3.25.119.39:8000/api/v1/receipt/upload-receipt/', {
+            // Use AWS EC2 server URL; progress is streamed as server-sent events
+            const response = await fetch('http://3.25.119.39:8000/api/v1/receipt/upload-receipt/stream/', {
                 method: 'POST',
                 body: formData,
                 headers: {
-                    'Accept': 'application/json',
+                    'Accept': 'text/event-stream',
                 },
             });
 
@@ -64,7 +88,34 @@ export const useReceiptScanner = () => {
                 throw new Error(`Server error: ${response.status}. ${errorText}`);
             }
 
-            const data = await response.json();
+            let data: any = null;
+            const handleEvent = ({ event, data: payload }: ServerEvent) => {
+                console.log('Server event:', event, payload?.elapsed_ms);
+                if (event === 'ocr_done') {
+                    setOcrText(payload.markdown);
+                } else if (event === 'parsed') {
+                    data = payload;
+                } else if (event === 'error') {
+                    throw new Error(`Server error: ${payload.status_code}. ${payload.message}`);
+                }
+            };
+
+            const reader = response.body?.getReader();
+            if (reader) {
+                // Handle events as they arrive so the OCR text shows before parsing finishes
+                const decoder = new TextDecoder();
+                let buffer = '';
+                while (true) {
+                    const { done, value } = await reader.read();
+                    if (done) break;
+                    const parsed = parseServerEvents(buffer + decoder.decode(value, { stream: true }));
+                    buffer = parsed.rest;
+                    parsed.events.forEach(handleEvent);
+                }
+            } else {
+                // No streaming body support: handle all events once the response completes
+                parseServerEvents(await response.text() + '\n\n').events.forEach(handleEvent);
+            }
             console.log('Server response data:', data);
             
             if (!data || !data.data || !data.data.merchant) {
@@ -82,6 +133,7 @@ export const useReceiptScanner = () => {
     const resetScan = () => {
         setResult(null);
         setError(null);
+        setOcrText(null);
     };
 
     return {
@@ -89,6 +141,7 @@ export const useReceiptScanner = () => {
         resetScan,
         loading,
         error,
-        result
+        result,
+        ocrText
     };
 };
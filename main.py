@@ -1,21 +1,58 @@
-import sys
-import os
-print("main.py loaded")
-sys.path.append(os.path.join(os.path.dirname(__file__), "backend", "app"))
-
+import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from backend.app.api.v1.apirouter import router as api_router
 from backend.app.core.settings import get_settings
+from backend.app.core.middleware import BodySizeLimitMiddleware, MetricsMiddleware, MULTIPART_OVERHEAD
+from backend.app.services import metrics
+from backend.app.services.admission import get_admission_controller
+from backend.app.services.breaker import breaker_states
+from backend.app.services.cache import get_result_cache
+from backend.app.services.coordinator import close_coordinator
+from backend.app.services.governor import get_governor
+from backend.app.services.http_client import init_http_client, close_http_client
+from backend.app.services.jobs import get_job_manager, start_job_manager, stop_job_manager
+from backend.app.services.preprocess import stop_preprocess_pool, warm_preprocess_pool
+from backend.app.services.singleflight import get_single_flight
+from backend.app.services.store import start_receipt_writer, stop_receipt_writer
+
+# Configure logging
+logger = logging.getLogger(__name__)
 
-def debug_get_settings():
-    print("get_settings called")
-    return get_settings()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.ready = False
+    # Load and validate settings once, before anything else starts
+    get_settings()
+    # Create and warm the shared upstream client once per worker
+    await init_http_client()
+    # Spawn preprocessing workers now so the first upload does not pay for it
+    await warm_preprocess_pool()
+    cache = get_result_cache()
+    if cache:
+        logger.info(f"Loaded {await cache.warm()} cached results into memory")
+    await start_receipt_writer()
+    await start_job_manager()
+    metrics.start_loop_lag_monitor()
+    app.state.ready = True
+    try:
+        yield
+    finally:
+        app.state.ready = False
+        await metrics.stop_loop_lag_monitor()
+        await stop_job_manager()
+        await stop_receipt_writer()
+        stop_preprocess_pool()
+        await close_http_client()
+        close_coordinator()
 
 app = FastAPI(
     title="Mistral OCR Receipt API",
     version="1.0.0",
-    description="A secure API for processing receipts using Mistral AI OCR"
+    description="A secure API for processing receipts using Mistral AI OCR",
+    lifespan=lifespan
 )
 
 # Secure CORS configuration
@@ -34,15 +71,84 @@ app.add_middleware(
     CORSMiddleware,
     allow_origins=allowed_origins,
     allow_credentials=False,  # Set to False for better security
-    allow_methods=["GET", "POST"],  # Only allow needed methods
-    allow_headers=["Content-Type", "Authorization"],  # Only allow needed headers
+    allow_methods=["GET", "POST", "PATCH", "HEAD"],  # Only allow needed methods (PATCH/HEAD: resumable uploads)
+    allow_headers=[
+        "Content-Type", "Authorization", "X-API-Key",
+        # Resumable upload protocol
+        "Tus-Resumable", "Upload-Length", "Upload-Offset", "Upload-Metadata", "Upload-Checksum"
+    ],
+    # Let browser clients read the resumable upload state and retry hints
+    expose_headers=[
+        "Location", "Retry-After", "Tus-Resumable", "Upload-Offset", "Upload-Length", "Upload-Expires", "Receipt-Job-Id"
+    ],
 )
 
+def request_body_limit(scope) -> int:
+    """Max accepted request body size: one file (or a full batch) plus multipart framing"""
+    settings = get_settings()
+    per_file = settings.max_file_size + MULTIPART_OVERHEAD
+    if scope["path"].endswith("/batch-upload/"):
+        return per_file * settings.batch_max_files
+    return per_file
+
+# Enforce upload size limits while the body is still arriving
+app.add_middleware(BodySizeLimitMiddleware, get_limit=request_body_limit)
+# Outermost, so rejected and failed requests are timed too
+app.add_middleware(MetricsMiddleware)
+
 app.include_router(api_router, prefix="/api/v1")
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "version": "1.0.0"}
+    """Liveness plus upstream circuit breaker states; degraded while a breaker is not closed"""
+    breakers = breaker_states()
+    healthy = all(state["state"] == "closed" for state in breakers.values())
+    return {"status": "healthy" if healthy else "degraded", "version": "1.0.0", "circuit_breakers": breakers}
+
+@app.get("/ready")
+async def readiness_check():
+    """Ready once startup warm-up has finished; use for load balancer checks"""
+    if not getattr(app.state, "ready", False):
+        return JSONResponse({"status": "starting"}, status_code=503)
+    return {"status": "ready"}
+
+def collect_runtime_metrics() -> None:
+    """Copy counters tracked by the cache, governor and job queue into the registry"""
+    cache = get_result_cache()
+    if cache:
+        stats = cache.stats()
+        metrics.CACHE_LOOKUPS.set_total(stats["memory_hits"], result="memory_hit")
+        metrics.CACHE_LOOKUPS.set_total(stats["shared_hits"], result="shared_hit")
+        metrics.CACHE_LOOKUPS.set_total(stats["disk_hits"], result="disk_hit")
+        metrics.CACHE_LOOKUPS.set_total(stats["misses"], result="miss")
+        metrics.CACHE_HIT_RATIO.set(stats["hit_ratio"])
+        metrics.CACHE_ENTRIES.set(stats["entries"])
+
+    governor = get_governor()
+    metrics.UPSTREAM_IN_FLIGHT.set(governor.limiter.in_flight)
+    metrics.UPSTREAM_CONCURRENCY_LIMIT.set(governor.limiter.limit)
+    for operation, state in breaker_states().items():
+        metrics.UPSTREAM_BREAKER_OPEN.set(0 if state["state"] == "closed" else 1, operation=operation)
+
+    admission = get_admission_controller()
+    if admission:
+        metrics.ADMISSION_QUEUED.set(admission.stats()["waiting"])
+
+    single_flight = get_single_flight().stats()
+    metrics.SINGLE_FLIGHT_CALLS.set_total(single_flight["leaders"], role="leader")
+    metrics.SINGLE_FLIGHT_CALLS.set_total(single_flight["coalesced"], role="coalesced")
+    metrics.SINGLE_FLIGHT_IN_FLIGHT.set(single_flight["in_flight"])
+
+    try:
+        metrics.JOBS_QUEUED.set(get_job_manager().queued)
+    except RuntimeError:
+        pass
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics_endpoint():
+    """Prometheus scrape endpoint"""
+    collect_runtime_metrics()
+    return PlainTextResponse(metrics.render_metrics(), media_type="text/plain; version=0.0.4")
 
 @app.get("/")
 async def root():
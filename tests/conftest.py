@@ -0,0 +1,23 @@
+import os
+
+import pytest
+
+# Settings require an API key; tests never call the real API
+os.environ.setdefault("MISTRAL_API_KEY", "test-key")
+
+from backend.app.core.settings import get_settings
+
+
+@pytest.fixture
+def settings():
+    """The settings singleton"""
+    return get_settings()
+
+
+@pytest.fixture
+def settings_override(monkeypatch, settings):
+    """Override settings for one test: ``settings_override(cache_enabled=False)``"""
+    def override(**values):
+        for name, value in values.items():
+            monkeypatch.setattr(settings, name, value)
+    return override
@@ -0,0 +1,148 @@
+import asyncio
+
+import pytest
+
+from backend.app.services import admission as admission_module
+from backend.app.services.admission import (
+    BATCH,
+    INTERACTIVE,
+    AdmissionController,
+    ClientQueueFullError,
+    OverloadedError,
+)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(admission_module.time, "monotonic", clock)
+    return clock
+
+
+def _controller(capacity=1, client_queue_size=10, interactive=4.0, batch=1.0):
+    return AdmissionController(capacity, client_queue_size, {INTERACTIVE: interactive, BATCH: batch})
+
+
+async def _admission_order(controller, requests):
+    """Queue ``requests`` behind one held slot, then release it and record the order slots are granted in"""
+    order = []
+    granted_at = await controller.acquire("holder", INTERACTIVE, None)
+
+    async def request(name, client, priority):
+        granted = await controller.acquire(client, priority, None)
+        order.append(name)
+        await asyncio.sleep(0)
+        controller.release(granted)
+
+    tasks = []
+    for name, client, priority in requests:
+        tasks.append(asyncio.create_task(request(name, client, priority)))
+        await asyncio.sleep(0)
+    controller.release(granted_at)
+    await asyncio.gather(*tasks)
+    return order
+
+
+def test_a_long_queue_only_delays_its_own_client():
+    requests = [(f"bulk{n}", "bulk", INTERACTIVE) for n in range(4)] + [("solo", "solo", INTERACTIVE)]
+    order = asyncio.run(_admission_order(_controller(), requests))
+    assert order.index("solo") == 1
+
+
+def test_interactive_requests_overtake_batch_work_without_starving_it():
+    requests = [(f"batch{n}", "bulk", BATCH) for n in range(3)] + [(f"ui{n}", "ui", INTERACTIVE) for n in range(6)]
+    order = asyncio.run(_admission_order(_controller(interactive=4.0, batch=1.0), requests))
+    # Weight 4 to 1: four interactive slots per batch slot
+    assert order == ["ui0", "ui1", "ui2", "batch0", "ui3", "ui4", "ui5", "batch1", "batch2"]
+
+
+def test_client_queue_full(clock):
+    controller = _controller(client_queue_size=1)
+
+    async def main():
+        await controller.acquire("holder", INTERACTIVE, None)
+        waiter = asyncio.create_task(controller.acquire("client", INTERACTIVE, None))
+        await asyncio.sleep(0)
+        with pytest.raises(ClientQueueFullError):
+            await controller.acquire("client", INTERACTIVE, clock.now + 60)
+        # Other clients still queue
+        other = asyncio.create_task(controller.acquire("other", INTERACTIVE, None))
+        await asyncio.sleep(0)
+        assert controller.stats()["waiting"] == 2
+        waiter.cancel()
+        other.cancel()
+        await asyncio.gather(waiter, other, return_exceptions=True)
+
+    asyncio.run(main())
+    assert controller.stats()["client_queue_full"] == 1
+
+
+def test_request_that_would_miss_its_deadline_is_shed_with_retry_after(clock):
+    controller = _controller(capacity=2)
+
+    async def main():
+        # Two 5 second requests teach the controller the service time
+        for _ in range(2):
+            granted = await controller.acquire("a", INTERACTIVE, None)
+            clock.now += 5
+            controller.release(granted)
+        await controller.acquire("a", INTERACTIVE, None)
+        await controller.acquire("b", INTERACTIVE, None)
+        waiter = asyncio.create_task(controller.acquire("c", INTERACTIVE, None))
+        await asyncio.sleep(0)
+
+        # One waiter ahead on two slots: ~5s of waiting plus ~5s of work
+        assert controller.estimated_wait("d", INTERACTIVE) == pytest.approx(5.0)
+        with pytest.raises(OverloadedError) as error:
+            await controller.acquire("d", INTERACTIVE, clock.now + 8)
+        controller.check("d", INTERACTIVE, clock.now + 11)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        return error.value.retry_after
+
+    assert asyncio.run(main()) == 5
+    assert controller.stats()["shed"] == 1
+
+
+def test_cancelled_waiter_does_not_leak_a_slot():
+    controller = _controller()
+
+    async def main():
+        granted_at = await controller.acquire("holder", INTERACTIVE, None)
+        abandoned = asyncio.create_task(controller.acquire("a", INTERACTIVE, None))
+        nxt = asyncio.create_task(controller.acquire("b", INTERACTIVE, None))
+        await asyncio.sleep(0)
+        abandoned.cancel()
+        await asyncio.gather(abandoned, return_exceptions=True)
+        controller.release(granted_at)
+        controller.release(await asyncio.wait_for(nxt, timeout=1))
+
+    asyncio.run(main())
+    assert controller.stats()["in_use"] == 0
+    assert controller.stats()["waiting"] == 0
+
+
+def test_slot_granted_as_the_caller_gives_up_is_handed_on():
+    controller = _controller()
+
+    async def main():
+        granted_at = await controller.acquire("holder", INTERACTIVE, None)
+        first = asyncio.create_task(controller.acquire("a", INTERACTIVE, None))
+        second = asyncio.create_task(controller.acquire("b", INTERACTIVE, None))
+        await asyncio.sleep(0)
+        # The slot goes to "a" and "a" is cancelled before it runs again
+        controller.release(granted_at)
+        first.cancel()
+        await asyncio.gather(first, return_exceptions=True)
+        controller.release(await asyncio.wait_for(second, timeout=1))
+
+    asyncio.run(main())
+    assert controller.stats()["in_use"] == 0
@@ -0,0 +1,96 @@
+import pytest
+
+from backend.app.services import breaker as breaker_module
+from backend.app.services.breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(breaker_module.time, "monotonic", clock)
+    return clock
+
+
+def _breaker(**overrides):
+    options = dict(window_seconds=60, min_calls=4, failure_rate=0.5, slow_call_seconds=5,
+                   open_seconds=30, half_open_calls=2)
+    options.update(overrides)
+    return CircuitBreaker("parse", **options)
+
+
+def _open(breaker):
+    for _ in range(breaker.min_calls):
+        breaker.record(failed=True)
+    assert breaker.state == OPEN
+
+
+def test_opens_once_enough_calls_fail(clock):
+    breaker = _breaker()
+    for failed in (True, False, True):
+        breaker.record(failed=failed)
+    assert breaker.state == CLOSED
+
+    breaker.record(failed=False, latency=6.0)
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError) as error:
+        breaker.before_call()
+    assert error.value.retry_after == 30
+
+
+def test_failures_outside_the_window_are_forgotten(clock):
+    breaker = _breaker()
+    for _ in range(3):
+        breaker.record(failed=True)
+    clock.now += 61
+    breaker.record(failed=True)
+    assert breaker.state == CLOSED
+
+
+def test_half_opens_after_the_cool_down(clock):
+    breaker = _breaker()
+    _open(breaker)
+    clock.now += 29
+    assert breaker.state == OPEN
+    clock.now += 1
+    assert breaker.state == HALF_OPEN
+
+    breaker.before_call()
+    breaker.before_call()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_closes_when_every_probe_succeeds(clock):
+    breaker = _breaker()
+    _open(breaker)
+    clock.now += 30
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record(failed=False, latency=0.1)
+        breaker.after_call()
+    assert breaker.state == CLOSED
+    assert breaker.snapshot()["calls_in_window"] == 0
+
+
+def test_a_failed_probe_reopens(clock):
+    breaker = _breaker()
+    _open(breaker)
+    clock.now += 30
+    breaker.before_call()
+    breaker.record(failed=False)
+    breaker.after_call()
+    breaker.before_call()
+    breaker.record(failed=True)
+    breaker.after_call()
+
+    assert breaker.state == OPEN
+    assert breaker.retry_after() == 30
+    assert breaker.snapshot()["opened"] == 2
@@ -0,0 +1,80 @@
+import asyncio
+import json
+
+import pytest
+
+from backend.app.services.bulk_ingest import OCR_ENDPOINT, BatchBackend, ingest_directory, scan_receipts
+
+# Minimal PNG signature; the backend below never looks at the pixels
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 16
+
+
+class ScriptedBackend(BatchBackend):
+    """Answers only the listed custom ids of each step, then optionally fails"""
+
+    def __init__(self, ocr, parse, fail_with=None):
+        self.ocr = ocr
+        self.parse = parse
+        self.fail_with = fail_with
+
+    async def run(self, endpoint, model, input_path):
+        with open(input_path, "r", encoding="utf-8") as f:
+            custom_ids = [json.loads(line)["custom_id"] for line in f]
+        answered = self.ocr if endpoint == OCR_ENDPOINT else self.parse
+        for custom_id in custom_ids:
+            if custom_id not in answered:
+                continue
+            if endpoint == OCR_ENDPOINT:
+                body = {"pages": [{"markdown": "Cafe\nTOTAL 4.50"}]}
+            else:
+                body = {"choices": [{"message": {"content": '{"merchant": "Cafe", "total": 4.5}'}}]}
+            yield {"custom_id": custom_id, "response": {"status_code": 200, "body": body}, "error": None}
+        if self.fail_with:
+            raise RuntimeError(self.fail_with)
+
+
+@pytest.fixture
+def receipts(tmp_path):
+    directory = tmp_path / "receipts"
+    directory.mkdir()
+    for index in range(3):
+        (directory / f"r{index}.png").write_bytes(PNG + bytes([index]))
+    return directory
+
+
+def _ids(receipts):
+    return {receipt.path.rsplit("/", 1)[-1]: receipt.sha256 for receipt in scan_receipts(str(receipts), ["image/png"])}
+
+
+def _ingest(tmp_path, receipts, backend):
+    output = tmp_path / "out.jsonl"
+    stats = asyncio.run(ingest_directory(str(receipts), str(output), backend, str(tmp_path / "work")))
+    lines = [json.loads(line) for line in output.read_text().splitlines()]
+    return stats, {line["filename"].rsplit("/", 1)[-1]: line for line in lines}
+
+
+@pytest.fixture(autouse=True)
+def no_shortcuts(settings_override):
+    settings_override(cache_enabled=False, local_parser_enabled=False)
+
+
+def test_every_receipt_gets_a_line_when_a_batch_job_drops_some(tmp_path, receipts):
+    ids = _ids(receipts)
+    # OCR never answers r2 and the parse job times out before answering r1
+    backend = ScriptedBackend(ocr={ids["r0.png"], ids["r1.png"]}, parse={ids["r0.png"]})
+    stats, lines = _ingest(tmp_path, receipts, backend)
+
+    assert stats == {"processed": 3, "succeeded": 1, "failed": 2}
+    assert lines["r0.png"]["data"] == {"merchant": "Cafe", "total": 4.5}
+    assert lines["r1.png"]["error"].startswith("No parse result")
+    assert lines["r2.png"]["error"].startswith("No OCR result")
+
+
+def test_a_failing_batch_job_reports_its_error_for_unanswered_receipts(tmp_path, receipts):
+    ids = _ids(receipts)
+    backend = ScriptedBackend(ocr={ids["r0.png"]}, parse={ids["r0.png"]}, fail_with="job FAILED")
+    stats, lines = _ingest(tmp_path, receipts, backend)
+
+    assert stats["processed"] == 3
+    assert lines["r1.png"]["error"] == "OCR batch job failed: job FAILED"
+    assert lines["r2.png"]["error"] == "OCR batch job failed: job FAILED"
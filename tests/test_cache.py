@@ -0,0 +1,84 @@
+import asyncio
+import os
+
+from backend.app.services import cache as cache_module
+from backend.app.services.cache import ResultCache
+
+
+def _cache(tmp_path, **overrides):
+    options = dict(max_entries=8, disk_dir=str(tmp_path / "cache"), max_disk_bytes=10_000, disk_sweep_seconds=3600)
+    options.update(overrides)
+    return ResultCache(**options)
+
+
+def test_memory_hits_return_a_copy(tmp_path):
+    cache = _cache(tmp_path, disk_dir=None)
+    value = {"merchant": "Cafe", "items": [{"name": "Coffee"}]}
+
+    async def main():
+        await cache.set("parse:a", value)
+        value["items"].append({"name": "Tea"})
+        first = await cache.get("parse:a")
+        first["items"].clear()
+        return await cache.get("parse:a")
+
+    assert asyncio.run(main()) == {"merchant": "Cafe", "items": [{"name": "Coffee"}]}
+    assert cache.stats()["memory_hits"] == 2
+
+
+def test_disk_writes_do_not_scan_the_directory_while_under_budget(tmp_path, monkeypatch):
+    cache = _cache(tmp_path)
+    scans = []
+    scandir = os.scandir
+
+    def counting_scandir(path):
+        scans.append(path)
+        return scandir(path)
+
+    monkeypatch.setattr(cache_module.os, "scandir", counting_scandir)
+
+    async def main():
+        for index in range(5):
+            await cache.set(f"parse:{index}", {"total": index})
+
+    asyncio.run(main())
+    # Only the first write scans, to learn the size of what is already there
+    assert len(scans) == 1
+    assert cache._disk_bytes == sum(entry.stat().st_size for entry in os.scandir(cache.disk_dir))
+
+
+def test_going_over_the_disk_budget_evicts_the_oldest_files(tmp_path):
+    cache = _cache(tmp_path, max_disk_bytes=1_000)
+    payload = "x" * 200
+
+    async def main():
+        for index in range(8):
+            await cache.set(f"parse:{index}", {"text": payload})
+            path = cache._disk_path(f"parse:{index}")
+            # Distinct mtimes so the oldest file is well defined
+            os.utime(path, (1_700_000_000 + index, 1_700_000_000 + index))
+
+    cache.ttl_seconds = float("inf")
+    asyncio.run(main())
+    remaining = sorted(os.listdir(cache.disk_dir))
+    total = sum(os.path.getsize(os.path.join(cache.disk_dir, name)) for name in remaining)
+    assert cache._disk_bytes == total <= 1_000
+    assert cache._disk_path("parse:7").rsplit("/", 1)[-1] in remaining
+    assert cache._disk_path("parse:0").rsplit("/", 1)[-1] not in remaining
+    assert cache.stats()["evictions"] > 0
+
+
+def test_a_due_sweep_picks_up_files_written_elsewhere(tmp_path, monkeypatch):
+    cache = _cache(tmp_path, disk_sweep_seconds=60)
+    now = [1000.0]
+    monkeypatch.setattr(cache_module.time, "monotonic", lambda: now[0])
+
+    asyncio.run(cache.set("parse:a", {"total": 1}))
+    (tmp_path / "cache" / "other.json").write_text('{"key": "parse:b", "value": {"total": 2}}')
+    asyncio.run(cache.set("parse:c", {"total": 3}))
+    tracked = cache._disk_bytes
+
+    now[0] += 61
+    asyncio.run(cache.set("parse:d", {"total": 4}))
+    assert cache._disk_bytes == sum(entry.stat().st_size for entry in os.scandir(cache.disk_dir))
+    assert cache._disk_bytes > tracked + len('{"key": "parse:d", "value": {"total": 4}}')
@@ -0,0 +1,79 @@
+from backend.app.services.chunking import chunk_lines, merge_chunk_results, split_receipt, split_sections
+
+TOTALS = ["SUBTOTAL 26.00", "Tax 2.00", "TOTAL 28.00"]
+
+
+def _item(name, price):
+    return {"name": name, "price": price}
+
+
+def test_split_sections():
+    lines = ["Corner Shop", "2024-03-01", "Milk 3.00", "Bread 5.00", "SUBTOTAL 8.00", "TOTAL 8.00", "Thank you"]
+    assert split_sections(lines) == (
+        ["Corner Shop", "2024-03-01"], ["Milk 3.00", "Bread 5.00"], ["SUBTOTAL 8.00", "TOTAL 8.00", "Thank you"],
+    )
+
+
+def test_chunk_lines_repeats_the_overlap():
+    assert chunk_lines(list("abcdefg"), 3, 1) == [list("abc"), list("cde"), list("efg")]
+    assert chunk_lines(list("abc"), 3, 1) == [list("abc")]
+    assert chunk_lines(list("abcdefg"), 0, 1) == [list("abcdefg")]
+
+
+def test_split_receipt_puts_header_first_and_totals_last():
+    markdown = "# Corner Shop\n" + "\n".join(f"| Item {n} | {n}.00 |" for n in range(1, 6)) + "\nTOTAL 15.00"
+    chunks = split_receipt(markdown, chunk_size=3, overlap=1)
+    assert chunks.texts == [
+        "Corner Shop\nItem 1 1.00\nItem 2 2.00\nItem 3 3.00",
+        "Item 3 3.00\nItem 4 4.00\nItem 5 5.00\nTOTAL 15.00",
+    ]
+    assert chunks.totals == ["TOTAL 15.00"]
+
+
+def test_exact_overlap_repeat_is_dropped():
+    results = [
+        {"merchant": "Shop", "items": [_item("A", 4.0), _item("B", 6.0), _item("C", 5.0)]},
+        {"merchant": None, "items": [_item("B", 6.0), _item("C", 5.0), _item("D", 11.0)], "subtotal": 26.0},
+    ]
+    merged = merge_chunk_results(results, overlap=2, totals=TOTALS)
+    assert [item["name"] for item in merged["items"]] == ["A", "B", "C", "D"]
+    assert (merged["merchant"], merged["subtotal"], merged["tax"], merged["total"]) == ("Shop", 26.0, 2.0, 28.0)
+
+
+def test_respelled_item_counted_twice_at_a_boundary_is_dropped():
+    results = [
+        {"items": [_item("A", 4.0), _item("B", 6.0), _item("Cheese Burger", 5.0)]},
+        {"items": [_item("Cheese Brgr", 5.0), _item("D", 11.0)]},
+    ]
+    merged = merge_chunk_results(results, overlap=2, totals=TOTALS)
+    assert [item["name"] for item in merged["items"]] == ["A", "B", "Cheese Burger", "D"]
+
+
+def test_respelled_item_is_kept_when_the_sum_does_not_point_at_it():
+    results = [
+        {"items": [_item("A", 4.0), _item("B", 6.0), _item("Cheese Burger", 5.0)]},
+        {"items": [_item("Cheese Brgr", 5.0), _item("D", 11.0)]},
+    ]
+    merged = merge_chunk_results(results, overlap=2, totals=["SUBTOTAL 31.00", "TOTAL 31.00"])
+    assert len(merged["items"]) == 5
+
+
+def test_genuine_repeated_order_is_restored():
+    # The receipt has C twice; the second chunk's parse skipped its overlap line,
+    # so its C looks like the first chunk's repeated
+    results = [
+        {"items": [_item("A", 4.0), _item("C", 5.0)]},
+        {"items": [_item("C", 5.0), _item("D", 12.0)]},
+    ]
+    merged = merge_chunk_results(results, overlap=1, totals=TOTALS)
+    assert [item["name"] for item in merged["items"]] == ["A", "C", "C", "D"]
+
+
+def test_receipt_without_totals_block_is_merged_as_parsed():
+    results = [
+        {"items": [_item("A", 4.0), _item("Cheese Burger", 5.0)]},
+        {"items": [_item("Cheese Brgr", 5.0), _item("D", 11.0)]},
+    ]
+    merged = merge_chunk_results(results, overlap=1, totals=[])
+    assert [item["name"] for item in merged["items"]] == ["A", "Cheese Burger", "Cheese Brgr", "D"]
+    assert (merged.get("subtotal"), merged["tax"], merged.get("total")) == (None, 0.0, None)
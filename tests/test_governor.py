@@ -0,0 +1,338 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from backend.app.services import breaker as breaker_module
+from backend.app.services import governor as governor_module
+from backend.app.services.deadline import deadline_scope
+from backend.app.services.governor import (
+    AdaptiveLimiter,
+    TokenBucket,
+    UpstreamDeadlineExceededError,
+    UpstreamGovernor,
+    UpstreamRateLimitedError,
+)
+
+
+def _governor(**overrides):
+    options = dict(
+        requests_per_minute=6000, burst=100, initial_concurrency=4, min_concurrency=1, max_concurrency=8,
+        max_retries=2, backoff_base=0.01, backoff_max=0.01, latency_spike_factor=100.0, default_deadline=5.0,
+    )
+    options.update(overrides)
+    return UpstreamGovernor(**options)
+
+
+@pytest.fixture(autouse=True)
+def fresh_breakers(monkeypatch):
+    monkeypatch.setattr(breaker_module, "_breakers", {})
+
+
+def _client(handler):
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler), base_url="https://upstream")
+
+
+async def _slow_body(chunks, pause):
+    for chunk in chunks:
+        await asyncio.sleep(pause)
+        yield chunk
+
+
+def test_stream_holds_slot_until_body_is_read():
+    governor = _governor()
+    in_flight_while_reading = []
+
+    async def consume(response):
+        lines = []
+        async for line in response.aiter_lines():
+            in_flight_while_reading.append(governor.limiter.in_flight)
+            lines.append(line)
+        return lines
+
+    async def main():
+        async with _client(lambda request: httpx.Response(200, content=_slow_body([b"a\n", b"b\n", b"c\n"], 0.05))) as client:
+            lines = await governor.stream(
+                "parse", lambda: client.send(client.build_request("POST", "/chat"), stream=True), consume
+            )
+        return lines
+
+    assert asyncio.run(main()) == ["a", "b", "c"]
+    assert in_flight_while_reading == [1, 1, 1]
+    assert governor.limiter.in_flight == 0
+    # Latency covers the whole body, not just the headers
+    assert governor.stats()["latency_ewma"]["parse"] >= 0.15
+
+
+def test_stream_retries_throttled_responses_without_consuming_them():
+    governor = _governor()
+    statuses = iter([429, 200])
+    consumed = []
+
+    async def consume(response):
+        consumed.append(response.status_code)
+        return await response.aread()
+
+    async def main():
+        async with _client(lambda request: httpx.Response(next(statuses), content=b"ok")) as client:
+            return await governor.stream("parse", lambda: client.send(client.build_request("POST", "/chat"), stream=True), consume)
+
+    assert asyncio.run(main()) == b"ok"
+    assert consumed == [200]
+    assert governor.stats()["retries"] == 1
+
+
+def test_stream_slow_body_counts_as_a_slow_call(settings_override):
+    settings_override(breaker_slow_call_seconds=0.05, breaker_min_calls=1, breaker_failure_rate=0.5)
+    governor = _governor()
+
+    async def consume(response):
+        return await response.aread()
+
+    async def main():
+        async with _client(lambda request: httpx.Response(200, content=_slow_body([b"x", b"y"], 0.05))) as client:
+            await governor.stream("parse", lambda: client.send(client.build_request("POST", "/chat"), stream=True), consume)
+
+    asyncio.run(main())
+    assert breaker_module.get_breaker("parse").state == breaker_module.OPEN
+
+
+def test_stream_error_status_is_raised_and_recorded(settings_override):
+    settings_override(breaker_min_calls=1, breaker_failure_rate=0.5)
+    governor = _governor()
+
+    async def consume(response):
+        await response.aread()
+        response.raise_for_status()
+
+    async def main():
+        async with _client(lambda request: httpx.Response(500, content=b"boom")) as client:
+            await governor.stream("parse", lambda: client.send(client.build_request("POST", "/chat"), stream=True), consume)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(main())
+    assert governor.limiter.in_flight == 0
+    assert breaker_module.get_breaker("parse").state == breaker_module.OPEN
+
+
+def _hanging_call(governor, deadline=None):
+    async def hang(request):
+        await asyncio.sleep(10)
+
+    async def main():
+        async with _client(hang) as client:
+            await governor.send("parse", lambda: client.post("/chat"), deadline)
+
+    return main
+
+
+def test_upstream_timeout_counts_against_the_breaker(settings_override):
+    settings_override(breaker_min_calls=1, breaker_failure_rate=0.5)
+    governor = _governor(default_deadline=0.05)
+
+    with pytest.raises(UpstreamDeadlineExceededError):
+        asyncio.run(_hanging_call(governor)())
+    assert breaker_module.get_breaker("parse").state == breaker_module.OPEN
+
+
+def test_request_deadline_timeout_does_not_count_against_the_breaker(settings_override):
+    settings_override(breaker_min_calls=1, breaker_failure_rate=0.5)
+    governor = _governor(default_deadline=5.0)
+
+    async def main():
+        with deadline_scope(time.monotonic() + 0.05):
+            await _hanging_call(governor)()
+
+    with pytest.raises(UpstreamDeadlineExceededError):
+        asyncio.run(main())
+    assert breaker_module.get_breaker("parse").state == breaker_module.CLOSED
+    assert governor.limiter.in_flight == 0
+
+
+def _hedged_calls(governor, pauses):
+    requests = []
+
+    async def handler(request):
+        requests.append(request)
+        await asyncio.sleep(pauses[min(len(requests), len(pauses)) - 1])
+        return httpx.Response(200, content=b"ok")
+
+    async def main():
+        async with _client(handler) as client:
+            # The first call primes the latency samples, the second is hedged
+            for _ in range(2):
+                await governor.send("parse", lambda: client.post("/chat"))
+
+    asyncio.run(main())
+    return requests
+
+
+def test_a_hedge_without_a_free_slot_gives_its_budget_back():
+    governor = _governor(initial_concurrency=1, max_concurrency=1, hedge_enabled=True,
+                         hedge_budget=1.0, hedge_min_samples=1)
+
+    requests = _hedged_calls(governor, [0.0, 0.1])
+    assert len(requests) == 2
+    assert governor.stats()["hedges"] == 0
+
+
+def test_a_dispatched_hedge_spends_budget():
+    governor = _governor(initial_concurrency=2, max_concurrency=2, hedge_enabled=True,
+                         hedge_budget=1.0, hedge_min_samples=1)
+
+    requests = _hedged_calls(governor, [0.0, 0.1, 0.0])
+    assert len(requests) == 3
+    assert governor.stats()["hedges"] == 1
+    assert governor.stats()["hedge_wins"] == 1
+
+
+class Clock:
+    """Fake monotonic clock; sleeping advances it instead of waiting"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+        await _real_sleep(0)
+
+
+_real_sleep = asyncio.sleep
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(governor_module.time, "monotonic", clock)
+    monkeypatch.setattr(governor_module.asyncio, "sleep", clock.sleep)
+    return clock
+
+
+def _send_all(governor, statuses, headers=None):
+    """Send one call per status script entry and record the statuses the transport served"""
+    served = []
+    script = iter(statuses)
+
+    def handler(request):
+        status = next(script)
+        served.append(status)
+        return httpx.Response(status, headers=headers if status == 429 else None, content=b"ok")
+
+    async def main():
+        async with _client(handler) as client:
+            return await governor.send("parse", lambda: client.post("/chat"))
+
+    return asyncio.run(main()), served
+
+
+def test_token_bucket_paces_calls_beyond_the_burst(clock):
+    bucket = TokenBucket(rate=2.0, capacity=2)
+
+    async def main():
+        for _ in range(4):
+            await bucket.acquire(clock.now + 10)
+
+    asyncio.run(main())
+    # Two calls ride the burst, then one every half second
+    assert clock.sleeps == [0.5, 0.5]
+
+
+def test_token_bucket_refuses_a_wait_past_the_deadline(clock):
+    bucket = TokenBucket(rate=1.0, capacity=1)
+
+    async def main():
+        await bucket.acquire(clock.now)
+        await bucket.acquire(clock.now + 0.5)
+
+    with pytest.raises(UpstreamDeadlineExceededError):
+        asyncio.run(main())
+    assert clock.sleeps == []
+
+
+def test_governor_calls_are_paced_to_the_request_rate(clock):
+    governor = _governor(requests_per_minute=120, burst=1)
+
+    async def main():
+        async with _client(lambda request: httpx.Response(200)) as client:
+            for _ in range(3):
+                await governor.send("parse", lambda: client.post("/chat"))
+
+    asyncio.run(main())
+    assert clock.sleeps == [0.5, 0.5]
+
+
+def test_retry_after_is_honoured_with_jitter_on_top(clock):
+    governor = _governor(backoff_base=0.25)
+
+    response, served = _send_all(governor, [429, 200], headers={"Retry-After": "2"})
+    assert response.status_code == 200
+    assert served == [429, 200]
+    assert len(clock.sleeps) == 1
+    assert 2.0 <= clock.sleeps[0] <= 2.25
+
+
+def test_retry_after_past_the_deadline_gives_up(clock):
+    governor = _governor(default_deadline=1.0)
+
+    with pytest.raises(UpstreamRateLimitedError) as error:
+        _send_all(governor, [429, 200], headers={"Retry-After": "30"})
+    assert error.value.retry_after == 30
+    assert clock.sleeps == []
+
+
+@pytest.mark.parametrize("status", [429, 502, 503, 504])
+def test_throttling_and_gateway_errors_are_retried(clock, monkeypatch, status):
+    jitter = []
+
+    def uniform(low, high):
+        jitter.append((low, high))
+        return high
+
+    monkeypatch.setattr(governor_module.random, "uniform", uniform)
+    governor = _governor(backoff_base=0.1, backoff_max=1.0)
+
+    response, served = _send_all(governor, [status, status, 200])
+    assert response.status_code == 200
+    assert served == [status, status, 200]
+    # Full-jitter exponential backoff, plus up to backoff_base on top
+    assert jitter == [(0, 0.1), (0, 0.1), (0, 0.2), (0, 0.1)]
+    assert clock.sleeps == pytest.approx([0.2, 0.3])
+    assert governor.stats()["retries"] == 2
+
+
+@pytest.mark.parametrize("status", [400, 404, 500])
+def test_other_errors_are_returned_without_retrying(clock, status):
+    governor = _governor()
+
+    response, served = _send_all(governor, [status, 200])
+    assert response.status_code == status
+    assert served == [status]
+    assert clock.sleeps == []
+
+
+def test_throttling_shrinks_the_concurrency_limit_and_success_grows_it(clock):
+    governor = _governor(initial_concurrency=8, min_concurrency=1, max_concurrency=8)
+
+    _send_all(governor, [429, 429, 200])
+    # Halved twice, then one healthy call adds 1/limit
+    assert governor.limiter.limit == pytest.approx(2.5)
+
+
+def test_adaptive_limit_stays_within_its_bounds():
+    limiter = AdaptiveLimiter(initial=2, minimum=1, maximum=3)
+    for _ in range(3):
+        limiter.on_congestion()
+    assert limiter.limit == 1
+
+    grown = []
+    for _ in range(6):
+        limiter.on_success()
+        grown.append(round(limiter.limit, 3))
+    # About one more slot per window of healthy calls, capped at the maximum
+    assert grown == [2.0, 2.5, 2.9, 3, 3, 3]
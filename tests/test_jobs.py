@@ -0,0 +1,169 @@
+import asyncio
+import sqlite3
+import time
+from contextlib import asynccontextmanager
+
+import pytest
+
+from backend.app.services import jobs
+from backend.app.services.admission import BACKGROUND_CLIENT, BATCH
+from backend.app.services.jobs import STATUS_QUEUED, STATUS_RUNNING, JobManager, JobStore
+from backend.app.services.upload import ImageUpload
+
+
+def _upload(name="r.png"):
+    return ImageUpload(data=bytearray(b"image"), mime_type="image/png", sha256="0" * 64, filename=name)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.db"))
+    yield store
+    store.close()
+
+
+def _age(store, job_id, seconds):
+    """Pretend a job was last touched ``seconds`` ago"""
+    with store._lock:
+        store._conn.execute("UPDATE jobs SET updated_at = ? WHERE id = ?", (time.time() - seconds, job_id))
+
+
+def test_recover_requeues_only_stale_running_jobs(store):
+    queued = store.create(_upload("queued"))
+    stale = store.create(_upload("stale"))
+    fresh = store.create(_upload("fresh"))
+    store.claim(stale)
+    store.claim(fresh)
+    _age(store, stale, 600)
+
+    assert store.recover(stale_after=300) == [queued, stale]
+    assert store.get(stale)["status"] == STATUS_QUEUED
+    assert store.get(fresh)["status"] == STATUS_RUNNING
+
+
+def test_touch_keeps_a_running_job_from_being_recovered(store):
+    job_id = store.create(_upload())
+    store.claim(job_id)
+    _age(store, job_id, 600)
+    store.touch([job_id])
+    assert store.recover(stale_after=300) == []
+
+
+def test_requeue_only_moves_running_jobs(store):
+    job_id = store.create(_upload())
+    store.claim(job_id)
+    store.requeue(job_id)
+    assert store.get(job_id)["status"] == STATUS_QUEUED
+
+    store.claim(job_id)
+    store.finish(job_id, result={"total": 1})
+    store.requeue(job_id)
+    assert store.get(job_id)["status"] == "succeeded"
+
+
+@pytest.fixture
+def blocked_pipeline(monkeypatch):
+    """Make job processing hang until cancelled, reporting when it starts"""
+    started = asyncio.Event()
+
+    async def hang(upload):
+        started.set()
+        await asyncio.sleep(3600)
+
+    monkeypatch.setattr(jobs, "process_receipt", hang)
+    return started
+
+
+def test_stop_hands_running_jobs_back_to_the_queue(tmp_path, blocked_pipeline):
+    db_path = str(tmp_path / "jobs.db")
+
+    async def main():
+        manager = JobManager(JobStore(db_path), workers=1, max_pending=10, stale_after=300)
+        await manager.start()
+        job_id = await manager.submit(_upload())
+        await asyncio.wait_for(blocked_pipeline.wait(), timeout=5)
+        await manager.stop()
+        return job_id
+
+    job_id = asyncio.run(main())
+    store = JobStore(db_path)
+    try:
+        assert store.get(job_id)["status"] == STATUS_QUEUED
+        assert store.recover(stale_after=300) == [job_id]
+    finally:
+        store.close()
+
+
+def test_heartbeat_refreshes_running_jobs(tmp_path, blocked_pipeline):
+    db_path = str(tmp_path / "jobs.db")
+
+    async def main():
+        manager = JobManager(JobStore(db_path), workers=1, max_pending=10, stale_after=0.3)
+        await manager.start()
+        job_id = await manager.submit(_upload())
+        await asyncio.wait_for(blocked_pipeline.wait(), timeout=5)
+        # Well past stale_after, another process starting up must not steal the job
+        await asyncio.sleep(0.6)
+        other = JobStore(db_path)
+        try:
+            recovered = other.recover(stale_after=0.3)
+        finally:
+            other.close()
+        await manager.stop()
+        return job_id, recovered
+
+    job_id, recovered = asyncio.run(main())
+    assert job_id not in recovered
+
+
+def test_claim_returns_the_submitting_client(store):
+    job_id = store.create(_upload(), client_id="key:abc")
+    upload, client = store.claim(job_id)
+    assert (upload.filename, client) == ("r.png", "key:abc")
+    assert store.claim(job_id) is None
+
+
+def test_jobs_from_before_client_ids_run_as_background(tmp_path):
+    db_path = str(tmp_path / "jobs.db")
+    conn = sqlite3.connect(db_path)
+    conn.execute(
+        "CREATE TABLE jobs (id TEXT PRIMARY KEY, status TEXT NOT NULL, filename TEXT, mime_type TEXT NOT NULL, "
+        "sha256 TEXT NOT NULL, image BLOB, result TEXT, error TEXT, status_code INTEGER, "
+        "created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+    )
+    conn.execute("INSERT INTO jobs VALUES ('old', 'queued', 'r.png', 'image/png', ?, x'00', NULL, NULL, NULL, 1, 1)",
+                 ("0" * 64,))
+    conn.commit()
+    conn.close()
+
+    store = JobStore(db_path)
+    try:
+        assert store.claim("old")[1] == BACKGROUND_CLIENT
+    finally:
+        store.close()
+
+
+def test_jobs_are_admitted_under_their_submitter(tmp_path, monkeypatch):
+    flows = []
+
+    @asynccontextmanager
+    async def record(client, priority, deadline):
+        flows.append((client, priority, deadline))
+        yield
+
+    async def parse(upload):
+        return {"total": 1}
+
+    monkeypatch.setattr(jobs, "admitted", record)
+    monkeypatch.setattr(jobs, "process_receipt", parse)
+
+    async def main():
+        manager = JobManager(JobStore(str(tmp_path / "jobs.db")), workers=1, max_pending=10, stale_after=300)
+        await manager.start()
+        job_id = await manager.submit(_upload(), "key:abc")
+        job = await manager.get(job_id, wait=5)
+        await manager.stop()
+        return job
+
+    assert asyncio.run(main())["status"] == "succeeded"
+    assert flows == [("key:abc", BATCH, None)]
@@ -0,0 +1,58 @@
+import json
+
+import pytest
+
+from backend.app.services.json_stream import IncrementalJSONDecoder
+
+REPLY = json.dumps({
+    "merchant": "Café \"Quote\" {Brace}",
+    "date": "2024-01-01",
+    "items": [
+        {"name": "Nasi [special]", "price": 75000},
+        {"name": "Teh, manis", "price": 8000, "extra": {"note": "}"}},
+    ],
+    "total": 83000,
+})
+
+
+@pytest.mark.parametrize("size", [1, 3, 7, len(REPLY)])
+def test_items_are_emitted_as_soon_as_complete(size):
+    decoder = IncrementalJSONDecoder()
+    emitted = []
+    for start in range(0, len(REPLY), size):
+        emitted.extend(decoder.feed(REPLY[start:start + size]))
+    assert emitted == json.loads(REPLY)["items"]
+    assert decoder.complete
+    assert decoder.result() == json.loads(REPLY)
+
+
+def test_item_is_emitted_by_the_chunk_that_closes_it():
+    decoder = IncrementalJSONDecoder()
+    assert decoder.feed('{"items": [{"name": "A", "price": 1') == []
+    assert decoder.feed('}, {"name": "B"') == [{"name": "A", "price": 1}]
+
+
+def test_objects_outside_the_items_array_are_not_emitted():
+    decoder = IncrementalJSONDecoder()
+    assert decoder.feed('{"store": {"name": "X"}, "other": [{"a": 1}], "items": []}') == []
+
+
+def test_repair_keeps_complete_items_of_a_truncated_reply():
+    decoder = IncrementalJSONDecoder()
+    decoder.feed('{"merchant": "X", "items": [{"name": "A", "price": 1}, {"name": "B", "pri')
+    assert not decoder.complete
+    assert decoder.repair() == {"merchant": "X", "items": [{"name": "A", "price": 1}]}
+
+
+def test_repair_needs_a_complete_member():
+    decoder = IncrementalJSONDecoder()
+    decoder.feed('{"merchant": "Cut of')
+    with pytest.raises(ValueError):
+        decoder.repair()
+
+
+def test_result_rejects_non_objects():
+    decoder = IncrementalJSONDecoder()
+    decoder.feed("[1, 2]")
+    with pytest.raises(ValueError):
+        decoder.result()
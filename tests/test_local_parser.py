@@ -0,0 +1,88 @@
+import pytest
+
+from backend.app.services.local_parser import amounts_agree, parse_amount, parse_receipt_locally
+
+
+@pytest.mark.parametrize("a, b, agree", [
+    (3.49 + 2.99 + 4.29, 10.77, True),    # float noise in a sum of cents
+    (10.77, 11.76, False),                # a missing 0.99 item
+    (12.70, 12.71, False),                # off by one cent
+    (1346000.0, 1346000.0, True),
+    (1346000.0, 1345999.0, False),        # integer currency: exact
+    (1346000.0, 1333000.0, False),        # within 1% but a whole menu item
+])
+def test_amounts_agree_to_the_smallest_unit(a, b, agree):
+    assert amounts_agree(a, b) is agree
+
+
+@pytest.mark.parametrize("token, separator, value", [
+    ("75,000", None, 75000.0),
+    ("1.346.000", None, 1346000.0),
+    ("1,234.56", ".", 1234.56),
+    ("1.234,56", ",", 1234.56),
+    ("Rp 12.500", ",", 12500.0),
+    ("-4.50", ".", -4.5),
+])
+def test_parse_amount(token, separator, value):
+    assert parse_amount(token, separator) == value
+
+
+def test_consistent_receipt_is_trusted():
+    result = parse_receipt_locally(
+        "# Corner Shop\n2024-03-01\n| Milk | 3.49 |\n| 2 x Bread | 5.98 |\n| Eggs | 4.29 |\n"
+        "SUBTOTAL 13.76\nTax 1.10\nTOTAL 14.86\nCash 20.00"
+    )
+    assert result.data == {
+        "merchant": "Corner Shop",
+        "date": "2024-03-01",
+        "items": [
+            {"name": "Milk", "quantity": 1, "price": 3.49},
+            {"name": "Bread", "quantity": 2, "price": 5.98},
+            {"name": "Eggs", "quantity": 1, "price": 4.29},
+        ],
+        "subtotal": 13.76,
+        "tax": 1.10,
+        "total": 14.86,
+    }
+    assert result.confidence == 1.0
+
+
+def test_item_with_price_on_next_line_is_not_trusted():
+    # Gum's price is on its own line, so only three items parse
+    result = parse_receipt_locally(
+        "Corner Shop\n2024-03-01\nMilk 3.49\nBread 2.99\nGum\n0.99\nEggs 4.29\n"
+        "SUBTOTAL 11.76\nTOTAL 12.70"
+    )
+    assert len(result.data["items"]) == 3
+    assert result.checks["items_match_subtotal"] is False
+    assert result.checks["charges_match_total"] is False
+    assert result.confidence < 0.9
+
+
+def test_integer_currency_must_add_up_exactly():
+    receipt = (
+        "Warung Makan\n12/01/2024\nNasi Goreng 35,000\nEs Teh 8,000\nSate Ayam 42,000\n"
+        "Subtotal {subtotal}\nPB1 8,500\nTotal {total}"
+    )
+    exact = parse_receipt_locally(receipt.format(subtotal="85,000", total="93,500"))
+    assert exact.data["total"] == 93500.0
+    assert exact.confidence == 1.0
+
+    off = parse_receipt_locally(receipt.format(subtotal="86,000", total="94,500"))
+    assert off.checks["items_match_subtotal"] is False
+    assert off.confidence < 0.9
+
+
+def test_receipt_without_total_has_no_confidence():
+    result = parse_receipt_locally("Corner Shop\nMilk 3.49\nBread 2.99")
+    assert result.confidence == 0.0
+    assert result.data["total"] is None
+
+
+@pytest.mark.parametrize("header", ["2024-03-01\n", "# Corner Shop\n"])
+def test_consistent_receipt_missing_merchant_or_date_is_not_trusted(header):
+    result = parse_receipt_locally(
+        header + "| Milk | 3.49 |\n| Eggs | 4.29 |\nSUBTOTAL 7.78\nTax 0.62\nTOTAL 8.40"
+    )
+    assert result.checks["charges_match_total"]
+    assert result.confidence < 0.9
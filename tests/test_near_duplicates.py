@@ -0,0 +1,113 @@
+import asyncio
+import random
+
+import pytest
+
+from backend.app.services import pipeline
+from backend.app.services.cache import ResultCache, ocr_cache_key
+from backend.app.services.near_duplicates import (
+    DuplicateMatch,
+    MultiIndexHash,
+    NearDuplicateIndex,
+    hamming_distance,
+)
+from backend.app.services.upload import ImageUpload
+
+
+def test_hamming_distance():
+    assert hamming_distance(0, 0) == 0
+    assert hamming_distance(0b1011, 0b0001) == 2
+    assert hamming_distance(0, (1 << 64) - 1) == 64
+
+
+def test_multi_index_search_matches_brute_force():
+    rng = random.Random(7)
+    table = MultiIndexHash()
+    values = {f"k{i}": rng.getrandbits(64) for i in range(2000)}
+    # Plant near neighbours of a query
+    query = rng.getrandbits(64)
+    for i, bits in enumerate((0, 3, 7, 10, 11)):
+        flipped = query
+        for bit in rng.sample(range(64), bits):
+            flipped ^= 1 << bit
+        values[f"near{i}"] = flipped
+    for key, value in values.items():
+        table.add(value, key)
+
+    for radius in (0, 5, 10, 12):
+        expected = sorted(
+            (hamming_distance(query, value), key) for key, value in values.items()
+            if hamming_distance(query, value) <= radius
+        )
+        assert sorted(table.search(query, radius)) == expected
+
+
+def test_index_returns_nearest_and_evicts_oldest():
+    index = NearDuplicateIndex(max_entries=2)
+    index.add(0b0000, "a")
+    index.add(0b0111, "b")
+    assert index.nearest(0b0001, 10) == DuplicateMatch(content_hash="a", distance=1)
+    assert index.nearest(0b1111_0000, 2) is None
+
+    index.add(0b1111, "c")
+    assert len(index) == 2
+    assert index.nearest(0b0000, 2) is None
+    assert index.nearest(0b1110, 1) == DuplicateMatch(content_hash="c", distance=1)
+
+
+def test_near_duplicates_do_not_reuse_ocr_by_default(settings):
+    assert settings.near_duplicate_reuse_distance == -1
+    assert not pipeline._reuses_ocr(DuplicateMatch(content_hash="a", distance=0))
+    assert not pipeline._reuses_ocr(None)
+
+
+def test_reuse_distance_is_inclusive_when_enabled(settings_override):
+    settings_override(near_duplicate_reuse_distance=5)
+    assert pipeline._reuses_ocr(DuplicateMatch(content_hash="a", distance=5))
+    assert not pipeline._reuses_ocr(DuplicateMatch(content_hash="a", distance=6))
+
+
+@pytest.fixture
+def ocr_stage(monkeypatch):
+    """run_ocr_stage with a memory-only cache, a fresh index, a fixed dHash and a fake OCR call"""
+    cache = ResultCache(max_entries=16, ttl_seconds=60)
+    index = NearDuplicateIndex(max_entries=16)
+    ocr_calls = []
+
+    async def fake_hash(data):
+        return 0b1010
+
+    async def fake_ocr(upload, key):
+        ocr_calls.append(upload.sha256)
+        await cache.set(key, f"text of {upload.sha256}")
+        return f"text of {upload.sha256}"
+
+    monkeypatch.setattr(pipeline, "get_result_cache", lambda: cache)
+    monkeypatch.setattr(pipeline, "get_near_duplicate_index", lambda: index)
+    monkeypatch.setattr(pipeline, "perceptual_hash", fake_hash)
+    monkeypatch.setattr(pipeline, "_ocr_upload", fake_ocr)
+    return cache, index, ocr_calls
+
+
+def _image(sha256):
+    return ImageUpload(data=bytearray(b"x"), mime_type="image/png", sha256=sha256, filename="r.png")
+
+
+def test_edited_lookalike_is_flagged_but_ocrd_again(ocr_stage):
+    cache, index, ocr_calls = ocr_stage
+    index.add(0b1011, "original")
+    asyncio.run(cache.set(ocr_cache_key("original"), "text of original"))
+
+    upload = _image("edited")
+    assert asyncio.run(pipeline.run_ocr_stage(upload)) == "text of edited"
+    assert ocr_calls == ["edited"]
+    assert upload.duplicate_of == DuplicateMatch(content_hash="original", distance=1)
+
+
+def test_identical_upload_is_served_from_cache(ocr_stage):
+    cache, index, ocr_calls = ocr_stage
+    asyncio.run(pipeline.run_ocr_stage(_image("same")))
+    upload = _image("same")
+    assert asyncio.run(pipeline.run_ocr_stage(upload)) == "text of same"
+    assert ocr_calls == ["same"]
+    assert upload.duplicate_of == DuplicateMatch(content_hash="same", distance=0)
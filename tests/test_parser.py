@@ -0,0 +1,62 @@
+import asyncio
+
+import httpx
+import pytest
+
+from backend.app.services import governor as governor_module
+from backend.app.services import parser as parser_module
+from backend.app.services.parser import _PrefixEcho, parse_receipt
+from benchmarks.mock_mistral import PARSED_RECEIPT, build_parser, create_app
+
+
+def _mock(*args):
+    options = build_parser().parse_args([
+        "--parse-latency-ms", "0", "--token-interval-ms", "0", "--jitter-ms", "0", *args,
+    ])
+    return create_app(options)
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Point the parser at the mock API; returns a setter taking mock_mistral options"""
+    monkeypatch.setattr(governor_module, "_governor", None)
+
+    def use(*args):
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=_mock(*args)), base_url="http://mock")
+        monkeypatch.setattr(parser_module, "get_http_client", lambda: client)
+
+    return use
+
+
+def test_parses_a_streamed_reply(upstream):
+    upstream()
+    items = []
+    assert asyncio.run(parse_receipt("receipt", items.append)) == PARSED_RECEIPT
+    assert items == PARSED_RECEIPT["items"]
+
+
+def test_continues_a_truncated_reply_that_echoes_its_prefix(upstream, settings_override):
+    # The reply is 253 characters: two continuations finish it
+    settings_override(parse_max_continuations=2)
+    upstream("--truncate-chars", "100")
+    items = []
+    assert asyncio.run(parse_receipt("receipt", items.append)) == PARSED_RECEIPT
+    assert items == PARSED_RECEIPT["items"]
+
+
+def test_repairs_a_reply_still_truncated_after_the_last_continuation(upstream, settings_override):
+    settings_override(parse_max_continuations=1)
+    upstream("--truncate-chars", "60")
+    result = asyncio.run(parse_receipt("receipt"))
+    assert result["merchant"] == PARSED_RECEIPT["merchant"]
+    assert result["items"] == PARSED_RECEIPT["items"][:1]
+
+
+def test_prefix_echo_is_dropped_across_chunks():
+    echo = _PrefixEcho('{"a": 1, ')
+    assert [echo.strip(chunk) for chunk in ('{"a"', ': 1, "b', '": 2}')] == ["", '"b', '": 2}']
+
+
+def test_a_reply_without_the_echo_is_kept_whole():
+    echo = _PrefixEcho('{"a": 1, ')
+    assert [echo.strip(chunk) for chunk in ('{"', 'b": 2}')] == ["", '{"b": 2}']
@@ -0,0 +1,89 @@
+import asyncio
+import base64
+import hashlib
+
+import pytest
+
+from backend.app.services.resumable import (
+    ChecksumMismatchError,
+    ResumableUploadStore,
+    UploadNotFoundError,
+    UploadOffsetMismatchError,
+    parse_checksum,
+)
+
+IMAGE = b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 4
+
+
+def _store(spool):
+    return ResumableUploadStore(str(spool), ttl=3600, max_size=1024 * 1024, allowed_types=["image/png"])
+
+
+async def _body(*chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+def _append(store, upload_id, offset, *chunks, checksum=None):
+    return asyncio.run(store.append(upload_id, offset, _body(*chunks), checksum))
+
+
+def _checksum(data, algorithm="sha256"):
+    return parse_checksum(f"{algorithm} {base64.b64encode(hashlib.new(algorithm, data).digest()).decode()}")
+
+
+@pytest.fixture
+def store(tmp_path):
+    return _store(tmp_path / "spool")
+
+
+def test_append_refuses_a_chunk_for_the_wrong_offset(store):
+    upload = store.create(len(IMAGE), "r.png")
+    _append(store, upload.id, 0, IMAGE[:100])
+
+    with pytest.raises(UploadOffsetMismatchError) as error:
+        _append(store, upload.id, 50, IMAGE[50:])
+    assert error.value.offset == 100
+    assert store.status(upload.id).offset == 100
+
+
+def test_a_chunk_failing_its_checksum_is_not_written(store):
+    upload = store.create(len(IMAGE), "r.png")
+    _append(store, upload.id, 0, IMAGE[:100], checksum=_checksum(IMAGE[:100]))
+
+    with pytest.raises(ChecksumMismatchError):
+        _append(store, upload.id, 100, IMAGE[100:200], checksum=_checksum(b"something else"))
+    assert store.status(upload.id).offset == 100
+
+    finished = _append(store, upload.id, 100, IMAGE[100:150], IMAGE[150:], checksum=_checksum(IMAGE[100:], "md5"))
+    assert finished.complete
+
+
+def test_assemble_uses_the_running_digest(store, monkeypatch):
+    upload = store.create(len(IMAGE), "r.png", sha256=hashlib.sha256(IMAGE).hexdigest())
+    _append(store, upload.id, 0, IMAGE[:300], IMAGE[300:])
+    monkeypatch.setattr(hashlib, "sha256", None)
+
+    assembled = asyncio.run(store.assemble(upload.id))
+    assert bytes(assembled.data) == IMAGE
+    assert assembled.mime_type == "image/png"
+
+
+def test_assemble_hashes_chunks_written_by_another_process(tmp_path):
+    writer = _store(tmp_path / "spool")
+    upload = writer.create(len(IMAGE), "r.png")
+    _append(writer, upload.id, 0, IMAGE)
+
+    assembled = asyncio.run(_store(tmp_path / "spool").assemble(upload.id))
+    assert assembled.sha256 == hashlib.sha256(IMAGE).hexdigest()
+
+
+def test_assemble_discards_an_upload_not_matching_its_sha256(store, monkeypatch):
+    upload = store.create(len(IMAGE), "r.png", sha256="0" * 64)
+    _append(store, upload.id, 0, IMAGE)
+    monkeypatch.setattr(store, "_read", None)
+
+    with pytest.raises(ChecksumMismatchError):
+        asyncio.run(store.assemble(upload.id))
+    with pytest.raises(UploadNotFoundError):
+        store.status(upload.id)
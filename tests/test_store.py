@@ -0,0 +1,145 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from backend.app.services import store as store_module
+from backend.app.services.store import ReceiptRecord, ReceiptStore, ReceiptWriter, persist_receipt, receipt_id_for
+
+HASH = "a" * 64
+
+
+def _receipt(total, merchant="Cafe", date="2024-03-01", content_hash=HASH):
+    return ReceiptRecord(content_hash=content_hash, filename="r.png",
+                         data={"merchant": merchant, "date": date, "total": total, "tax": 1.0,
+                               "items": [{"name": "Coffee", "price": total}]})
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ReceiptStore(str(tmp_path / "receipts.db"))
+    yield store
+    store.close()
+
+
+def _count(store, table):
+    with store._lock:
+        return store._conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+def test_saving_the_same_image_again_replaces_the_receipt(store):
+    first = _receipt(10.0)
+    store.save_many([first])
+    second = _receipt(12.0)
+    second.data["items"] = []
+    store.save_many([second])
+
+    assert first.id == second.id == receipt_id_for(HASH)
+    assert _count(store, "receipts") == 1
+    assert _count(store, "receipt_items") == 0
+    stored = store.get(first.id)
+    assert stored["data"]["total"] == 12.0
+    assert stored["created_at"] == first.created_at
+
+
+def test_partial_results_are_not_persisted(monkeypatch, store):
+    writer = ReceiptWriter(store, batch_size=10, flush_interval=60)
+    monkeypatch.setattr(store_module, "_writer", writer)
+
+    assert persist_receipt(HASH, "r.png", {"markdown": "text", "partial": True}) is None
+    assert persist_receipt(HASH, "r.png", {"total": 5.0}) == receipt_id_for(HASH)
+    assert list(writer.pending) == [receipt_id_for(HASH)]
+
+
+def test_a_newer_result_queued_during_a_flush_is_kept(store):
+    writer = ReceiptWriter(store, batch_size=10, flush_interval=60)
+    writer.add(_receipt(10.0))
+    save_many = store.save_many
+
+    def save_while_requeued(batch):
+        writer.add(_receipt(11.0))
+        save_many(batch)
+
+    store.save_many = save_while_requeued
+    asyncio.run(writer.flush())
+    assert writer.pending[receipt_id_for(HASH)].data["total"] == 11.0
+
+
+def test_legacy_duplicates_are_dropped_before_the_unique_index(tmp_path):
+    path = str(tmp_path / "legacy.db")
+    conn = sqlite3.connect(path)
+    conn.executescript(
+        "CREATE TABLE receipts (id TEXT PRIMARY KEY, content_hash TEXT NOT NULL, filename TEXT, merchant TEXT, "
+        "date TEXT, total REAL, subtotal REAL, tax REAL, data TEXT NOT NULL, created_at REAL NOT NULL);"
+        "CREATE INDEX idx_receipts_content_hash ON receipts (content_hash);"
+    )
+    conn.executemany(
+        "INSERT INTO receipts (id, content_hash, merchant, date, total, data, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [("old", HASH, "Cafe", "2024-03-01", 10.0, "{}", 1.0),
+         ("new", HASH, "Cafe", "2024-03-01", 12.0, "{}", 2.0),
+         ("other", "b" * 64, "Cafe", "2024-03-01", 5.0, "{}", 1.5)],
+    )
+    conn.commit()
+    conn.close()
+
+    store = ReceiptStore(path)
+    try:
+        page, _ = store.list(limit=10)
+        assert [row["id"] for row in page] == ["new", "other"]
+        assert store.spend_summary()["total"] == 17.0
+        with pytest.raises(sqlite3.IntegrityError):
+            with store._conn:
+                store._conn.execute("INSERT INTO receipts (id, content_hash, data, created_at) "
+                                    "VALUES ('dup', ?, '{}', 3.0)", (HASH,))
+
+        # The legacy row takes the derived id when its image is stored again
+        store.save_many([_receipt(12.0)])
+        assert store.get("new") is None
+        assert store.get(receipt_id_for(HASH))["data"]["total"] == 12.0
+    finally:
+        store.close()
+
+
+def test_resaving_a_receipt_does_not_count_it_twice(store):
+    store.save_many([_receipt(10.0)])
+    store.save_many([_receipt(10.0)])
+    assert store.spend_summary() == {"receipt_count": 1, "total": 10.0, "tax": 1.0, "tax_share": 0.1}
+
+
+def test_replacing_a_receipt_moves_it_between_buckets(store):
+    store.save_many([_receipt(10.0), _receipt(4.0, merchant="Bakery", content_hash="b" * 64)])
+    store.save_many([_receipt(20.0, merchant="Diner", date="2024-04-02")])
+
+    assert [(row["period"], row["receipt_count"], row["total"]) for row in store.spend_by_period("month")] == [
+        ("2024-03", 1, 4.0), ("2024-04", 1, 20.0),
+    ]
+    assert [(row["merchant"], row["total"]) for row in store.spend_by_merchant()] == [("Diner", 20.0), ("Bakery", 4.0)]
+    with store._lock, store._conn:
+        days = store._conn.execute("SELECT day, receipt_count, total FROM spend_daily ORDER BY day").fetchall()
+    assert [tuple(row) for row in days] == [("2024-03-01", 1, 4.0), ("2024-04-02", 1, 20.0)]
+
+
+def test_non_text_merchant_and_date_are_stored_as_null(store):
+    record = ReceiptRecord(content_hash=HASH, filename="r.png",
+                           data={"merchant": {"name": "X"}, "date": ["2024-03-01"], "total": 3.0})
+    store.save_many([record])
+
+    page, _ = store.list(limit=10)
+    assert (page[0]["merchant"], page[0]["date"], page[0]["total"]) == (None, None, 3.0)
+    assert store.spend_by_merchant()[0]["merchant"] == "Unknown"
+
+
+def test_a_record_the_store_rejects_does_not_block_later_ones(store):
+    writer = ReceiptWriter(store, batch_size=10, flush_interval=60)
+    bad = ReceiptRecord(content_hash="b" * 64, filename="bad.png", data={"total": 1.0, "raw": object()})
+    writer.add(bad)
+    writer.add(_receipt(10.0))
+
+    asyncio.run(writer.flush())
+    assert store.get(receipt_id_for(HASH))["data"]["total"] == 10.0
+    assert list(writer.pending) == [bad.id]
+
+    for _ in range(2):
+        asyncio.run(writer.flush())
+    assert writer.pending == {}
+    assert store.get(bad.id) is None